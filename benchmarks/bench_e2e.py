@@ -0,0 +1,192 @@
+"""
+End-to-end throughput benchmark of the PullTwitterAPI subcommands, run against the offline mock server so that no
+credentials or network are needed:
+
+    python -m benchmarks.bench_e2e --save-format parquet --latency 0.02 --output results.json
+
+Every subcommand runs in its own process with its own output directory, so that its peak RSS is not inflated by the
+runs before it. Records/sec counts the tweets (users for the users subcommand) served by the mock server during the
+run, divided by the wall time of the subcommand call, which includes writing the outputs. Pacing of the rate limiter
+is turned off, rate limits still apply through the x-rate-limit-* headers of the server.
+"""
+import argparse
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import requests
+import yaml
+
+SUBCOMMANDS = ('timelines', 'users', 'search', 'lookup')
+# table whose records are counted for each subcommand
+RECORDS = {'timelines': 'tweets', 'users': 'users', 'search': 'tweets', 'lookup': 'tweets'}
+
+TEMPLATE_CONFIG = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'configs',
+                               'template_config.yaml')
+EXPANSIONS = ['author_id', 'referenced_tweets.id', 'attachments.media_keys']
+
+
+def write_inputs(work_dir: str, args) -> dict:
+    """
+    Write the config and the csv inputs of the subcommands
+
+    Returns: paths by input name
+    """
+
+    with open(TEMPLATE_CONFIG, 'r') as f:
+        config = yaml.safe_load(f)
+    config['local']['output_dir'] = work_dir
+    config['local']['save_format'] = args.save_format
+    config['twitter']['account']['bearer_token'] = 'benchmark'
+    config['twitter']['query_params']['expansions'] = EXPANSIONS
+
+    paths = {'config': f"{work_dir}/config.yaml", 'users': f"{work_dir}/users.csv", 'ids': f"{work_dir}/ids.csv"}
+    with open(paths['config'], 'w') as f:
+        yaml.dump(config, f)
+
+    pd.DataFrame({'author_id': range(1, args.users + 1)}).to_csv(paths['users'], index=False)
+    pd.DataFrame({'id': range(10 ** 9, 10 ** 9 + args.ids)}).to_csv(paths['ids'], index=False)
+    return paths
+
+
+def start_server(args) -> (subprocess.Popen, str):
+    command = [sys.executable, '-m', 'benchmarks.mock_server', '--port', '0',
+               '--latency', str(args.latency),
+               '--error-rate', str(args.error_rate),
+               '--tweets-per-user', str(args.tweets_per_user),
+               '--search-results', str(args.search_results)]
+    server = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    # Serving on <url>
+    url = server.stdout.readline().split()[-1]
+    return server, url
+
+
+def server_stats(url: str) -> dict:
+    return requests.get(f"{url}/_stats").json()
+
+
+def run_subcommand(subcommand: str, url: str, paths: dict, output_dir: str, args) -> dict:
+    """
+    Run a subcommand in a child process, returning its wall time and peak RSS
+    """
+
+    command = [sys.executable, '-m', 'benchmarks.bench_e2e', '--child', subcommand, '--url', url,
+               '--config', paths['config'], '--user-csv', paths['users'], '--id-csv', paths['ids'],
+               '--output-dir', output_dir, '--search-results', str(args.search_results),
+               '--parse-workers', str(args.parse_workers)]
+    if not args.pipelined:
+        command.append('--no-pipelined')
+
+    result = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
+    # the child prints its measurements as the last line
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def child(args) -> None:
+    """
+    Body of the child process: run one subcommand against the server and print its measurements
+    """
+
+    import resource
+
+    from pull_twitter_api import PullTwitterAPI
+    from pull_twitter_api.utils.config_schema import PullTwitterConfig
+    from benchmarks.mock_server import redirect
+
+    config = PullTwitterConfig.from_file(args.config)
+    config.local.output_dir = args.output_dir
+    api = PullTwitterAPI(config=config)
+    redirect(api.client, args.url)
+    for bucket in api.rate_limiter.buckets.values():
+        bucket.min_interval = 0.
+
+    pulls = {
+        'timelines': lambda: api.timelines(args.user_csv, auto_save=True, author_id_column='author_id',
+                                           pipelined=args.pipelined),
+        'users': lambda: api.users(args.id_csv, auto_save=True, author_id_column='id'),
+        'search': lambda: api.search('benchmark', auto_save=True, max_response=args.search_results,
+                                     tweets_per_query=500, pipelined=args.pipelined,
+                                     parse_workers=args.parse_workers),
+        'lookup': lambda: api.lookup(args.id_csv, auto_save=True, pipelined=args.pipelined,
+                                     parse_workers=args.parse_workers),
+    }
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        pulls[args.child]()
+    wall = time.perf_counter() - start
+
+    # ru_maxrss is in kilobytes on linux
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    print(json.dumps({'wall_seconds': wall, 'peak_rss_bytes': peak_rss}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the subcommands against the mock server")
+    parser.add_argument("--subcommands", nargs='+', choices=SUBCOMMANDS, default=list(SUBCOMMANDS))
+    parser.add_argument("--users", type=int, default=10, help="Timelines pulled by the timelines subcommand")
+    parser.add_argument("--tweets-per-user", type=int, default=1000)
+    parser.add_argument("--search-results", type=int, default=10000)
+    parser.add_argument("--ids", type=int, default=10000, help="Ids pulled by the users and lookup subcommands")
+    parser.add_argument("--save-format", type=str, choices=['csv', 'json', 'parquet', 'sqlite'], default='csv')
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to every response of the server")
+    parser.add_argument("--error-rate", type=float, default=0., help="Fraction of requests answered with a 503")
+    parser.add_argument("--parse-workers", type=int, default=0)
+    parser.add_argument("--no-pipelined", dest="pipelined", action="store_false")
+    parser.add_argument("--output", type=str, default=None, help="File to write the results to as json")
+
+    # arguments of the child processes
+    parser.add_argument("--child", type=str, choices=SUBCOMMANDS, help=argparse.SUPPRESS)
+    parser.add_argument("--url", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--config", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--user-csv", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--id-csv", type=str, help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", type=str, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return child(args)
+
+    results = {}
+    server, url = start_server(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix='bench_e2e_') as work_dir:
+            paths = write_inputs(work_dir, args)
+            for subcommand in args.subcommands:
+                output_dir = f"{work_dir}/{subcommand}"
+                os.makedirs(output_dir)
+
+                before = server_stats(url)
+                measured = run_subcommand(subcommand, url, paths, output_dir, args)
+                after = server_stats(url)
+
+                table = RECORDS[subcommand]
+                records = after['records'][table] - before['records'][table]
+                results[subcommand] = dict(
+                    measured,
+                    records=records,
+                    records_per_second=records / measured['wall_seconds'],
+                    requests=sum(after['requests'].values()) - sum(before['requests'].values()),
+                    server_errors=after['server_errors'] - before['server_errors'])
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f"{'subcommand':<10} {'records':>8} {'wall s':>8} {'records/s':>10} {'peak RSS MB':>12} {'requests':>9}")
+    for subcommand, result in results.items():
+        print(f"{subcommand:<10} {result['records']:>8} {result['wall_seconds']:>8.2f} "
+              f"{result['records_per_second']:>10.0f} {result['peak_rss_bytes'] / 2 ** 20:>12.1f} "
+              f"{result['requests']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'args': vars(args), 'results': results}, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+Import-time benchmark of the CLI and the package, to keep the startup of short runs from creeping back up:
+
+    python -m benchmarks.bench_import --save baseline.json
+    python -m benchmarks.bench_import --compare baseline.json --check
+
+Every case runs in a fresh interpreter --repeat times and the fastest wall time is kept, the startup of a bare
+interpreter being reported separately. The heavy dependencies each case loads are listed too. With --check, the exit
+status is 1 if a case loads a heavy dependency it is not allowed (e.g. pandas for --help). With --compare, cases slower
+than the baseline by more than the threshold are flagged and the exit status is 1.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_micro import compare, environment, THRESHOLD
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLI = os.path.join(ROOT, 'pull_twitter.py')
+
+HEAVY = ('pandas', 'numpy', 'pyarrow', 'tweepy', 'twitteralchemy', 'pydantic', 'yaml', 'requests', 'aiohttp')
+
+# heavy dependencies the api may load, and those a subcommand may load. pandas imports pyarrow itself when installed
+_API = ('numpy', 'pandas', 'pyarrow', 'pydantic', 'yaml', 'requests', 'tweepy')
+_PULL = _API + ('twitteralchemy',)
+_SUBCOMMAND = "from pull_twitter_api import PullTwitterAPI\nimport pull_twitter_api.utils.{}"
+
+# code run by each case, and the heavy dependencies it may load
+CASES = {
+    'cli_help': (f"import runpy, sys\nsys.argv = [{CLI!r}, '--help']\n"
+                 f"try:\n    runpy.run_path({CLI!r}, run_name='__main__')\nexcept SystemExit:\n    pass",
+                 ()),
+    'import_package': ("import pull_twitter_api", ()),
+    'import_api': ("from pull_twitter_api import PullTwitterAPI", _API),
+    'subcommand_users': (_SUBCOMMAND.format('pull_users'), _PULL),
+    'subcommand_timelines': (_SUBCOMMAND.format('pull_timelines'), _PULL),
+    'subcommand_search': (_SUBCOMMAND.format('pull_search'), _PULL),
+    'subcommand_lookup': (_SUBCOMMAND.format('pull_lookup'), _PULL),
+    'import_async': ("from pull_twitter_api import AsyncPullTwitterAPI", HEAVY),
+}
+
+# printed by every case once its code ran, to list the heavy dependencies it loaded
+_REPORT = (f"\nimport json as _json, sys as _sys\n"
+           f"_sys.__stdout__.write('\\n' + _json.dumps(sorted(m for m in {HEAVY!r} if m in _sys.modules)) + '\\n')")
+
+
+def run(code: str) -> (float, list):
+    """
+    Run code in a fresh interpreter
+
+    Returns: wall time in seconds, heavy dependencies loaded
+    """
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-c', code + _REPORT], cwd=ROOT, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark case failed:\n{result.stderr}")
+    # the report is the last line, after the output of the case (e.g. the --help text)
+    return wall, json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(code: str, repeat: int) -> dict:
+    runs = [run(code) for _ in range(repeat)]
+    timings = sorted(wall for wall, _ in runs)
+    return {'seconds': timings[0], 'median_seconds': timings[len(timings) // 2], 'loaded': runs[-1][1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time benchmark of the CLI and the package")
+    parser.add_argument("--cases", nargs='+', choices=list(CASES), default=None, help="Cases to run, all if not set")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case, the fastest is kept")
+    parser.add_argument("--check", action="store_true",
+                        help="Exit with status 1 if a case loads heavy dependencies it is not allowed")
+    parser.add_argument("--save", type=str, default=None, help="File to write the results to, as a baseline")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Slowdown from the baseline flagged as a regression, as a fraction")
+    args = parser.parse_args()
+
+    interpreter = measure('pass', args.repeat)['seconds']
+    print(f"{'interpreter':<22} {interpreter * 1000:>10.1f} ms")
+
+    results = {}
+    unexpected = {}
+    for name in args.cases or CASES:
+        code, allowed = CASES[name]
+        results[name] = measure(code, args.repeat)
+        extra = sorted(set(results[name]['loaded']) - set(allowed))
+        if extra:
+            unexpected[name] = extra
+        print(f"{name:<22} {results[name]['seconds'] * 1000:>10.1f} ms "
+              f"(+{(results[name]['seconds'] - interpreter) * 1000:.1f} ms) "
+              f"loads: {', '.join(results[name]['loaded']) or '-'}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'interpreter_seconds': interpreter, 'results': results}, f,
+                      indent=1)
+
+    failed = False
+    if args.check and unexpected:
+        print()
+        for name, extra in unexpected.items():
+            print(f"{name} loads {', '.join(extra)}, which it should not")
+        failed = True
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print()
+        failed = bool(compare(results, baseline, threshold=args.threshold)) or failed
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
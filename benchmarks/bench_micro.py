@@ -0,0 +1,207 @@
+"""
+Micro-benchmarks of the parse and write hot paths, run on fixed fixture pages so that results can be compared across
+commits and dependency upgrades (e.g. pandas or twitteralchemy):
+
+    python -m benchmarks.bench_micro --save baseline.json
+    python -m benchmarks.bench_micro --compare baseline.json --threshold 0.1
+
+Fixture pages are generated by the mock server's record generators unless a directory of recorded api response
+bodies (one json file per page) is passed with --fixtures. Each benchmark reports the fastest of --repeat timings,
+the calls per timing being picked so that one timing takes at least 0.2 seconds. With --compare, benchmarks slower
+than the baseline by more than the threshold are flagged and the exit status is 1.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import timeit
+from importlib import metadata
+
+import pandas as pd
+from tweepy.client import Response
+from tweepy.media import Media
+from tweepy.tweet import Tweet
+from tweepy.user import User
+
+from pull_twitter_api.utils import table_writer
+from pull_twitter_api.utils.page_parser import parse_tweet_page, parse_tweet_links
+from pull_twitter_api.utils.pull_twitter_response import PullTwitterResponse, SearchResponse
+from pull_twitter_api.utils.raw_parser import RawResponse
+from benchmarks.mock_server import make_tweet, make_includes
+
+EXPANSIONS = ['author_id', 'referenced_tweets.id', 'attachments.media_keys']
+# slower than the baseline by more than this fraction is a regression
+THRESHOLD = 0.1
+# packages whose versions are stored with the results
+PACKAGES = ('pandas', 'numpy', 'pyarrow', 'pydantic', 'tweepy', 'twitteralchemy', 'orjson')
+
+
+# Fixtures
+
+def synthetic_pages(num_pages: int, page_size: int) -> list:
+    """
+    Api response bodies of tweet pages with their expansions, the same on every run
+    """
+
+    pages = []
+    for page in range(num_pages):
+        tweets = [make_tweet(1400000000000000000 + page * page_size + i, i % 50) for i in range(page_size)]
+        pages.append({'data': tweets, 'includes': make_includes(tweets, EXPANSIONS), 'meta': {}})
+    return pages
+
+
+def recorded_pages(directory: str) -> list:
+    pages = []
+    for path in sorted(glob.glob(f"{directory}/*.json")):
+        with open(path, 'r', encoding='utf-8') as f:
+            pages.append(json.load(f))
+    if not pages:
+        raise ValueError(f"No json pages found in {directory}.")
+    return pages
+
+
+def tweepy_page(body: dict) -> Response:
+    """
+    The Response tweepy builds from a response body (see Client._make_request)
+    """
+
+    includes = dict(body.get('includes', {}))
+    for key, data_type in (('media', Media), ('tweets', Tweet), ('users', User)):
+        if key in includes:
+            includes[key] = [data_type(record) for record in includes[key]]
+    return Response([Tweet(tweet) for tweet in body['data']], includes, body.get('errors', []), body.get('meta', {}))
+
+
+def raw_page(body: dict) -> RawResponse:
+    return RawResponse(body['data'], body.get('includes', {}), body.get('errors', []), body.get('meta', {}))
+
+
+# Benchmarks
+
+def benchmarks(bodies: list, work_dir: str) -> dict:
+    """
+    Benchmarked functions by name, each processing every fixture page once
+    """
+
+    tweepy_pages = [tweepy_page(body) for body in bodies]
+    raw_pages = [raw_page(body) for body in bodies]
+    parsed = [parse_tweet_page(page, has_refs=True) for page in raw_pages]
+    df = pd.DataFrame([row for page in parsed for row in page['new_tweets']])
+
+    def update_tables():
+        response = SearchResponse(auto_save=False)
+        for page in parsed:
+            response.update_data(**page)
+
+    def save_df(save_format):
+        def save():
+            PullTwitterResponse._save_df(df, work_dir, 'tweets', save_format)
+            os.remove(table_writer.table_path(work_dir, 'tweets', save_format))
+        return save
+
+    funcs = {
+        'parse_twalc': lambda: [parse_tweet_page(page, has_refs=True, fast=False) for page in tweepy_pages],
+        'parse_fast': lambda: [parse_tweet_page(page, has_refs=True) for page in raw_pages],
+        'parse_tweet_links': lambda: [parse_tweet_links(page.data) for page in tweepy_pages],
+        'update_tables': update_tables,
+    }
+    for save_format in table_writer.WRITERS:
+        if save_format == 'parquet' and table_writer.pa is None:
+            print("Skipping save_df[parquet], pyarrow is not installed.")
+            continue
+        funcs[f"save_df[{save_format}]"] = save_df(save_format)
+    return funcs
+
+
+def measure(func, repeat: int) -> dict:
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    timings = [timing / number for timing in timer.repeat(repeat=repeat, number=number)]
+    return {'seconds': min(timings), 'median_seconds': sorted(timings)[len(timings) // 2], 'number': number}
+
+
+def environment() -> dict:
+    versions = {}
+    for package in PACKAGES:
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {'python': platform.python_version(), 'machine': platform.machine(), 'packages': versions}
+
+
+# Baselines
+
+def compare(results: dict, baseline: dict, threshold: float = THRESHOLD) -> list:
+    """
+    Print the change of every benchmark from the baseline
+
+    Returns: names of the benchmarks slower than the baseline by more than threshold
+    """
+
+    regressions = []
+    print(f"{'benchmark':<22} {'baseline ms':>12} {'current ms':>11} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline['results']:
+            print(f"{name:<22} {'-':>12} {result['seconds'] * 1000:>11.3f}")
+            continue
+
+        before = baseline['results'][name]['seconds']
+        change = result['seconds'] / before - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print(f"{name:<22} {before * 1000:>12.3f} {result['seconds'] * 1000:>11.3f} {change:>+8.1%}{flag}")
+
+    changed = {package: (version, baseline['environment']['packages'].get(package))
+               for package, version in environment()['packages'].items()
+               if version != baseline['environment']['packages'].get(package)}
+    for package, (version, before) in changed.items():
+        print(f"{package} changed from {before} to {version}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Micro-benchmarks of the parse and write hot paths")
+    parser.add_argument("--benchmarks", nargs='+', default=None, help="Names of the benchmarks to run, all if not set")
+    parser.add_argument("--pages", type=int, default=10, help="Number of synthetic fixture pages")
+    parser.add_argument("--page-size", type=int, default=100, help="Tweets per synthetic fixture page")
+    parser.add_argument("--fixtures", type=str, default=None,
+                        help="Directory of recorded response bodies (json) to use instead of synthetic pages")
+    parser.add_argument("--repeat", type=int, default=5, help="Timings per benchmark, the fastest is kept")
+    parser.add_argument("--save", type=str, default=None, help="File to write the results to, as a baseline")
+    parser.add_argument("--compare", type=str, default=None, help="Baseline file to compare the results with")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD,
+                        help="Slowdown from the baseline flagged as a regression, as a fraction")
+    args = parser.parse_args()
+
+    bodies = recorded_pages(args.fixtures) if args.fixtures else synthetic_pages(args.pages, args.page_size)
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='bench_micro_') as work_dir:
+        funcs = benchmarks(bodies, work_dir)
+        for name in args.benchmarks or funcs:
+            if name not in funcs:
+                raise ValueError(f"Unknown benchmark {name}. Available: {list(funcs)}")
+            results[name] = measure(funcs[name], args.repeat)
+            print(f"{name:<22} {results[name]['seconds'] * 1000:>10.3f} ms")
+
+    if args.save:
+        fixtures = args.fixtures or f"synthetic {args.pages}x{args.page_size}"
+        with open(args.save, 'w') as f:
+            json.dump({'environment': environment(), 'fixtures': fixtures, 'results': results}, f, indent=1)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        print()
+        if compare(results, baseline, threshold=args.threshold):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
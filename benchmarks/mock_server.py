@@ -0,0 +1,483 @@
+"""
+Offline stand-in for the twitter api v2 endpoints used by the package, serving synthetic pages so that pulls can be
+run and timed without credentials:
+
+    GET /2/users/:id/tweets              user timelines (get_users_tweets)
+    GET /2/tweets/search/all             full archive search (search_all_tweets)
+    GET /2/tweets/counts/all             full archive tweet counts (get_all_tweets_count)
+    GET /2/tweets                        tweets lookup (get_tweets)
+    GET /2/users, /2/users/by            users lookup by ids or usernames (get_users)
+    GET /2/users/by/username/:username   single user lookup (get_user)
+
+Records are generated from the request alone (user ids, tweet ids, query and pagination token), so the same request
+always returns the same page. Responses carry x-rate-limit-* headers, requests past the per window budget get a 429,
+and a fraction of requests can be answered with a 503 to exercise the retry paths. `GET /_stats` returns the number
+of requests and records served.
+
+    python -m benchmarks.mock_server --port 8000 --latency 0.05 --error-rate 0.01
+
+Clients are pointed at the server with `redirect`.
+"""
+import argparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from requests.adapters import HTTPAdapter
+
+from pull_twitter_api.utils.rate_limit import endpoint_family, WINDOW_SECONDS
+
+API_HOST = "https://api.twitter.com"
+
+# tweets in the timeline of every user
+TWEETS_PER_USER = 1000
+# tweets matching any search query
+SEARCH_RESULTS = 10000
+# requests allowed per endpoint family and window, high enough not to throttle benchmarks by default
+RATE_LIMIT = 1000000
+
+_EPOCH = datetime(2021, 1, 1, tzinfo=timezone.utc)
+_TWEET_ID_BASE = 1400000000000000000
+_SEARCH_ID_BASE = 1500000000000000000
+_REF_TYPES = ('quoted', 'replied_to', 'retweeted')
+# length of the buckets of the counts endpoint, and buckets per page of counts
+_GRANULARITIES = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+_COUNTS_PER_PAGE = 744
+
+
+# Records
+
+def _timestamp(offset: int) -> str:
+    return _format_timestamp(_EPOCH + timedelta(minutes=offset))
+
+
+def _parse_timestamp(timestamp: str) -> datetime:
+    parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _format_timestamp(moment: datetime) -> str:
+    return moment.isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+
+def _user_id(username: str) -> int:
+    match = re.fullmatch(r'user(\d+)', username.lower())
+    return int(match.group(1)) if match else zlib.crc32(username.lower().encode())
+
+
+def make_user(user_id: int) -> dict:
+    return {
+        'id': str(user_id),
+        'name': f"User {user_id}",
+        'username': f"user{user_id}",
+        'created_at': _timestamp(-(user_id % 500000)),
+        'description': f"Synthetic account {user_id}, posting about #benchmarks and https://t.co/{user_id:x}",
+        'location': 'Internet',
+        'protected': False,
+        'verified': user_id % 7 == 0,
+        'url': f"https://t.co/{user_id:x}",
+        'profile_image_url': f"https://pbs.twimg.com/profile_images/{user_id}/normal.jpg",
+        'public_metrics': {
+            'followers_count': user_id % 100000,
+            'following_count': user_id % 1000,
+            'tweet_count': user_id % 50000,
+            'listed_count': user_id % 100,
+        },
+    }
+
+
+def make_tweet(tweet_id: int, author_id: int) -> dict:
+    mentioned = (author_id * 31 + tweet_id) % 100000
+    text = (f"@user{mentioned} synthetic tweet {tweet_id} about #benchmarks, more at "
+            f"https://t.co/{tweet_id % 10 ** 8:x} and a little filler text so the length resembles a real tweet")
+    tweet = {
+        'id': str(tweet_id),
+        'text': text,
+        'author_id': str(author_id),
+        'conversation_id': str(tweet_id),
+        'created_at': _timestamp(tweet_id % 10 ** 6),
+        'lang': 'en',
+        'source': 'Twitter Web App',
+        'possibly_sensitive': False,
+        'reply_settings': 'everyone',
+        'public_metrics': {
+            'retweet_count': tweet_id % 97,
+            'reply_count': tweet_id % 13,
+            'like_count': tweet_id % 1009,
+            'quote_count': tweet_id % 7,
+        },
+        'entities': {
+            'mentions': [{'start': 0, 'end': len(f"@user{mentioned}"), 'username': f"user{mentioned}",
+                          'id': str(mentioned)}],
+            'hashtags': [{'start': text.index('#'), 'end': text.index('#') + 11, 'tag': 'benchmarks'}],
+            'urls': [{'start': text.index('https'), 'end': text.index(' and'),
+                      'url': text[text.index('https'):text.index(' and')],
+                      'expanded_url': f"https://example.com/{tweet_id}", 'display_url': f"example.com/{tweet_id}"}],
+        },
+    }
+
+    # every third tweet references another one, every fifth has a photo
+    if tweet_id % 3 == 0:
+        ref_type = _REF_TYPES[tweet_id // 3 % len(_REF_TYPES)]
+        tweet['referenced_tweets'] = [{'type': ref_type, 'id': str(tweet_id - 1)}]
+        if ref_type == 'replied_to':
+            tweet['in_reply_to_user_id'] = str(mentioned)
+    if tweet_id % 5 == 0:
+        tweet['attachments'] = {'media_keys': [f"3_{tweet_id}"]}
+    return tweet
+
+
+def make_media(media_key: str) -> dict:
+    return {'media_key': media_key, 'type': 'photo', 'url': f"https://pbs.twimg.com/media/{media_key}.jpg",
+            'width': 1200, 'height': 675}
+
+
+def _timeline_tweet(user_id: int, index: int) -> int:
+    # index 0 is the oldest tweet of the timeline
+    return _TWEET_ID_BASE + user_id * 10 ** 5 + index
+
+
+def _lookup_author(tweet_id: int) -> int:
+    return tweet_id % 100000
+
+
+def make_includes(tweets: list, expansions: list) -> dict:
+    """
+    The users, tweets and media expanded from a page of tweets
+    """
+
+    includes = {}
+    if 'author_id' in expansions:
+        author_ids = dict.fromkeys(int(tweet['author_id']) for tweet in tweets)
+        includes['users'] = [make_user(author_id) for author_id in author_ids]
+    if 'referenced_tweets.id' in expansions:
+        refs = dict.fromkeys(int(ref['id']) for tweet in tweets for ref in tweet.get('referenced_tweets', []))
+        includes['tweets'] = [make_tweet(ref, _lookup_author(ref)) for ref in refs]
+    if 'attachments.media_keys' in expansions:
+        keys = [key for tweet in tweets for key in tweet.get('attachments', {}).get('media_keys', [])]
+        includes['media'] = [make_media(key) for key in keys]
+    return {key: values for key, values in includes.items() if values}
+
+
+# Server
+
+class MockTwitterServer(ThreadingHTTPServer):
+    """
+    Threaded http server answering the api requests, see the module docstring
+    """
+    daemon_threads = True
+
+    def __init__(self,
+                 address=('127.0.0.1', 0),
+                 latency: float = 0.,
+                 error_rate: float = 0.,
+                 dead_rate: float = 0.,
+                 tweets_per_user: int = TWEETS_PER_USER,
+                 search_results: int = SEARCH_RESULTS,
+                 rate_limit: int = RATE_LIMIT,
+                 seed: int = 0):
+        super(MockTwitterServer, self).__init__(address, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        self.dead_rate = dead_rate
+        self.tweets_per_user = tweets_per_user
+        self.search_results = search_results
+        self.rate_limit = rate_limit
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._windows = {}
+        self.stats = {'requests': {}, 'records': {'tweets': 0, 'users': 0}, 'server_errors': 0, 'rate_limited': 0}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def fail_request(self) -> bool:
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+            if failed:
+                self.stats['server_errors'] += 1
+            return failed
+
+    def take_request(self, family: str):
+        """
+        Spend a request of the family's window, returning its rate limit headers and whether it is allowed
+        """
+
+        with self._lock:
+            self.stats['requests'][family] = self.stats['requests'].get(family, 0) + 1
+
+            now = time.time()
+            window = self._windows.get(family)
+            if window is None or now >= window['reset']:
+                window = self._windows[family] = {'remaining': self.rate_limit, 'reset': int(now + WINDOW_SECONDS)}
+
+            allowed = window['remaining'] > 0
+            if allowed:
+                window['remaining'] -= 1
+            else:
+                self.stats['rate_limited'] += 1
+
+            headers = {'x-rate-limit-limit': str(self.rate_limit),
+                       'x-rate-limit-remaining': str(window['remaining']),
+                       'x-rate-limit-reset': str(window['reset'])}
+            return headers, allowed
+
+    def count(self, table: str, records: list) -> None:
+        with self._lock:
+            self.stats['records'][table] += len(records or [])
+
+    def is_dead(self, record_id: int) -> bool:
+        return zlib.crc32(str(record_id).encode()) % 10000 < self.dead_rate * 10000
+
+    def start(self) -> 'MockTwitterServer':
+        """
+        Serve requests from a background thread
+        """
+
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        path = url.path.rstrip('/')
+
+        if path == '/_stats':
+            with self.server._lock:
+                stats = copy.deepcopy(self.server.stats)
+            return self._send(200, stats)
+
+        family = endpoint_family(path)
+        handler = getattr(self, f"_{family}", None) if family else None
+        if handler is None:
+            return self._send(404, _problem(404, 'Not Found', f"Unknown route {path}"))
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        headers, allowed = self.server.take_request(family)
+        if not allowed:
+            return self._send(429, _problem(429, 'Too Many Requests', 'Too Many Requests'), headers)
+        if self.server.fail_request():
+            return self._send(503, _problem(503, 'Service Unavailable', 'Injected server error'), headers)
+
+        try:
+            body = handler(path, params)
+        except (KeyError, ValueError) as e:
+            return self._send(400, _problem(400, 'Invalid Request', str(e)), headers)
+        self._send(200, body, headers)
+
+    # Endpoints
+
+    def _timeline(self, path: str, params: dict) -> dict:
+        user_id = int(path.split('/')[3])
+        max_results = int(params.get('max_results', 10))
+        # pages go from the newest tweet to the oldest, the token is the index of the next tweet
+        start = int(params['pagination_token']) if params.get('pagination_token') else self.server.tweets_per_user - 1
+        stop = max(start - max_results, -1)
+
+        since_id = int(params.get('since_id', 0))
+        tweet_ids = [_timeline_tweet(user_id, i) for i in range(start, stop, -1)]
+        tweet_ids = [tweet_id for tweet_id in tweet_ids if tweet_id > since_id]
+
+        next_token = str(stop) if stop >= 0 and len(tweet_ids) == start - stop else None
+        return self._tweet_page([make_tweet(tweet_id, user_id) for tweet_id in tweet_ids], params, next_token)
+
+    def _search(self, path: str, params: dict) -> dict:
+        query = params['query']
+        max_results = int(params.get('max_results', 10))
+        start = int(params['next_token']) if params.get('next_token') else 0
+        stop = min(start + max_results, self.server.search_results)
+
+        base = _SEARCH_ID_BASE + zlib.crc32(query.encode()) % 10 ** 5 * 10 ** 8
+        # results come newest first
+        tweets = [make_tweet(base + self.server.search_results - i, _lookup_author(i)) for i in range(start, stop)]
+        next_token = str(stop) if stop < self.server.search_results else None
+        return self._tweet_page(tweets, params, next_token)
+
+    def _counts(self, path: str, params: dict) -> dict:
+        # buckets are aligned on the granularity, the first and last ones are cut at start_time and end_time
+        step = _GRANULARITIES[params.get('granularity', 'hour')]
+        end = _parse_timestamp(params['end_time']) if params.get('end_time') else \
+            datetime.now(timezone.utc) - timedelta(seconds=30)
+        start = _parse_timestamp(params['start_time']) if params.get('start_time') else end - timedelta(days=30)
+        if start >= end:
+            raise ValueError("end_time must be after start_time")
+
+        bounds = [start]
+        aligned = _EPOCH + (start - _EPOCH) // step * step
+        while aligned + step < end:
+            aligned += step
+            bounds.append(aligned)
+        bounds.append(end)
+
+        # search_results tweets match in the whole window, spread unevenly but deterministically over the buckets
+        weights = [zlib.crc32(_format_timestamp(bucket_start).encode()) % 10 + 1 for bucket_start in bounds[:-1]]
+        total = sum(weights)
+        cumulative = [0]
+        for weight in weights:
+            cumulative.append(cumulative[-1] + weight)
+        counts = [self.server.search_results * cumulative[i + 1] // total - self.server.search_results * cumulative[i]
+                  // total for i in range(len(weights))]
+
+        first = int(params['next_token']) if params.get('next_token') else 0
+        last = min(first + _COUNTS_PER_PAGE, len(counts))
+        data = [{'start': _format_timestamp(bounds[i]), 'end': _format_timestamp(bounds[i + 1]),
+                 'tweet_count': counts[i]} for i in range(first, last)]
+
+        meta = {'total_tweet_count': sum(bucket['tweet_count'] for bucket in data)}
+        if last < len(counts):
+            meta['next_token'] = str(last)
+        return {'data': data, 'meta': meta}
+
+    def _lookup(self, path: str, params: dict) -> dict:
+        tweet_ids = [int(tweet_id) for tweet_id in params['ids'].split(',')]
+        live = [tweet_id for tweet_id in tweet_ids if not self.server.is_dead(tweet_id)]
+
+        body = self._tweet_page([make_tweet(tweet_id, _lookup_author(tweet_id)) for tweet_id in live], params)
+        dead = [tweet_id for tweet_id in tweet_ids if self.server.is_dead(tweet_id)]
+        if dead:
+            body['errors'] = [_not_found('tweet', 'ids', tweet_id) for tweet_id in dead]
+        body.pop('meta', None)
+        return body
+
+    def _users(self, path: str, params: dict) -> dict:
+        if 'usernames' in params:
+            parameter, idents = 'usernames', params['usernames'].split(',')
+            user_ids = [_user_id(username) for username in idents]
+        else:
+            parameter, idents = 'ids', params['ids'].split(',')
+            user_ids = [int(user_id) for user_id in idents]
+
+        users = [make_user(user_id) for user_id in user_ids if not self.server.is_dead(user_id)]
+        self.server.count('users', users)
+        body = {'data': users} if users else {}
+        dead = [ident for ident, user_id in zip(idents, user_ids) if self.server.is_dead(user_id)]
+        if dead:
+            body['errors'] = [_not_found('user', parameter, ident) for ident in dead]
+        return body
+
+    def _user(self, path: str, params: dict) -> dict:
+        user = make_user(_user_id(path.split('/')[-1]))
+        self.server.count('users', [user])
+        return {'data': user}
+
+    # Helpers
+
+    def _tweet_page(self, tweets: list, params: dict, next_token: str = None) -> dict:
+        self.server.count('tweets', tweets)
+        body = {}
+        if tweets:
+            body['data'] = tweets
+            includes = make_includes(tweets, params.get('expansions', '').split(','))
+            if includes:
+                body['includes'] = includes
+
+        meta = {'result_count': len(tweets)}
+        if tweets:
+            meta.update(newest_id=tweets[0]['id'], oldest_id=tweets[-1]['id'])
+        if next_token is not None:
+            meta['next_token'] = next_token
+        body['meta'] = meta
+        return body
+
+    def _send(self, status: int, body: dict, headers: dict = None) -> None:
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('content-type', 'application/json; charset=utf-8')
+        self.send_header('content-length', str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def _problem(status: int, title: str, detail: str) -> dict:
+    return {'title': title, 'detail': detail, 'type': 'about:blank', 'status': status}
+
+
+def _not_found(resource_type: str, parameter: str, value) -> dict:
+    return {'value': str(value), 'detail': f"Could not find {resource_type} with {parameter}: [{value}].",
+            'title': 'Not Found Error', 'resource_type': resource_type, 'parameter': parameter,
+            'resource_id': str(value), 'type': 'https://api.twitter.com/2/problems/resource-not-found'}
+
+
+# Clients
+
+class _RedirectAdapter(HTTPAdapter):
+    """
+    Transport adapter sending the requests made to the api host to another base url
+    """
+
+    def __init__(self, base_url: str):
+        super(_RedirectAdapter, self).__init__()
+        self.base_url = base_url.rstrip('/')
+
+    def send(self, request, **kwargs):
+        request.url = self.base_url + request.url[len(API_HOST):]
+        return super(_RedirectAdapter, self).send(request, **kwargs)
+
+
+def redirect(client, base_url: str) -> None:
+    """
+    Point a tweepy Client (or the package's AsyncClient) at the mock server
+    """
+
+    if hasattr(client, 'host'):
+        client.host = base_url.rstrip('/')
+    else:
+        client.session.mount(API_HOST, _RedirectAdapter(base_url))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline mock of the twitter api v2 endpoints used by pull_twitter")
+    parser.add_argument("--host", type=str, default='127.0.0.1')
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on, any free port if 0")
+    parser.add_argument("--latency", type=float, default=0., help="Seconds added to every response")
+    parser.add_argument("--error-rate", type=float, default=0., help="Fraction of requests answered with a 503")
+    parser.add_argument("--dead-rate", type=float, default=0.,
+                        help="Fraction of looked up tweet and user ids reported as not found")
+    parser.add_argument("--tweets-per-user", type=int, default=TWEETS_PER_USER)
+    parser.add_argument("--search-results", type=int, default=SEARCH_RESULTS)
+    parser.add_argument("--rate-limit", type=int, default=RATE_LIMIT,
+                        help="Requests allowed per endpoint and 15 minute window")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the injected errors")
+    args = parser.parse_args()
+
+    server = MockTwitterServer((args.host, args.port),
+                               latency=args.latency,
+                               error_rate=args.error_rate,
+                               dead_rate=args.dead_rate,
+                               tweets_per_user=args.tweets_per_user,
+                               search_results=args.search_results,
+                               rate_limit=args.rate_limit,
+                               seed=args.seed)
+    # the first line tells callers which port was picked
+    print(f"Serving on {server.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,9 @@
 import argparse
-import json
-
-import yaml
 import pprint
-import os
-import sys
-from shutil import copyfile
-from datetime import datetime
-from tweepy.client import Client
 
-from pull_twitter_api import PullTwitterAPI
+# pandas, tweepy, twitteralchemy and pydantic are only imported once the arguments are parsed, so that --help and
+# invalid arguments return immediately
+from pull_twitter_api.utils.profiling import RunProfiler, PROFILE_MODES, PROFILE_TOP
 
 # Subcommand imports
 # from pull_twitter_api.utils.pull_timelines import pull_timelines
@@ -21,6 +15,22 @@ if __name__ == "__main__":
     # CLI and Argument Parsing
     parser = argparse.ArgumentParser(formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     parser.add_argument("-cf", "--config-file", help="YAML configuration file for application", required=True)
+    parser.add_argument("-sf", "--save-format", type=str, choices=['csv', 'json', 'parquet', 'sqlite'],
+        help="Format to save outputs in. Overrides save_format in the config file", required=False,
+        default=None)
+    parser.add_argument("-fp", "--fast-parse", action="store_true",
+        help="Flatten the raw response json directly instead of building tweepy and twitteralchemy objects")
+    parser.add_argument("-si", "--seen-ids", type=str, choices=['skip', 'mark'],
+        help="Skip, or mark with a seen_before column, tweets and users written to output_dir by earlier runs",
+        required=False, default=None)
+    parser.add_argument("-pf", "--prometheus-file", type=str,
+        help="File the run metrics are also written to in the Prometheus text format", required=False,
+        default=None)
+    parser.add_argument("-pr", "--profile", type=str, nargs="?", const="cpu", choices=PROFILE_MODES,
+        help="Profile the subcommand and write a cProfile stats file (cpu) or a tracemalloc report of the top "
+        "allocations (memory) to the output directory of the run", required=False, default=None)
+    parser.add_argument("-prt", "--profile-top", type=int,
+        help="Number of functions or lines listed in the profile reports", required=False, default=PROFILE_TOP)
     subparsers = parser.add_subparsers()
 
     # Timeline subcommand -----------------------------------------------------------------------
@@ -48,6 +58,23 @@ if __name__ == "__main__":
     parser_timeline.add_argument("-tpq", "--tweets-per-query", type=int, 
         help="Number of tweets present in each response from the Twitter API",
         default=100)
+    parser_timeline.add_argument("-w", "--workers", type=int, dest="max_workers",
+        help="Number of user timelines to pull concurrently", required = False,
+        default=1)
+    parser_timeline.add_argument("-inc", "--incremental", action="store_true",
+        help="Only pull tweets newer than those pulled for each user by earlier incremental runs")
+    parser_timeline.add_argument("-stf", "--state-file", type=str,
+        help="File storing the newest tweet id pulled for each user. Defaults to <output_dir>/timeline/since_ids.json",
+        required = False, default = None)
+    parser_timeline.add_argument("-uic", "--user-id-cache", type=str,
+        help="File caching the user ids of handles between runs. Defaults to <output_dir>/user_ids.json",
+        required = False, default = None)
+    parser_timeline.add_argument("-uit", "--user-id-ttl", type=float,
+        help="Seconds a cached user id is used for before the handle is resolved again", required = False,
+        default = 7 * 24 * 60 * 60)
+    parser_timeline.add_argument("-r", "--resume", type=str,
+        help="Output directory of an interrupted run to continue into, from the cursors in its checkpoint.json",
+        required = False, default = None)
     parser_timeline.set_defaults(name="timeline")
 
 
@@ -73,6 +100,12 @@ if __name__ == "__main__":
     parser_users.add_argument("-tpq", "--tweets-per-query", type=int,
         help="Number of tweets present in each resposne from the Twitter API", required = False,
         default = 100)
+    parser_users.add_argument("-dic", "--dead-id-cache", type=str,
+        help="File caching the ids reported as deleted, protected or suspended. Defaults to <output_dir>/dead_ids.json",
+        required = False, default = None)
+    parser_users.add_argument("-dit", "--dead-id-ttl", type=float,
+        help="Seconds a dead id is left out of the requests before it is requested again", required = False,
+        default = 30 * 24 * 60 * 60)
     parser_users.set_defaults(name="users")
 
 
@@ -94,6 +127,15 @@ if __name__ == "__main__":
     parser_search.add_argument("-tpq", "--tweets-per-query", type=int, 
         help="Number of tweets present in each response from the Twitter API", required = False,
         default = 500)
+    parser_search.add_argument("-ns", "--num-shards", type=int,
+        help="Number of time windows, holding similar numbers of tweets, to pull concurrently. Requires --start-time",
+        required = False, default = 1)
+    parser_search.add_argument("-r", "--resume", type=str,
+        help="Output directory of an interrupted run to continue into, from the cursors in its checkpoint.json",
+        required = False, default = None)
+    parser_search.add_argument("-pw", "--parse-workers", type=int,
+        help="Number of processes parsing pages. Pages are parsed in the pulling process if 0", required = False,
+        default = 0)
     parser_search.set_defaults(name="search")
 
     # Lookup subcommand -----------------------------------------------------------------------
@@ -111,6 +153,18 @@ if __name__ == "__main__":
     parser_lookup.add_argument("-tpq", "--tweets-per-query", type=int, 
         help="Number of tweets present in each response from the Twitter API", required = False,
         default = 500)
+    parser_lookup.add_argument("-pw", "--parse-workers", type=int,
+        help="Number of processes parsing pages. Pages are parsed in the pulling process if 0", required = False,
+        default = 0)
+    parser_lookup.add_argument("-om", "--only-missing", type=str,
+        help="Earlier output (run directory, data_tweets file, sqlite database or seen_ids directory). Only ids "
+        "missing from it are looked up", required = False, default = None)
+    parser_lookup.add_argument("-dic", "--dead-id-cache", type=str,
+        help="File caching the ids reported as deleted, protected or suspended. Defaults to <output_dir>/dead_ids.json",
+        required = False, default = None)
+    parser_lookup.add_argument("-dit", "--dead-id-ttl", type=float,
+        help="Seconds a dead id is left out of the requests before it is requested again", required = False,
+        default = 30 * 24 * 60 * 60)
     parser_lookup.set_defaults(name="lookup")
 
 
@@ -120,13 +174,17 @@ if __name__ == "__main__":
 
 
     # API Setup and Configuration
+    from pull_twitter_api import PullTwitterAPI
 
-    api = PullTwitterAPI(config_path = args['config_file'])
+    api = PullTwitterAPI(config_path = args['config_file'], save_format = args['save_format'],
+        fast_parse = args['fast_parse'], seen_ids = args['seen_ids'],
+        prometheus_file = args['prometheus_file'])
     print(f"Successfully validated configs in {args['config_file']}. Config: \n {pprint.pformat(api.config.dict())}")
 
     # Clean command keyword arguments
     sc_name = args['name']
-    ignore_args = ['config_file', 'name', 'output_dir']
+    ignore_args = ['config_file', 'name', 'output_dir', 'save_format', 'fast_parse', 'seen_ids', 'prometheus_file',
+        'profile', 'profile_top']
     command_kwargs = {key: value for key, value in args.items() if (not key in ignore_args) and (value)}
 
     func_dict = {
@@ -136,6 +194,18 @@ if __name__ == "__main__":
         'lookup': api.lookup,
     }
 
-    _ = func_dict[sc_name](auto_save = True, **command_kwargs)
+    profiler = RunProfiler(args['profile'], top = args['profile_top']) if args['profile'] else None
+    response = None
+    if profiler is not None:
+        profiler.start()
+    try:
+        response = func_dict[sc_name](auto_save = True, **command_kwargs)
+    finally:
+        # also written when the pull fails or is interrupted, next to the outputs of the run if it saved any
+        if profiler is not None:
+            profiler.stop()
+            profile_dir = getattr(response, 'output_dir', None) or api.output_dir
+            profile_path = profiler.save(profile_dir, sc_name, command_kwargs)
+            print(f"Saved the {args['profile']} profile of the run to {profile_path}")
 
     print("\n")
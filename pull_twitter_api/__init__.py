@@ -1,3 +1,32 @@
-from .utils import PullTwitterConfig
-from .utils import PullTwitterResponse, TimelineResponse, SearchResponse, UserResponse, LookupResponse
-from .pull_twitter_api import PullTwitterAPI
\ No newline at end of file
+"""
+Names are imported on first use, so that e.g. the asyncio interface (and aiohttp) is only loaded by the scripts using
+it. See pull_twitter_api.utils for the same on the utils package.
+"""
+import importlib
+
+_EXPORTS = {
+    'PullTwitterConfig': '.utils',
+    'PullTwitterResponse': '.utils',
+    'TimelineResponse': '.utils',
+    'SearchResponse': '.utils',
+    'UserResponse': '.utils',
+    'LookupResponse': '.utils',
+    'PageBatch': '.utils',
+    'StreamResponse': '.utils',
+    'PullTwitterAPI': '.pull_twitter_api',
+    'AsyncPullTwitterAPI': '.async_pull_twitter_api',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,256 @@
+from .pull_twitter_api import PullTwitterAPI
+from .utils.async_client import AsyncClient
+from .utils.async_pull import async_pull_timelines, async_pull_users, async_pull_search, async_pull_lookup
+from .utils.pull_twitter_response import TimelineResponse, SearchResponse, UserResponse, LookupResponse
+
+
+
+class AsyncPullTwitterAPI(PullTwitterAPI):
+	'''
+	Asyncio interface class for tool usage within async scripts and notebooks. All subcommands share one pooled
+	http session, so several can be awaited together to keep requests in flight across endpoints.
+
+	Usage:
+		async with AsyncPullTwitterAPI(config_path = <config_filepath>) as api:
+			timelines, search = await asyncio.gather(api.timelines(...), api.search(...))
+	'''
+
+	def __init__(self,
+		config = None,
+		config_path: str = None,
+		save_format: str = None,
+		full_save: bool = True,
+		pool_size: int = 100,
+		fast_parse: bool = False,
+		memory_budget: int = None,
+		seen_ids: str = None,
+		prometheus_file: str = None):
+		"""
+		Constructor for AsyncPullTwitterAPI
+
+		Parameters:
+			-config: PullTwitterConfig
+				-Initialized configuration object for queries
+			-config_path: str
+				-Path to a yaml config file. Should not be set if config parameter is passed
+			-save_format: str
+				-Format to save query results in. One of ['csv', 'json', 'parquet', 'sqlite']. Defaults to the config's save_format
+			-pool_size: int
+				-Maximum number of simultaneous connections to the twitter api
+			-fast_parse: bool
+				-Flatten the raw response json directly instead of building tweepy and twitteralchemy objects
+			-memory_budget: int
+				-Approximate bytes of rows a response holds with auto_save=False before spilling them to temporary files
+			-seen_ids: str
+				-What to do with tweets and users written to output_dir by earlier runs: 'skip' them or 'mark' them with a
+				 seen_before column. All pulled rows are written if None
+			-prometheus_file: str
+				-File the metrics of every run are also written to in the Prometheus text format
+		"""
+
+		super(AsyncPullTwitterAPI, self).__init__(config = config, config_path = config_path,
+			save_format = save_format, full_save = full_save, fast_parse = fast_parse, memory_budget = memory_budget,
+			seen_ids = seen_ids, prometheus_file = prometheus_file)
+
+		self.async_client = AsyncClient(self.bearer_token, rate_limiter = self.rate_limiter, pool_size = pool_size,
+			fast_parse = fast_parse)
+
+	async def __aenter__(self):
+		return self
+
+	async def __aexit__(self, exc_type, exc_val, exc_tb):
+		await self.close()
+
+	async def close(self) -> None:
+		"""
+		Close the pooled http session
+		"""
+
+		await self.async_client.close()
+
+	# Subcommands
+
+	async def timelines(self, user_csv: str, auto_save = False, max_workers: int = 10, resume: str = None,
+		**kwargs) -> TimelineResponse:
+		"""
+		Pull timelines of users listed in the passed user_csv
+
+		Parameters:
+			-user_csv: str
+				-Filepath to the csv containing user handles
+			-auto_save: bool
+				-Whether to automatically save outputs during pull or manually save later
+			-max_workers: int
+				-Number of timelines to keep in flight at once
+			-resume: str
+				-Output directory of an interrupted run to continue, from the cursors in its checkpoint.json
+		"""
+
+		if not self.config:
+			raise ValueError("One of config or config_path must be set.")
+
+		c_kwargs = dict({'user_csv': user_csv, 'max_workers': max_workers}, **kwargs)
+		seen_ids = self.open_seen_ids()
+		timeline_response = TimelineResponse(
+			auto_save = auto_save,
+			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
+			output_dir = self.output_dir,
+			config = self.config,
+			command_dict = c_kwargs,
+			resume_dir = resume
+		)
+
+		timeline_response.metrics.attach(self.async_client, self.rate_limiter)
+
+		try:
+			return await async_pull_timelines(
+				self.async_client,
+				self.query_params,
+				user_csv,
+				api_response = timeline_response,
+				output_dir = self.output_dir,
+				max_workers = max_workers,
+				**kwargs)
+		finally:
+			timeline_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(timeline_response)
+
+	async def users(self, user_csv: str, auto_save = False, max_workers: int = 10, **kwargs) -> UserResponse:
+		"""
+		Pull user information for users listed in the passed user_csv
+
+		Parameters:
+			-user_csv: str
+				-Filepath to the csv containing user handles
+			-max_workers: int
+				-Number of user batches to keep in flight at once
+		"""
+
+		if not self.config:
+			raise ValueError("One of config or config_path must be set.")
+
+		c_kwargs = dict({'user_csv': user_csv, 'max_workers': max_workers}, **kwargs)
+		seen_ids = self.open_seen_ids()
+		user_response = UserResponse(
+			auto_save = auto_save,
+			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
+			output_dir = self.output_dir,
+			config = self.config,
+			command_dict = c_kwargs
+		)
+
+		user_response.metrics.attach(self.async_client, self.rate_limiter)
+
+		try:
+			return await async_pull_users(
+				self.async_client,
+				self.query_params,
+				user_csv,
+				api_response = user_response,
+				output_dir = self.output_dir,
+				max_workers = max_workers,
+				**kwargs)
+		finally:
+			user_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(user_response)
+
+	async def search(self, query: str, auto_save = False, resume: str = None, **kwargs) -> SearchResponse:
+		"""
+		Pull tweets satisyfing the given query
+
+		Parameters:
+			-query: str
+				-The search query to filter tweets
+			-resume: str
+				-Output directory of an interrupted run to continue, from the cursors in its checkpoint.json
+		"""
+
+		if not self.config:
+			raise ValueError("One of [config or config_path] must be set.")
+
+		c_kwargs = dict({'query': query}, **kwargs)
+		seen_ids = self.open_seen_ids()
+		search_response = SearchResponse(
+			auto_save = auto_save,
+			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
+			output_dir = self.output_dir,
+			config = self.config,
+			command_dict = c_kwargs,
+			resume_dir = resume
+		)
+
+		search_response.metrics.attach(self.async_client, self.rate_limiter)
+
+		try:
+			return await async_pull_search(
+				self.async_client,
+				self.query_params,
+				query,
+				api_response = search_response,
+				**kwargs)
+		finally:
+			search_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(search_response)
+
+	async def lookup(self, id_csv: str, auto_save = False, max_workers: int = 10, **kwargs) -> LookupResponse:
+		"""
+		Pull tweets for the ids listed in the passed id_csv
+
+		Parameters:
+			-id_csv: str
+				-A csv with a list of Ids to fetch tweets for
+			-max_workers: int
+				-Number of id batches to keep in flight at once
+		"""
+
+		if not self.config:
+			raise ValueError("One of [config or config_path] must be set.")
+
+		c_kwargs = dict({'id_csv': id_csv, 'max_workers': max_workers}, **kwargs)
+		seen_ids = self.open_seen_ids()
+		lookup_response = LookupResponse(
+			auto_save = auto_save,
+			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
+			output_dir = self.output_dir,
+			config = self.config,
+			command_dict = c_kwargs
+		)
+
+		lookup_response.metrics.attach(self.async_client, self.rate_limiter)
+
+		try:
+			return await async_pull_lookup(
+				self.async_client,
+				self.query_params,
+				id_csv,
+				api_response = lookup_response,
+				output_dir = self.output_dir,
+				max_workers = max_workers,
+				**kwargs)
+		finally:
+			lookup_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(lookup_response)
@@ -1,19 +1,20 @@
 import os
-import pprint
-import pandas as pd
-from datetime import datetime
+from typing import Iterator, TYPE_CHECKING
 import json
 import yaml
 
+import requests
 from tweepy.client import Client
 
 from .utils.config_schema import PullTwitterConfig
-from .utils.timeline import Timeline
-from .utils.pull_timelines import pull_timelines
-from .utils.pull_users import pull_users
-from .utils.pull_search import pull_search
-from .utils.pull_lookup import pull_lookup
-from .utils.pull_twitter_response import PullTwitterResponse, TimelineResponse, SearchResponse, UserResponse, LookupResponse
+from .utils.rate_limit import RateLimiter
+from .utils.table_writer import SQLITE_FILE
+from .utils.seen_ids import SeenIds, SEEN_IDS_DIR, SEEN_ID_MODES
+
+# the modules of each subcommand are imported by its method, so that a run only loads what its subcommand needs
+if TYPE_CHECKING:
+	from .utils.pull_twitter_response import PullTwitterResponse
+	from .utils.page_stream import PageBatch
 
 
 
@@ -25,8 +26,12 @@ class PullTwitterAPI():
 	def __init__(self, 
 		config: PullTwitterConfig = None,
 		config_path: str = None,
-		save_format: str = 'csv',
-		full_save: bool = True):
+		save_format: str = None,
+		full_save: bool = True,
+		fast_parse: bool = False,
+		memory_budget: int = None,
+		seen_ids: str = None,
+		prometheus_file: str = None):
 		"""
 		Constructor for PullTwitterAPI
 
@@ -36,7 +41,16 @@ class PullTwitterAPI():
 			-config_path: str
 				-Path to a yaml config file. Should not be set if config parameter is passed
 			-save_format: str
-				-Format to save query results in. One of ['csv', 'json']
+				-Format to save query results in. One of ['csv', 'json', 'parquet', 'sqlite']. Defaults to the config's save_format
+			-fast_parse: bool
+				-Flatten the raw response json directly instead of building tweepy and twitteralchemy objects
+			-memory_budget: int
+				-Approximate bytes of rows a response holds with auto_save=False before spilling them to temporary files
+			-seen_ids: str
+				-What to do with tweets and users written to output_dir by earlier runs: 'skip' them or 'mark' them with a
+				 seen_before column. All pulled rows are written if None
+			-prometheus_file: str
+				-File the metrics of every run are also written to in the Prometheus text format
 		"""
 
 		# Configuration initialization
@@ -53,8 +67,22 @@ class PullTwitterAPI():
 
 
 		# Client initialization
-		self.client = Client(self.bearer_token, wait_on_rate_limit = True)
-		self.save_format = save_format
+		# fast parsing decodes the raw responses itself, so the client skips building tweepy objects
+		client_kwargs = {'return_type': requests.Response} if fast_parse else {}
+		# rate limit errors are raised to the retry engine (see utils/retry.py), which waits as long as the headers ask
+		self.client = Client(self.bearer_token, wait_on_rate_limit = False, **client_kwargs)
+		self.fast_parse = fast_parse
+		self.rate_limiter = RateLimiter()
+		self.rate_limiter.attach(self.client)
+		self.save_format = save_format or self.config.local.save_format
+		self.row_group_size = self.config.local.row_group_size
+		self.memory_budget = memory_budget
+		# sqlite outputs of every run go to one database, so that re-pulled rows are updated in place
+		self.sqlite_path = f"{self.output_dir}/{SQLITE_FILE}"
+		if seen_ids is not None and seen_ids not in SEEN_ID_MODES:
+			raise ValueError(f"seen_ids must be one of {SEEN_ID_MODES}. Received {seen_ids}")
+		self.seen_ids = seen_ids
+		self.prometheus_file = prometheus_file
 
 	# Configuration and directory setup
 	
@@ -108,9 +136,27 @@ class PullTwitterAPI():
 			pf.write(command)
 
 
+	def open_seen_ids(self) -> SeenIds:
+		"""
+		Load the index of the tweets and users written to output_dir by earlier runs, None if seen_ids is not set
+		"""
+
+		if self.seen_ids is None:
+			return None
+		return SeenIds(f"{self.output_dir}/{SEEN_IDS_DIR}", mode = self.seen_ids)
+
+	def save_metrics(self, response: 'PullTwitterResponse') -> None:
+		"""
+		Write the metrics of a finished run to metrics.json in its output directory, and to prometheus_file if set
+		"""
+
+		response.save_metrics()
+		if self.prometheus_file:
+			response.metrics.save_prometheus(self.prometheus_file)
+
 	# Subcommands
 
-	def timelines(self, user_csv: str, auto_save = False, **kwargs) -> None:
+	def timelines(self, user_csv: str, auto_save = False, max_workers: int = 1, resume: str = None, **kwargs) -> None:
 		"""
 		Pull timelines of users listed in the passed user_csv
 
@@ -119,28 +165,63 @@ class PullTwitterAPI():
 				-Filepath to the csv containing user handles
 			-auto_save: bool
 				-Whether to automatically save outputs during pull or manually save later
+			-max_workers: int
+				-Number of timelines to pull concurrently. All workers share the api's rate limit budget
+			-incremental: bool
+				-Only pull tweets newer than those pulled for each user by earlier incremental runs
+			-state_file: str
+				-File storing the newest tweet id of each user. Defaults to <output_dir>/timeline/since_ids.json
+			-resume: str
+				-Output directory of an interrupted run to continue, from the cursors in its checkpoint.json
+			-user_id_cache: str
+				-File caching the user ids of handles between runs. Defaults to <output_dir>/user_ids.json
+			-user_id_ttl: float
+				-Seconds a cached user id is used for before the handle is resolved again
+			-pipelined: bool
+				-Fetch the next page while the current one is parsed and written. Defaults to True
 		"""
 
+		from .utils.pull_timelines import pull_timelines
+		from .utils.pull_twitter_response import TimelineResponse
+
 		if not self.config:
 			raise ValueError("One of config or config_path must be set.")
 
-		c_kwargs = dict({'user_csv': user_csv}, **kwargs)
+		c_kwargs = dict({'user_csv': user_csv, 'max_workers': max_workers}, **kwargs)
+		seen_ids = self.open_seen_ids()
 		timeline_response = TimelineResponse(
 			auto_save = auto_save,
+			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
 			output_dir = self.output_dir,
 			config = self.config,
-			command_dict = c_kwargs
+			command_dict = c_kwargs,
+			resume_dir = resume
 		)
 
-		timeline_response = pull_timelines(
-			self.client, 
-			self.query_params, 
-			user_csv,
-			api_response = timeline_response,
-			output_dir = self.output_dir,
-			**kwargs)
-
-		return timeline_response
+		timeline_response.metrics.attach(self.client, self.rate_limiter)
+
+		try:
+			response = pull_timelines(
+				self.client, 
+				self.query_params, 
+				user_csv,
+				api_response = timeline_response,
+				output_dir = self.output_dir,
+				max_workers = max_workers,
+				rate_limiter = self.rate_limiter,
+				**kwargs)
+		finally:
+			# flush and close the table writers, also when the pull is interrupted
+			timeline_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(timeline_response)
+
+		return response
 
 	def users(self, user_csv: str, auto_save = False, **kwargs) -> None:
 		"""
@@ -149,63 +230,112 @@ class PullTwitterAPI():
 		Parameters:
 			-user_csv: str
 				-Filepath to the csv containing user handles
+			-dead_id_cache: str
+				-File caching the ids reported as deleted, protected or suspended. Defaults to <output_dir>/dead_ids.json
+			-dead_id_ttl: float
+				-Seconds a dead id is left out of the requests before it is requested again
 		"""
 
+		from .utils.pull_users import pull_users
+		from .utils.pull_twitter_response import UserResponse
+
 		if not self.config:
 			raise ValueError("One of config or config_path must be set.")
 
 		c_kwargs = dict({'user_csv': user_csv}, **kwargs)
+		seen_ids = self.open_seen_ids()
 		user_response = UserResponse(
 			auto_save = auto_save,
+			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
 			output_dir = self.output_dir,
 			config = self.config,
 			command_dict = c_kwargs
 		)
 
+		user_response.metrics.attach(self.client, self.rate_limiter)
 
-		user_response = pull_users(
-			self.client, 
-			self.query_params, 
-			user_csv,
-			api_response = user_response,
-			output_dir = self.output_dir,
-			**kwargs)
+		try:
+			response = pull_users(
+				self.client, 
+				self.query_params, 
+				user_csv,
+				api_response = user_response,
+				output_dir = self.output_dir,
+				rate_limiter = self.rate_limiter,
+				**kwargs)
+		finally:
+			# flush and close the table writers, also when the pull is interrupted
+			user_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(user_response)
 
 
-		return user_response
+		return response
 
-	def search(self, query: str, auto_save = False, **kwargs) -> None:
+	def search(self, query: str, auto_save = False, resume: str = None, **kwargs) -> None:
 		"""
 		Pull tweets satisyfing the given query
 
 		Parameters:
 			-query: str
 				-The search query to filter tweets
+			-resume: str
+				-Output directory of an interrupted run to continue, from the cursors in its checkpoint.json
+			-num_shards: int
+				-Number of time windows, holding similar numbers of tweets, to pull concurrently. Requires start_time
+			-pipelined: bool
+				-Fetch the next page while the current one is parsed and written. Defaults to True
+			-parse_workers: int
+				-Number of processes parsing pages, in page order. Pages are parsed in this process if 0
 		"""
 
+		from .utils.pull_search import pull_search
+		from .utils.pull_twitter_response import SearchResponse
+
 		if not self.config:
 			raise ValueError("One of [config or config_path] must be set.")
 
 		# Initialize api response to update
 		c_kwargs = dict({'query': query}, **kwargs)
+		seen_ids = self.open_seen_ids()
 		search_response = SearchResponse(
 			auto_save = auto_save,
 			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
 			output_dir = self.output_dir,
 			config = self.config,
-			command_dict = c_kwargs
+			command_dict = c_kwargs,
+			resume_dir = resume
 		)
 
-		# Query Twitter API for search results
-		search_response = pull_search(
-			self.client, 
-			self.query_params, 
-			query,
-			api_response = search_response,
-			output_dir = self.output_dir,
-			**kwargs)
+		search_response.metrics.attach(self.client, self.rate_limiter)
 
-		return search_response
+		# Query Twitter API for search results
+		try:
+			response = pull_search(
+				self.client, 
+				self.query_params, 
+				query,
+				api_response = search_response,
+				output_dir = self.output_dir,
+				rate_limiter = self.rate_limiter,
+				**kwargs)
+		finally:
+			# flush and close the table writers, also when the pull is interrupted
+			search_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(search_response)
+
+		return response
 
 	def lookup(self, id_csv: str, auto_save = False, **kwargs) -> None:
 		"""
@@ -214,28 +344,152 @@ class PullTwitterAPI():
 		Parameters:
 			-id_csv: str
 				-A csv with a list of Ids to fetch tweets for
+			-only_missing: str
+				-Earlier output (run directory, data_tweets file, sqlite database or seen_ids directory). Only ids
+				 missing from it are looked up
+			-dead_id_cache: str
+				-File caching the ids reported as deleted, protected or suspended. Defaults to <output_dir>/dead_ids.json
+			-dead_id_ttl: float
+				-Seconds a dead id is left out of the requests before it is requested again
+			-pipelined: bool
+				-Fetch the next page while the current one is parsed and written. Defaults to True
+			-parse_workers: int
+				-Number of processes parsing pages, in page order. Pages are parsed in this process if 0
 		"""
 
+		from .utils.pull_lookup import pull_lookup
+		from .utils.pull_twitter_response import LookupResponse
+
 		if not self.config:
 			raise ValueError("One of [config or config_path] must be set.")
 
 		# Initialize api response to update
 		c_kwargs = dict({'id_csv': id_csv}, **kwargs)
+		seen_ids = self.open_seen_ids()
 		search_response = LookupResponse(
 			auto_save = auto_save,
 			save_format = self.save_format,
+			row_group_size = self.row_group_size,
+			memory_budget = self.memory_budget,
+			sqlite_path = self.sqlite_path,
+			seen_ids = seen_ids,
 			output_dir = self.output_dir,
 			config = self.config,
 			command_dict = c_kwargs
 		)
 
+		search_response.metrics.attach(self.client, self.rate_limiter)
+
 		# Query Twitter API for search results
-		search_response = pull_lookup(
-			self.client, 
-			self.query_params, 
-			id_csv,
-			api_response = search_response,
+		try:
+			response = pull_lookup(
+				self.client, 
+				self.query_params, 
+				id_csv,
+				api_response = search_response,
+				output_dir = self.output_dir,
+				rate_limiter = self.rate_limiter,
+				**kwargs)
+		finally:
+			# flush and close the table writers, also when the pull is interrupted
+			search_response.close()
+			if seen_ids is not None:
+				seen_ids.save()
+			self.save_metrics(search_response)
+
+		return response
+
+	# Streaming
+
+	def iter_timelines(self, user_csv: str, max_workers: int = 1, **kwargs) -> Iterator['PageBatch']:
+		"""
+		Pull timelines like timelines(), yielding each page as a PageBatch instead of collecting the results.
+		Nothing is saved, and the pull stays at most a few pages ahead of the caller.
+
+		Parameters:
+			-user_csv: str
+				-Filepath to the csv containing user handles
+			-max_workers: int
+				-Number of timelines to pull concurrently. Pages of different users are then interleaved
+		"""
+
+		from .utils.pull_timelines import pull_timelines
+		from .utils.page_stream import iter_pages
+
+		return iter_pages(lambda response: pull_timelines(
+			self.client,
+			self.query_params,
+			user_csv,
+			api_response = response,
+			output_dir = self.output_dir,
+			auto_save = False,
+			max_workers = max_workers,
+			rate_limiter = self.rate_limiter,
+			**kwargs))
+
+	def iter_users(self, user_csv: str, **kwargs) -> Iterator['PageBatch']:
+		"""
+		Pull user information like users(), yielding each page as a PageBatch instead of collecting the results
+
+		Parameters:
+			-user_csv: str
+				-Filepath to the csv containing user handles
+		"""
+
+		from .utils.pull_users import pull_users
+		from .utils.page_stream import iter_pages
+
+		return iter_pages(lambda response: pull_users(
+			self.client,
+			self.query_params,
+			user_csv,
+			api_response = response,
 			output_dir = self.output_dir,
-			**kwargs)
+			auto_save = False,
+			rate_limiter = self.rate_limiter,
+			**kwargs))
 
-		return search_response
\ No newline at end of file
+	def iter_search(self, query: str, **kwargs) -> Iterator['PageBatch']:
+		"""
+		Pull tweets satisfying the query like search(), yielding each page as a PageBatch instead of collecting the
+		results
+
+		Parameters:
+			-query: str
+				-The search query to filter tweets
+		"""
+
+		from .utils.pull_search import pull_search
+		from .utils.page_stream import iter_pages
+
+		return iter_pages(lambda response: pull_search(
+			self.client,
+			self.query_params,
+			query,
+			api_response = response,
+			output_dir = self.output_dir,
+			auto_save = False,
+			rate_limiter = self.rate_limiter,
+			**kwargs))
+
+	def iter_lookup(self, id_csv: str, **kwargs) -> Iterator['PageBatch']:
+		"""
+		Pull tweets by id like lookup(), yielding each page as a PageBatch instead of collecting the results
+
+		Parameters:
+			-id_csv: str
+				-A csv with a list of Ids to fetch tweets for
+		"""
+
+		from .utils.pull_lookup import pull_lookup
+		from .utils.page_stream import iter_pages
+
+		return iter_pages(lambda response: pull_lookup(
+			self.client,
+			self.query_params,
+			id_csv,
+			api_response = response,
+			output_dir = self.output_dir,
+			auto_save = False,
+			rate_limiter = self.rate_limiter,
+			**kwargs))
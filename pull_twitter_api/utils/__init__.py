@@ -1,3 +1,33 @@
-from . import pull_timelines, pull_users, pull_search, pull_lookup
-from .pull_twitter_response import PullTwitterResponse, SearchResponse, TimelineResponse, UserResponse, LookupResponse
-from .config_schema import PullTwitterConfig
\ No newline at end of file
+"""
+Names are imported on first use, so that importing one module of the package does not load pandas, tweepy and
+twitteralchemy through all the others.
+"""
+import importlib
+
+_SUBMODULES = ('pull_timelines', 'pull_users', 'pull_search', 'pull_lookup')
+_EXPORTS = {
+    'PullTwitterResponse': 'pull_twitter_response',
+    'SearchResponse': 'pull_twitter_response',
+    'TimelineResponse': 'pull_twitter_response',
+    'UserResponse': 'pull_twitter_response',
+    'LookupResponse': 'pull_twitter_response',
+    'PageBatch': 'page_stream',
+    'StreamResponse': 'page_stream',
+    'PullTwitterConfig': 'config_schema',
+}
+
+__all__ = list(_SUBMODULES) + list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f".{name}", __name__)
+    if name in _EXPORTS:
+        value = getattr(importlib.import_module(f".{_EXPORTS[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,210 @@
+"""
+Asyncio client for the twitter api v2 endpoints used by the package. Requests share one pooled aiohttp session and
+responses are returned as the same tweepy Response tuples as tweepy.client.Client, so they go through the same page
+parsers and produce identical outputs.
+"""
+import asyncio
+import datetime
+import time
+
+from tweepy.client import Response
+from tweepy.media import Media
+from tweepy.place import Place
+from tweepy.poll import Poll
+from tweepy.tweet import Tweet
+from tweepy.user import User
+
+from . import exceptions
+from .rate_limit import RateLimiter
+from .raw_parser import RawResponse, decode_json
+from .retry import RetryableResponse, retry_request_async
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+API_HOST = "https://api.twitter.com"
+
+_TWEET_PARAMS = ("expansions", "media.fields", "place.fields", "poll.fields", "tweet.fields", "user.fields")
+
+
+class AsyncClient:
+    """
+    The AsyncClient manages a pooled aiohttp session to the twitter api. It must be closed (or used as an async context
+    manager) once all requests are done.
+    """
+
+    def __init__(self,
+                 bearer_token: str,
+                 rate_limiter: RateLimiter = None,
+                 pool_size: int = 100,
+                 max_retries: int = None,
+                 host: str = API_HOST,
+                 fast_parse: bool = False):
+
+        if aiohttp is None:
+            raise ImportError("The asyncio interface requires aiohttp. Install it with `pip install aiohttp`.")
+
+        self.bearer_token = bearer_token
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.pool_size = pool_size
+        # attempts per request, the retry policy of the rate limiter decides if None
+        self.max_retries = max_retries
+        self.host = host
+        # return RawResponse tuples of the decoded json instead of building tweepy objects
+        self.fast_parse = fast_parse
+        # RunMetrics recording the latency, size and status of every response, set by RunMetrics.attach
+        self.metrics = None
+
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    @property
+    def session(self):
+        # the session binds to the running event loop, so it is only created once a request is made
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                headers={"Authorization": f"Bearer {self.bearer_token}"})
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+    async def request(self, route: str, params: dict, endpoint: str) -> dict:
+        """
+        Make a GET request, waiting on the shared rate limiter and retrying server errors, rate limit errors and
+        connection errors with the retry engine of the sync pulls (see retry.py).
+
+        Args:
+            route: the api route, e.g. /2/tweets
+            params: the already formatted query parameters
+            endpoint: the rate limit endpoint family of the route
+
+        Returns: the decoded json body
+        """
+
+        async def attempt():
+            started = time.perf_counter()
+            async with self.session.get(self.host + route, params=params) as response:
+                # like the elapsed time of requests responses, the latency stops once the headers are parsed
+                latency = time.perf_counter() - started
+                body = await response.read()
+                if self.metrics is not None:
+                    self.metrics.record_request(endpoint, latency, len(body), response.status)
+                self.rate_limiter.update(str(response.url), response.headers)
+
+                if response.status == 429 or response.status >= 500:
+                    raise RetryableResponse(f"{response.status} {response.reason} from {route}", response.status,
+                                            response.headers)
+                if not 200 <= response.status < 300:
+                    raise exceptions.TwitterRequestError(f"{response.status} {response.reason}: {await response.text()}")
+
+                return decode_json(body)
+
+        return await retry_request_async(attempt, endpoint, self.rate_limiter, max_retries=self.max_retries,
+                                         retryable=(aiohttp.ClientConnectionError, asyncio.TimeoutError))
+
+    async def _make_request(self, route: str, params: dict, endpoint_parameters: tuple, endpoint: str,
+                            data_type=None) -> Response:
+        # parameter formatting and response processing mirror tweepy.client.Client._make_request
+        request_params = {}
+        for param_name, param_value in params.items():
+            if param_value is None:
+                continue
+            if param_name in endpoint_parameters:
+                if isinstance(param_value, list):
+                    request_params[param_name] = ','.join(map(str, param_value))
+                elif param_name in ("start_time", "end_time") and isinstance(param_value, datetime.datetime):
+                    if param_value.tzinfo is not None:
+                        param_value = param_value.astimezone(datetime.timezone.utc)
+                    request_params[param_name] = param_value.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+                else:
+                    request_params[param_name] = str(param_value)
+            elif param_name.replace('_', '.') in endpoint_parameters:
+                request_params[param_name.replace('_', '.')] = ','.join(param_value)
+
+        response = await self.request(route, request_params, endpoint)
+
+        if self.fast_parse:
+            return RawResponse(response.get("data"), response.get("includes", {}), response.get("errors", []),
+                               response.get("meta", {}))
+
+        data = response.get("data")
+        if data_type is not None:
+            if isinstance(data, list):
+                data = [data_type(result) for result in data]
+            elif data is not None:
+                data = data_type(data)
+
+        includes = response.get("includes", {})
+        if "media" in includes:
+            includes["media"] = [Media(media) for media in includes["media"]]
+        if "places" in includes:
+            includes["places"] = [Place(place) for place in includes["places"]]
+        if "poll" in includes:
+            includes["polls"] = [Poll(poll) for poll in includes["polls"]]
+        if "tweets" in includes:
+            includes["tweets"] = [Tweet(tweet) for tweet in includes["tweets"]]
+        if "users" in includes:
+            includes["users"] = [User(user) for user in includes["users"]]
+
+        errors = response.get("errors", [])
+        meta = response.get("meta", {})
+
+        return Response(data, includes, errors, meta)
+
+    # Endpoints
+
+    async def get_users_tweets(self, id, **params) -> Response:
+        return await self._make_request(
+            f"/2/users/{id}/tweets", params,
+            endpoint_parameters=("end_time", "exclude", "max_results", "pagination_token", "since_id",
+                                 "start_time", "until_id") + _TWEET_PARAMS,
+            endpoint='timeline', data_type=Tweet)
+
+    async def search_all_tweets(self, query: str, **params) -> Response:
+        params["query"] = query
+        return await self._make_request(
+            "/2/tweets/search/all", params,
+            endpoint_parameters=("end_time", "max_results", "next_token", "query", "since_id", "start_time",
+                                 "until_id") + _TWEET_PARAMS,
+            endpoint='search', data_type=Tweet)
+
+    async def get_tweets(self, ids, **params) -> Response:
+        params["ids"] = ids
+        return await self._make_request(
+            "/2/tweets", params,
+            endpoint_parameters=("ids",) + _TWEET_PARAMS,
+            endpoint='lookup', data_type=Tweet)
+
+    async def get_user(self, *, username: str, **params) -> Response:
+        return await self._make_request(
+            f"/2/users/by/username/{username}", params,
+            endpoint_parameters=("expansions", "tweet.fields", "user.fields"),
+            endpoint='user', data_type=User)
+
+    async def get_users(self, *, ids=None, usernames=None, **params) -> Response:
+        if ids is not None and usernames is not None:
+            raise TypeError("Expected IDs or usernames, not both")
+
+        route = "/2/users"
+        if ids is not None:
+            params["ids"] = ids
+        elif usernames is not None:
+            params["usernames"] = usernames
+            route += "/by"
+        else:
+            raise TypeError("IDs or usernames are required")
+
+        return await self._make_request(
+            route, params,
+            endpoint_parameters=("ids", "usernames", "expansions", "tweet.fields", "user.fields"),
+            endpoint='users', data_type=User)
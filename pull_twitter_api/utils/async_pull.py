@@ -0,0 +1,340 @@
+"""
+Asyncio versions of the pull_* subcommands. Requests for independent users and id batches are kept in flight together
+on the AsyncClient, while pages are parsed with the shared page parsers and saved through the same response objects
+(in request order) so outputs match the synchronous subcommands.
+"""
+import asyncio
+from datetime import datetime
+
+import pandas as pd
+
+from . import exceptions
+from .async_client import AsyncClient
+from .dead_ids import DeadIdCache, dead_id_cache_path, DEAD_ID_TTL
+from .page_parser import parse_tweet_page, parse_user_page
+from .pull_timelines import timeline_state_path, user_id_cache_path
+from .pull_twitter_response import TimelineResponse, UserResponse, SearchResponse, LookupResponse
+from .state_file import StateFile
+from .tweet_search import TweetSearch
+from .twitter_schema import LookupQueryParams
+from .user_ids import UserIdCache, resolve_handles_async, USER_ID_TTL
+
+
+def _request_params(query_params: LookupQueryParams) -> dict:
+    params: dict = query_params.dict(exclude_unset=True)
+    # reformat all params as list type for tweepy
+    for key, val in params.items():
+        if not isinstance(val, list):
+            val = [val]
+        params[key] = val
+    return params
+
+
+def _read_idents(user_csv, handle_column, author_id_column, skip_column, use_skip):
+    df_handles = pd.read_csv(user_csv)
+    if use_skip:
+        df_handles = df_handles.loc[df_handles[skip_column] != 1]
+
+    if handle_column and not author_id_column:
+        return list(df_handles[handle_column]), 'handle'
+    elif author_id_column and not handle_column:
+        return list(df_handles[author_id_column]), 'author_id'
+    raise ValueError("`handle_column` and `author_id_column` are mutually exclusive arguments.")
+
+
+async def _gather_in_order(coros, max_concurrency: int):
+    """
+    Run the coroutines with at most max_concurrency in flight, yielding their results (or the exceptions they raised)
+    in submission order. A coroutine starts as soon as any earlier one finishes, so a slow request only holds up its
+    own slot. The coroutines not finished yet are cancelled when the generator is closed.
+    """
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(coro):
+        try:
+            async with semaphore:
+                return await coro
+        finally:
+            # coroutines cancelled before they started are closed without running
+            coro.close()
+
+    tasks = [asyncio.ensure_future(run(coro)) for coro in coros]
+    try:
+        for task in tasks:
+            try:
+                yield await task
+            except Exception as e:
+                yield e
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def async_pull_timelines(client: AsyncClient,
+                               query_params: LookupQueryParams,
+                               user_csv: str,
+                               api_response: TimelineResponse,
+                               full_save: bool = True,
+                               handle_column: str = None,
+                               author_id_column: str = None,
+                               skip_column: str = "skip",
+                               use_skip: bool = False,
+                               output_user: bool = False,
+                               tweets_per_query: int = 100,
+                               max_workers: int = 10,
+                               output_dir: str = None,
+                               incremental: bool = False,
+                               state_file: str = None,
+                               user_id_cache: str = None,
+                               user_id_ttl: float = USER_ID_TTL,
+                               **kwargs):
+    tl_query_params = query_params.copy().reformat('tweet')
+    has_refs: bool = 'referenced_tweets' in tl_query_params.tweet_fields
+    search_ident, search_type = _read_idents(user_csv, handle_column, author_id_column, skip_column, use_skip)
+
+    since_ids = None
+    if incremental:
+        since_ids = StateFile(timeline_state_path(output_dir, state_file))
+
+    user_ids = {}
+    if search_type == 'handle':
+        cache = UserIdCache(user_id_cache_path(output_dir, user_id_cache), ttl=user_id_ttl)
+        user_ids = await resolve_handles_async(client, search_ident, cache=cache)
+
+    async def pull_ident(ident):
+        cursor = api_response.get_cursor(ident) or {}
+        if cursor.get('done'):
+            print(f"Timeline for {search_type} {ident} was already pulled. Skipping.")
+            return
+
+        print(f"Pulling timeline for {search_type} {ident}.")
+        if search_type == 'handle':
+            user_id = user_ids.get(ident) or int((await client.get_user(username=ident)).data['id'])
+        else:
+            user_id = ident
+
+        params = _request_params(tl_query_params)
+        params['max_results'] = tweets_per_query
+        if since_ids is not None and ident in since_ids:
+            params['since_id'] = since_ids.get(ident)
+
+        next_token = cursor.get('next_token')
+        num_pages = cursor.get('pages') or 0
+        num_collected = 0
+        while True:
+            params['pagination_token'] = next_token
+            response = await client.get_users_tweets(user_id, **params)
+
+            next_token = response.meta.get('next_token', None)
+            num_pages += 1
+            api_response.set_cursor(ident, next_token, pages=num_pages, done=next_token is None)
+
+            # parse the page and update response object
+            with api_response.metrics.timed('parse'):
+                page = parse_tweet_page(api_response.drop_seen(response), has_refs, full_save=full_save)
+            if page:
+                with api_response.metrics.timed('write'):
+                    api_response.update_data(ident, **page)
+                num_collected += len(page['new_tweets'])
+
+            # pagination
+            if next_token is None:
+                print(f"Collected {num_collected} tweets for {search_type} {ident}")
+                api_response.finish_user(ident)
+                if since_ids is not None and ident in api_response.newest_ids:
+                    since_ids.set(ident, str(api_response.newest_ids[ident]))
+                    since_ids.save()
+                return
+
+    # a user whose pages keep failing is skipped, the users left are cancelled once the endpoint's circuit opens
+    results = _gather_in_order([pull_ident(ident) for ident in search_ident], max_workers)
+    idents = iter(search_ident)
+    try:
+        async for result in results:
+            ident = next(idents)
+            if isinstance(result, exceptions.CircuitOpen):
+                print(f"The tweets api keeps failing. Stopping, the users left can be pulled by a later run. "
+                      f"Exception message: {result}")
+                break
+            if isinstance(result, Exception):
+                print(f"Failed to pull timeline for {search_type} {ident}. Error: ", result)
+    finally:
+        await results.aclose()
+
+    return api_response
+
+
+async def async_pull_users(client: AsyncClient,
+                           query_params: LookupQueryParams,
+                           user_csv: str,
+                           api_response: UserResponse,
+                           full_save: bool = True,
+                           handle_column: str = None,
+                           author_id_column: str = None,
+                           skip_column: str = "skip",
+                           use_skip: bool = False,
+                           tweets_per_query: int = 100,
+                           max_workers: int = 10,
+                           output_dir: str = None,
+                           dead_id_cache: str = None,
+                           dead_id_ttl: float = DEAD_ID_TTL,
+                           **kwargs):
+    user_query_params = query_params.copy().reformat('user')
+    search_ident, ident_type = _read_idents(user_csv, handle_column, author_id_column, skip_column, use_skip)
+    ident_key = 'usernames' if ident_type == 'handle' else 'ids'
+
+    dead_kind = 'usernames' if ident_type == 'handle' else 'user_ids'
+    dead_ids = DeadIdCache(dead_id_cache_path(output_dir, dead_id_cache), ttl=dead_id_ttl)
+    search_ident = dead_ids.live(dead_kind, search_ident)
+
+    batches = [search_ident[i:i + tweets_per_query] for i in range(0, len(search_ident), tweets_per_query)]
+    requests = [client.get_users(**{ident_key: batch}, **_request_params(user_query_params)) for batch in batches]
+
+    num_collected = 0
+    responses = _gather_in_order(requests, max_workers)
+    try:
+        async for response in responses:
+            if isinstance(response, exceptions.CircuitOpen):
+                print(f"The users api keeps failing. Stopping. Exception message: {response}")
+                break
+            if isinstance(response, Exception):
+                print(f"Failed to pull user data for a batch. Error: ", response)
+                continue
+
+            dead_ids.record(dead_kind, response)
+            with api_response.metrics.timed('parse'):
+                page = parse_user_page(api_response.drop_seen(response, table='users'), full_save=full_save)
+            if page:
+                with api_response.metrics.timed('write'):
+                    api_response.update_data(**page)
+
+                num_collected += len(page['new_users'])
+                print(f"\rCollected {num_collected} users", end='')
+    finally:
+        await responses.aclose()
+
+    dead_ids.save()
+    return api_response
+
+
+async def async_pull_search(client: AsyncClient,
+                            query_params: LookupQueryParams,
+                            query: str,
+                            api_response: SearchResponse,
+                            full_save: bool = True,
+                            max_response: int = 100,
+                            start_time: str = None,
+                            end_time: str = None,
+                            tweets_per_query: int = 100,
+                            **kwargs):
+    search_query_params = query_params.copy().reformat('tweet')
+    has_refs: bool = 'referenced_tweets' in search_query_params.tweet_fields
+
+    # parse times into datetime objects
+    if start_time:
+        start_time = datetime.fromisoformat(start_time)
+    if end_time:
+        end_time = datetime.fromisoformat(end_time)
+
+    print(f"Pulling tweet results using '{query}' search query.")
+
+    cursor = api_response.get_cursor(query) or {}
+    if cursor.get('done'):
+        print(f"Results for query '{query}' were already pulled. Skipping.")
+        return api_response
+
+    # pages of a query depend on the previous next_token, so they are requested one after another
+    batches = TweetSearch.batch_sizes(max_response, tweets_per_query)
+    next_token = cursor.get('next_token')
+    num_pages = cursor.get('pages') or 0
+    num_collected = 0
+    for batch in batches[num_pages:]:
+        params = _request_params(search_query_params)
+        params.update(start_time=start_time, end_time=end_time, max_results=batch, next_token=next_token)
+
+        try:
+            response = await client.search_all_tweets(query, **params)
+        except exceptions.MaxRetries as e:
+            print(f"Max retries exceeded when calling the tweets api. Exception message: {e}")
+            break
+
+        next_token = response.meta.get('next_token', None)
+        num_pages += 1
+        api_response.set_cursor(query, next_token, pages=num_pages,
+                                done=next_token is None or num_pages == len(batches))
+
+        with api_response.metrics.timed('parse'):
+            page = parse_tweet_page(api_response.drop_seen(response), has_refs, full_save=full_save)
+        if page:
+            with api_response.metrics.timed('write'):
+                api_response.update_data(**page)
+
+            num_collected += len(page['new_tweets'])
+            print(f"\rCollected {num_collected} tweets for query: {query}", end='')
+
+        # pagination
+        if next_token is None:
+            print('\n' + '-' * 30)
+            break
+
+    return api_response
+
+
+async def async_pull_lookup(client: AsyncClient,
+                            query_params: LookupQueryParams,
+                            id_csv: str,
+                            api_response: LookupResponse,
+                            full_save: bool = True,
+                            id_col: str = 'id',
+                            skip_column: str = "skip",
+                            use_skip: bool = False,
+                            tweets_per_query: int = 100,
+                            max_workers: int = 10,
+                            output_dir: str = None,
+                            dead_id_cache: str = None,
+                            dead_id_ttl: float = DEAD_ID_TTL,
+                            **kwargs):
+    lookup_query_params = query_params.copy().reformat('tweet')
+    has_refs: bool = 'referenced_tweets' in lookup_query_params.tweet_fields
+
+    df_ids = pd.read_csv(id_csv)
+    if use_skip:
+        df_ids = df_ids.loc[df_ids[skip_column] != 1]
+    ids = list(df_ids[id_col])
+
+    print(f"Pulling tweet results for {len(ids)} ids.")
+
+    dead_ids = DeadIdCache(dead_id_cache_path(output_dir, dead_id_cache), ttl=dead_id_ttl)
+    ids = dead_ids.live('tweets', ids)
+
+    batches = [ids[i:i + tweets_per_query] for i in range(0, len(ids), tweets_per_query)]
+    requests = [client.get_tweets(batch, **_request_params(lookup_query_params)) for batch in batches]
+
+    num_collected = 0
+    responses = _gather_in_order(requests, max_workers)
+    try:
+        async for response in responses:
+            if isinstance(response, exceptions.CircuitOpen):
+                print(f"The tweets api keeps failing. Stopping, the ids left can be looked up later with "
+                      f"--only-missing. Exception message: {response}")
+                break
+            if isinstance(response, Exception):
+                print(f"Failed to pull tweets for a batch of ids. Error: ", response)
+                continue
+
+            dead_ids.record('tweets', response)
+            with api_response.metrics.timed('parse'):
+                page = parse_tweet_page(api_response.drop_seen(response), has_refs, full_save=full_save)
+            if page:
+                with api_response.metrics.timed('write'):
+                    api_response.update_data(**page)
+
+                num_collected += len(page['new_tweets'])
+                print(f"\rCollected {num_collected} tweets", end='')
+    finally:
+        await responses.aclose()
+
+    dead_ids.save()
+    return api_response
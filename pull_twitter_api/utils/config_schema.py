@@ -1,7 +1,7 @@
 import os
 import yaml
 
-from pydantic import BaseModel, SecretStr, FilePath, DirectoryPath
+from pydantic import BaseModel, SecretStr, FilePath, DirectoryPath, validator
 
 from .twitter_schema import LookupQueryParams
 
@@ -16,9 +16,20 @@ class TwitterConfig(BaseModel):
     query_params: LookupQueryParams
 
 
+SAVE_FORMATS = ['csv', 'json', 'parquet', 'sqlite']
+
+
 class LocalConfig(BaseModel):
     output_dir: DirectoryPath
     save_format: str
+    # rows per row group of parquet outputs
+    row_group_size: int = 50000
+
+    @validator('save_format')
+    def check_save_format(cls, save_format):
+        if save_format not in SAVE_FORMATS:
+            raise ValueError(f"save_format must be one of {SAVE_FORMATS}")
+        return save_format
 
 
 # Full Config Model for app
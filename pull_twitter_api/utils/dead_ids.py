@@ -0,0 +1,103 @@
+"""
+Negative cache of the ids the lookup endpoints reported as deleted, protected or suspended. Such ids come back as
+partial errors next to the records of the ids that still exist, and would come back the same way on every later run,
+so they are left out of the batches of later lookups until their entry expires.
+"""
+import time
+from typing import List
+
+from .state_file import StateFile
+
+# seconds a dead id is skipped for, protected accounts can be made public and suspensions can be lifted
+DEAD_ID_TTL = 30 * 24 * 60 * 60
+
+# request parameter the errors of each kind of id are reported for, errors about expansions (e.g. a deleted
+# referenced tweet) are reported for other parameters and are not cached
+KINDS = {'tweets': 'ids', 'user_ids': 'ids', 'usernames': 'usernames'}
+
+
+class DeadIdCache:
+    """
+    Ids by kind (tweets, user_ids or usernames) with the error type and the time they were last reported, stored in
+    a json file. Entries expire after `ttl` seconds.
+    """
+
+    def __init__(self, path: str = None, ttl: float = DEAD_ID_TTL):
+        self.ttl = ttl
+        self.state = StateFile(path)
+
+    def get(self, kind: str, ident):
+        """
+        Return the error type of a dead id, None if it is not known to be dead or its entry expired
+        """
+
+        entry = self.state.get(_cache_key(kind, ident))
+        if entry is None or time.time() - entry['seen_at'] > self.ttl:
+            return None
+        return entry['error']
+
+    def live(self, kind: str, idents: List) -> List:
+        """
+        Drop the dead ids from a list of ids to request
+        """
+
+        live = [ident for ident in idents if self.get(kind, ident) is None]
+        if len(live) < len(idents):
+            print(f"Skipping {len(idents) - len(live)} {kind} reported as deleted, protected or suspended by earlier "
+                  f"runs.")
+        return live
+
+    def record(self, kind: str, response) -> None:
+        """
+        Store the ids a page reported as dead, and forget those it returned
+        """
+
+        parameter = KINDS[kind]
+        for error in response.errors or []:
+            ident = error.get('resource_id', error.get('value'))
+            error_type = _error_type(error)
+            if ident is None or error_type is None or error.get('parameter') != parameter:
+                continue
+            self.state.set(_cache_key(kind, ident), {'error': error_type, 'seen_at': time.time()})
+
+        field = 'username' if kind == 'usernames' else 'id'
+        for record in response.data or []:
+            self.state.pop(_cache_key(kind, record[field]))
+
+    def save(self) -> None:
+        self.state.save()
+
+
+def _cache_key(kind: str, ident) -> str:
+    if kind == 'usernames':
+        # handles are case insensitive
+        ident = str(ident).lstrip('@').lower()
+    return f"{kind}:{ident}"
+
+
+def _error_type(error: dict):
+    """
+    deleted, protected or suspended, None for errors that may not happen again
+    """
+
+    if 'suspended' in str(error.get('detail', '')).lower():
+        return 'suspended'
+    # problem types look like https://api.twitter.com/2/problems/resource-not-found
+    problem = str(error.get('type', '')).rsplit('/', 1)[-1]
+    if problem == 'not-authorized-for-resource':
+        return 'protected'
+    if problem == 'resource-not-found':
+        return 'deleted'
+    return None
+
+
+def dead_id_cache_path(output_dir: str = None, dead_id_cache: str = None) -> str:
+    """
+    Path of the dead id cache shared by all runs writing to output_dir, None to only cache in memory
+    """
+
+    if dead_id_cache:
+        return dead_id_cache
+    if output_dir is None:
+        return None
+    return f"{output_dir}/dead_ids.json"
@@ -4,10 +4,14 @@ Custom exceptions used by :mod:`stream`
 
 
 class MaxRetries(Exception):
-    """Raised when the max number of db_engine connection retries has been made on an insert"""
+    """Raised when the max number of attempts has been made for an api request"""
     pass
 
 
+class CircuitOpen(MaxRetries):
+    """Raised without making the request when the circuit breaker of the endpoint is open."""
+
+
 class ConnectionLimit(Exception):
     """Raised when the filtered stream is at the maximum allowed connection num_tweets."""
     pass
@@ -18,4 +22,7 @@ class MissingFieldException(Exception):
     pass
 
 class EmptyTwitterResponseException(Exception):
-    """Raised when a twitter API response contains no tweet data."""
\ No newline at end of file
+    """Raised when a twitter API response contains no tweet data."""
+
+class TwitterRequestError(Exception):
+    """Raised when the twitter API answers a request with an unsuccessful (non 5xx) status code."""
@@ -0,0 +1,259 @@
+"""
+Instrumentation of a run: per endpoint request latency, bytes received, retries and time blocked on rate limits,
+rows per table and the time spent fetching, parsing and writing pages. The summary is written as metrics.json next to
+the config.yaml and params.txt of a run, and can also be dumped in the Prometheus text format (e.g. for the textfile
+collector of node_exporter).
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from .rate_limit import endpoint_family
+
+METRICS_FILE = 'metrics.json'
+STAGES = ('fetch', 'parse', 'write')
+
+# responses that make the pull classes retry the request
+_RETRIED_STATUS = 429
+
+
+class EndpointMetrics:
+    """
+    Requests made to one endpoint family
+    """
+
+    def __init__(self):
+        self.latencies = []
+        self.bytes = 0
+        self.retries = 0
+        self.status = {}
+        self.rate_limit_wait = 0.
+
+    def to_dict(self) -> dict:
+        latencies = sorted(self.latencies)
+        return {
+            'requests': len(latencies),
+            'bytes': self.bytes,
+            'retries': self.retries,
+            'status': {str(status): count for status, count in sorted(self.status.items())},
+            'rate_limit_wait_seconds': round(self.rate_limit_wait, 3),
+            'latency_seconds': {
+                'total': round(sum(latencies), 3),
+                'mean': round(sum(latencies) / len(latencies), 4) if latencies else None,
+                'p50': _quantile(latencies, 0.5),
+                'p95': _quantile(latencies, 0.95),
+                'max': round(latencies[-1], 4) if latencies else None,
+            },
+        }
+
+
+class RunMetrics:
+    """
+    Metrics of the run of one subcommand. Requests are recorded through a response hook on the tweepy client's
+    session, or by the AsyncClient itself (see `attach`), rows and stage times by the response objects and the pull
+    classes.
+    """
+
+    def __init__(self, subcommand: str):
+        self.subcommand = subcommand
+        self.started = time.time()
+        self.finished = None
+
+        self.endpoints = {}
+        self.rows = {}
+        self.stages = {stage: {'items': 0, 'busy_seconds': 0.} for stage in STAGES}
+
+        self._lock = threading.Lock()
+        self._client = None
+        self._rate_limiter = None
+        self._waited = {}
+
+    # Recording
+
+    def attach(self, client=None, rate_limiter=None) -> None:
+        """
+        Record the requests of a tweepy client or an AsyncClient, and the time the rate limiter blocks them
+        """
+
+        if client is not None:
+            self._client = client
+            if hasattr(client, 'metrics'):
+                # the AsyncClient calls record_request for its responses, its aiohttp session has no hooks
+                client.metrics = self
+            else:
+                client.session.hooks['response'].append(self.on_response)
+        if rate_limiter is not None:
+            self._rate_limiter = rate_limiter
+            self._waited = rate_limiter.waited()
+
+    def detach(self) -> None:
+        """
+        Stop recording requests, and add the rate limit waits since `attach`
+        """
+
+        if self._client is not None:
+            if hasattr(self._client, 'metrics'):
+                if self._client.metrics is self:
+                    self._client.metrics = None
+            else:
+                hooks = self._client.session.hooks['response']
+                if self.on_response in hooks:
+                    hooks.remove(self.on_response)
+            self._client = None
+
+        if self._rate_limiter is not None:
+            with self._lock:
+                for endpoint, waited in self._rate_limiter.waited().items():
+                    waited -= self._waited.get(endpoint, 0.)
+                    if waited > 0:
+                        self._endpoint(endpoint).rate_limit_wait += waited
+            self._rate_limiter = None
+
+    def on_response(self, response, *args, **kwargs):
+        """
+        requests response hook recording the latency, size and status of a response
+        """
+
+        endpoint = endpoint_family(response.url)
+        if endpoint is None:
+            return
+        self.record_request(endpoint, response.elapsed.total_seconds(), len(response.content), response.status_code)
+
+    def record_request(self, endpoint: str, latency: float, size: int, status: int = 200) -> None:
+        with self._lock:
+            metrics = self._endpoint(endpoint)
+            metrics.latencies.append(latency)
+            metrics.bytes += size
+            metrics.status[status] = metrics.status.get(status, 0) + 1
+            if status == _RETRIED_STATUS or status >= 500:
+                metrics.retries += 1
+
+    def add_rows(self, table: str, count: int) -> None:
+        with self._lock:
+            self.rows[table] = self.rows.get(table, 0) + count
+
+    def add_stage(self, stage: str, items: int, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage]['items'] += items
+            self.stages[stage]['busy_seconds'] += seconds
+
+    def add_stages(self, stats: dict) -> None:
+        """
+        Add the StageStats of a PagePipeline
+        """
+
+        for stage in stats.values():
+            self.add_stage(stage.name, stage.items, stage.busy)
+
+    @contextmanager
+    def timed(self, stage: str, items: int = 1):
+        """
+        Time a block of work of a stage, for pulls that do not run in a PagePipeline
+        """
+
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.add_stage(stage, items, time.time() - start)
+
+    def finish(self) -> None:
+        self.detach()
+        if self.finished is None:
+            self.finished = time.time()
+
+    # Summaries
+
+    def summary(self) -> dict:
+        with self._lock:
+            finished = self.finished or time.time()
+            wall = finished - self.started
+            endpoints = {endpoint: metrics.to_dict() for endpoint, metrics in sorted(self.endpoints.items())}
+            requests = sum(metrics['requests'] for metrics in endpoints.values())
+            rows = dict(self.rows)
+            main_rows = rows.get('users' if self.subcommand == 'user' else 'tweets', 0)
+            return {
+                'subcommand': self.subcommand,
+                'started': datetime.fromtimestamp(self.started).isoformat(),
+                'finished': datetime.fromtimestamp(finished).isoformat(),
+                'wall_seconds': round(wall, 3),
+                'endpoints': endpoints,
+                'rows': rows,
+                'stages': {stage: {'items': stats['items'], 'busy_seconds': round(stats['busy_seconds'], 3)}
+                           for stage, stats in self.stages.items()},
+                'rows_per_second': round(main_rows / wall, 2) if wall else None,
+                # quota efficiency: rows of the subcommand's main table per request spent
+                'rows_per_request': round(main_rows / requests, 2) if requests else None,
+            }
+
+    def save(self, output_dir: str) -> None:
+        with open(f"{output_dir}/{METRICS_FILE}", 'w') as f:
+            json.dump(self.summary(), f, indent=1)
+
+    def to_prometheus(self) -> str:
+        """
+        The summary in the Prometheus text exposition format
+        """
+
+        summary = self.summary()
+        run = {'subcommand': self.subcommand}
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: list) -> None:
+            lines.append(f"# HELP pull_twitter_{name} {help_text}")
+            lines.append(f"# TYPE pull_twitter_{name} {kind}")
+            # samples are (labels, value), or (suffix, labels, value) for the _sum and _count of summaries
+            for sample in samples:
+                suffix, labels, value = sample if len(sample) == 3 else ('', *sample)
+                if value is None:
+                    continue
+                label_text = ','.join(f'{key}="{label}"' for key, label in dict(run, **labels).items())
+                lines.append(f"pull_twitter_{name}{suffix}{{{label_text}}} {value}")
+
+        endpoints = summary['endpoints'].items()
+        metric('requests_total', 'counter', 'Requests made, by endpoint and response status',
+               [({'endpoint': endpoint, 'status': status}, count)
+                for endpoint, metrics in endpoints for status, count in metrics['status'].items()])
+        metric('response_bytes_total', 'counter', 'Bytes of the response bodies received',
+               [({'endpoint': endpoint}, metrics['bytes']) for endpoint, metrics in endpoints])
+        metric('retries_total', 'counter', 'Requests answered with a server error or a rate limit error',
+               [({'endpoint': endpoint}, metrics['retries']) for endpoint, metrics in endpoints])
+        metric('rate_limit_wait_seconds_total', 'counter', 'Seconds requests were held back by the rate limiter',
+               [({'endpoint': endpoint}, metrics['rate_limit_wait_seconds']) for endpoint, metrics in endpoints])
+        metric('request_latency_seconds', 'summary', 'Request latency',
+               [({'endpoint': endpoint, 'quantile': quantile}, metrics['latency_seconds'][key])
+                for endpoint, metrics in endpoints for quantile, key in (('0.5', 'p50'), ('0.95', 'p95'))]
+               + [('_sum', {'endpoint': endpoint}, metrics['latency_seconds']['total'])
+                  for endpoint, metrics in endpoints]
+               + [('_count', {'endpoint': endpoint}, metrics['requests']) for endpoint, metrics in endpoints])
+        metric('rows_total', 'counter', 'Rows pulled, by table',
+               [({'table': table}, count) for table, count in summary['rows'].items()])
+        metric('stage_busy_seconds_total', 'counter', 'Seconds spent fetching, parsing and writing pages',
+               [({'stage': stage}, stats['busy_seconds']) for stage, stats in summary['stages'].items()])
+        metric('run_seconds', 'gauge', 'Wall time of the run', [({}, summary['wall_seconds'])])
+        metric('rows_per_second', 'gauge', 'Rows of the main table pulled per second',
+               [({}, summary['rows_per_second'])])
+        metric('rows_per_request', 'gauge', 'Rows of the main table pulled per request',
+               [({}, summary['rows_per_request'])])
+        return '\n'.join(lines) + '\n'
+
+    def save_prometheus(self, path: str) -> None:
+        # written to a temporary file first, collectors must never read a partial file
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
+
+    def _endpoint(self, endpoint: str) -> EndpointMetrics:
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = EndpointMetrics()
+        return self.endpoints[endpoint]
+
+
+def _quantile(values: list, q: float):
+    if not values:
+        return None
+    return round(values[min(int(q * len(values)), len(values) - 1)], 4)
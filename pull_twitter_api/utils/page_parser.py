@@ -0,0 +1,125 @@
+"""
+Parsing of a single twitter api response page into the row dicts stored by the PullTwitterResponse objects. Shared by
+the synchronous pull classes and the asyncio interface so both produce identical outputs. Pages decoded by the fast
+parse path (RawResponse) are flattened by raw_parser instead of going through twitteralchemy objects.
+"""
+from concurrent.futures import Executor, Future
+from typing import List
+
+from tweepy.tweet import Tweet
+
+import twitteralchemy as twalc
+
+from .raw_parser import RawResponse, raw_page, flatten_tweets, flatten_users, flatten_media
+
+
+def _dict_func(full_save: bool):
+    if full_save:
+        return lambda twitter_api_obj: twitter_api_obj.to_full_dict()
+    return lambda twitter_api_obj: twitter_api_obj.to_dict()
+
+
+def parse_tweet_page(response, has_refs: bool, full_save: bool = True, fast: bool = True):
+    """
+    Flatten a page of tweets and its expansions.
+
+    Args:
+        response: the tweepy Response of a tweet endpoint (timeline, search or lookup)
+        has_refs: whether referenced_tweets is requested, in which case the tweet links table is built
+        full_save: whether to save extra tweet information (entities, geo, etc.) or not
+        fast: whether RawResponse pages are flattened by raw_parser rather than through twitteralchemy
+
+    Returns: dict of rows keyed by the `update_data` argument names, or None if the page holds no tweets
+    """
+
+    tweets: List[dict] = response.data
+    if not tweets:
+        return None
+
+    if isinstance(response, RawResponse) and full_save and fast:
+        includes = response.includes
+        return {
+            'new_links': parse_tweet_links(tweets) if has_refs else None,
+            'new_refs': flatten_tweets(includes.get('tweets')) or None,
+            'new_users': flatten_users(includes.get('users')) or None,
+            'new_tweets': flatten_tweets(tweets),
+            'new_media': flatten_media(includes.get('media')) or None,
+        }
+
+    dict_func = _dict_func(full_save)
+
+    # includes and expansions extraction
+    includes = twalc.Includes(**(response.includes))
+    ref_tweets, rel_users, inc_media = includes.tweets, includes.users, includes.media
+
+    return {
+        'new_links': parse_tweet_links(tweets) if has_refs else None,
+        'new_refs': [dict_func(tw) for tw in ref_tweets] if ref_tweets else None,
+        'new_users': [dict_func(us) for us in rel_users] if rel_users else None,
+        'new_tweets': [dict_func(twalc.Tweet(**tw)) for tw in tweets],
+        'new_media': [dict_func(md) for md in inc_media] if inc_media else None,
+    }
+
+
+def submit_tweet_page(executor: Executor, response, has_refs: bool, full_save: bool = True) -> Future:
+    """
+    Parse a page of tweets in a process pool, see `parse_tweet_page`. The page is sent as its raw json payload and is
+    parsed the way it would be in this process: pages of the fast parse path are flattened by raw_parser, others
+    through twitteralchemy.
+
+    Returns: future of the parsed page
+    """
+
+    raw = raw_page(response)
+    return executor.submit(parse_tweet_page, raw, has_refs, full_save, fast=raw is response)
+
+
+def parse_user_page(response, full_save: bool = True):
+    """
+    Flatten a page of users and their pinned tweets.
+
+    Args:
+        response: the tweepy Response of the users endpoint
+        full_save: whether to save extra user information or not
+
+    Returns: dict of rows keyed by the `update_data` argument names, or None if the page holds no users
+    """
+
+    users: List[dict] = response.data
+    if not users:
+        return None
+
+    if isinstance(response, RawResponse) and full_save:
+        return {
+            'new_users': flatten_users(users),
+            'new_tweets': flatten_tweets(response.includes.get('tweets')) or None,
+        }
+
+    dict_func = _dict_func(full_save)
+
+    # includes and expansions extraction
+    ref_tweets = twalc.Includes(**(response.includes)).tweets
+
+    return {
+        'new_users': [dict_func(twalc.User(**user_dict)) for user_dict in users],
+        'new_tweets': [dict_func(tw) for tw in ref_tweets] if ref_tweets else None,
+    }
+
+
+def parse_tweet_links(tweets: List[Tweet]) -> List[dict]:
+    """
+    Build the parent tweet -> referenced tweet relationships (retweets, replies, quotes) of a page
+    """
+
+    tweet_links = []
+    for tweet in tweets:
+        # tweepy tweets and raw json dicts (fast parsing) both support get, only the former convert the ids
+        if tweet.get('referenced_tweets') is not None:
+            for ref in tweet['referenced_tweets']:
+                new_link = {
+                    'parent_id': int(tweet['id']),
+                    'id': int(ref['id']),
+                    'type': ref['type']
+                }
+                tweet_links.append(new_link)
+    return tweet_links
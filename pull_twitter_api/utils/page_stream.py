@@ -0,0 +1,135 @@
+"""
+Streaming of pulled pages to the caller. The regular pull functions run in a background thread with a StreamResponse
+in place of the usual response objects: instead of accumulating the rows of every page, it hands each page over
+through a small bounded queue, so the pull waits for the caller whenever it is more than a few pages ahead.
+"""
+import queue
+import threading
+from collections import namedtuple
+from typing import Callable, Iterator
+
+import pandas as pd
+
+from .pull_twitter_response import PullTwitterResponse
+
+# pages held for the caller before the pull waits
+STREAM_PAGES = 4
+
+_DONE = object()
+
+
+class PageBatch(namedtuple("PageBatch", ("user", "tweets", "users", "refs", "media", "links"))):
+    """
+    The rows of a single page, each table a list of row dicts (None if the page has none). user is the timeline's
+    user for timeline pulls, None otherwise.
+    """
+    __slots__ = ()
+
+    def to_df(self, table: str) -> pd.DataFrame:
+        """
+        DataFrame of one of the tables of the page, None if it is empty
+        """
+
+        rows = getattr(self, table)
+        return pd.DataFrame(rows) if rows else None
+
+
+class StreamClosed(BaseException):
+    """
+    Raised in the pull thread once the caller stopped iterating. Like GeneratorExit it is not an Exception, so the
+    pull functions do not catch it and move on to the next user or batch.
+    """
+    pass
+
+
+class StreamResponse(PullTwitterResponse):
+    """
+    Response handing every page to the caller through a bounded queue instead of holding or saving it
+    """
+    IDENT = 'stream'
+
+    def __init__(self, max_pages: int = STREAM_PAGES, **kwargs):
+        super(StreamResponse, self).__init__(auto_save=False, create_dirs=False, **kwargs)
+
+        self.pages = queue.Queue(maxsize=max_pages)
+        self.closed = threading.Event()
+        # id of the newest tweet pulled for each user, used as since_id by incremental pulls
+        self.newest_ids = {}
+
+    def update_data(self,
+                    user=None,
+                    new_links=None,
+                    new_refs=None,
+                    new_users=None,
+                    new_tweets=None,
+                    new_media=None):
+        if user is not None and new_tweets:
+            with self._lock:
+                newest_id = max(int(tweet['id']) for tweet in new_tweets)
+                self.newest_ids[user] = max(newest_id, self.newest_ids.get(user, newest_id))
+
+        self.put(PageBatch(user, new_tweets, new_users, new_refs, new_media, new_links))
+
+    def put(self, item) -> None:
+        while True:
+            if self.closed.is_set():
+                raise StreamClosed()
+            try:
+                self.pages.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def set_cursor(self, key, next_token, pages: int = None, done: bool = False) -> None:
+        # nothing is saved, so there is no checkpoint to resume from
+        pass
+
+    def finish_user(self, user) -> None:
+        pass
+
+    def save(self, output_dir=None, **kwargs):
+        pass
+
+
+def iter_pages(pull: Callable[[StreamResponse], object], max_pages: int = STREAM_PAGES) -> Iterator[PageBatch]:
+    """
+    Run `pull(response)` in a background thread and yield the pages it passes to the StreamResponse, in order.
+    Exceptions raised by the pull are raised again here. Stopping the iteration early stops the pull at its next
+    page.
+
+    Args:
+        pull: function running a pull into the given response, e.g. a pull_search call
+        max_pages: number of pages the pull may get ahead of the caller
+    """
+
+    response = StreamResponse(max_pages=max_pages)
+    errors = []
+
+    def run():
+        try:
+            pull(response)
+        except StreamClosed:
+            pass
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            try:
+                response.put(_DONE)
+            except StreamClosed:
+                pass
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+
+    try:
+        while True:
+            page = response.pages.get()
+            if page is _DONE:
+                break
+            yield page
+    finally:
+        response.closed.set()
+
+    thread.join()
+    if errors:
+        raise errors[0]
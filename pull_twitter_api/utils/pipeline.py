@@ -0,0 +1,258 @@
+"""
+Staged fetch -> parse -> write pipeline for paginated pulls. Each stage runs in its own thread and hands its output to
+the next through a bounded queue, so the next page is already being requested while the current one is parsed and
+written, and a slow stage holds back the ones before it instead of letting pages pile up in memory.
+
+Parsing is pure python and holds the GIL, so with heavy expansions it can be handed to a ParsePool instead: the parse
+stage then only submits pages to the pool, and the write stage waits for their results in page order.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Iterable
+
+# pages held between two stages before the earlier stage blocks
+QUEUE_SIZE = 2
+
+_DONE = object()
+
+
+class StageStats:
+    """
+    Items processed by a stage and the time it spent working on them, as opposed to waiting on its queues
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.busy = 0.
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None:
+            return 0.
+        return (self.finished or time.time()) - self.started
+
+    @property
+    def utilization(self) -> float:
+        """
+        Fraction of the stage's lifetime spent working
+        """
+
+        return self.busy / self.elapsed if self.elapsed else 0.
+
+    def to_dict(self) -> dict:
+        return {'items': self.items, 'busy_seconds': round(self.busy, 3), 'utilization': round(self.utilization, 3)}
+
+
+class ParsePool(ProcessPoolExecutor):
+    """
+    Process pool parsing the pages of one or more pipelines. Workers are spawned rather than forked, since the
+    pipeline threads (and any open connections) already exist when the first page is submitted.
+    """
+
+    def __init__(self, workers: int):
+        super(ParsePool, self).__init__(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        self.workers = workers
+
+    def queue_size(self) -> int:
+        """
+        Pipeline queue size keeping every worker busy
+        """
+
+        return QUEUE_SIZE + self.workers
+
+
+class PagePipeline:
+    """
+    Run a paginated pull as three stages:
+
+        fetch: iterating `pages` requests the pages one after another (it yields the next page as soon as the previous
+            one has been handed on)
+        parse: `parse(page)` turns a response into rows, or into a Future of the rows (e.g. from a ParsePool)
+        write: `write(page, rows)` stores the rows, in page order
+
+    With threaded=False the stages run one after another in the calling thread, as a plain loop would.
+
+    Time the write stage spends waiting on parse Futures is counted as parse time.
+    """
+
+    STAGES = ('fetch', 'parse', 'write')
+
+    def __init__(self,
+                 pages: Iterable,
+                 parse: Callable,
+                 write: Callable,
+                 queue_size: int = QUEUE_SIZE,
+                 threaded: bool = True,
+                 metrics=None):
+        self.pages = pages
+        self.parse = parse
+        self.write = write
+        self.queue_size = queue_size
+        self.threaded = threaded
+        # RunMetrics the stage stats are added to once the pipeline is done
+        self.metrics = metrics
+
+        self.stats = {stage: StageStats(stage) for stage in self.STAGES}
+        self._error = None
+        self._stop = threading.Event()
+
+    def run(self) -> dict:
+        """
+        Pull every page. Exceptions raised by any stage stop the pipeline and are raised again here.
+
+        Returns: the stage stats
+        """
+
+        try:
+            if self.threaded:
+                self._run_threaded()
+            else:
+                self._run_inline()
+        finally:
+            if self.metrics is not None:
+                self.metrics.add_stages(self.stats)
+
+        if self._error is not None:
+            raise self._error
+        return self.stats
+
+    def summary(self) -> str:
+        return ', '.join(f"{stage.name} {stage.utilization:.0%} busy" for stage in self.stats.values())
+
+    # Stages
+
+    def _run_threaded(self) -> None:
+        parse_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+
+        threads = [
+            threading.Thread(target=self._fetch_stage, args=(parse_queue,), daemon=True),
+            threading.Thread(target=self._parse_stage, args=(parse_queue, write_queue), daemon=True),
+        ]
+        for thread in threads:
+            thread.start()
+
+        # the write stage runs in the calling thread, where the response objects were created
+        self._write_stage(write_queue)
+        for thread in threads:
+            thread.join()
+
+    def _run_inline(self) -> None:
+        for stats in self.stats.values():
+            stats.started = time.time()
+
+        for page in self._timed('fetch', iter(self.pages)):
+            rows = self._timed_call('parse', self.parse, page)
+            self._timed_call('write', self.write, page, self._result(rows))
+
+        for stats in self.stats.values():
+            stats.finished = time.time()
+
+    def _fetch_stage(self, out_queue: queue.Queue) -> None:
+        try:
+            for page in self._timed('fetch', iter(self.pages)):
+                if not self._put(out_queue, page):
+                    return
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self.stats['fetch'].finished = time.time()
+            self._put(out_queue, _DONE, force=True)
+
+    def _parse_stage(self, in_queue: queue.Queue, out_queue: queue.Queue) -> None:
+        self.stats['parse'].started = time.time()
+        drained = False
+        try:
+            for page in self._drain(in_queue):
+                rows = self._timed_call('parse', self.parse, page)
+                if not self._put(out_queue, (page, rows)):
+                    break
+            else:
+                drained = True
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self.stats['parse'].finished = time.time()
+            self._put(out_queue, _DONE, force=True)
+
+        # after a failure, keep draining so that the fetch stage is not left blocked on a full queue
+        if not drained:
+            for _ in self._drain(in_queue):
+                pass
+
+    def _write_stage(self, in_queue: queue.Queue) -> None:
+        self.stats['write'].started = time.time()
+        try:
+            for page, rows in self._drain(in_queue):
+                self._timed_call('write', self.write, page, self._result(rows))
+        except BaseException as e:
+            self._fail(e)
+            # keep draining so that the earlier stages are not left blocked on a full queue
+            for _ in self._drain(in_queue):
+                pass
+        finally:
+            self.stats['write'].finished = time.time()
+
+    # Helpers
+
+    def _timed(self, stage: str, iterator):
+        stats = self.stats[stage]
+        stats.started = time.time()
+        while not self._stop.is_set():
+            start = time.time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                stats.busy += time.time() - start
+            stats.items += 1
+            yield item
+
+    def _timed_call(self, stage: str, func: Callable, *args):
+        stats = self.stats[stage]
+        start = time.time()
+        try:
+            return func(*args)
+        finally:
+            stats.busy += time.time() - start
+            stats.items += 1
+
+    def _result(self, rows):
+        if not isinstance(rows, Future):
+            return rows
+
+        start = time.time()
+        try:
+            return rows.result()
+        finally:
+            self.stats['parse'].busy += time.time() - start
+
+    def _drain(self, in_queue: queue.Queue):
+        while True:
+            item = in_queue.get()
+            if item is _DONE:
+                return
+            yield item
+
+    def _put(self, out_queue: queue.Queue, item, force: bool = False) -> bool:
+        # give up on a full queue once another stage failed, unless it is the end marker the next stage waits for
+        while True:
+            if self._stop.is_set() and not force:
+                return False
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+
+    def _fail(self, error: BaseException) -> None:
+        if self._error is None:
+            self._error = error
+        self._stop.set()
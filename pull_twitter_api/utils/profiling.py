@@ -0,0 +1,117 @@
+"""
+Profiling of a subcommand run, for the --profile option of pull_twitter.py. The cpu profile is a cProfile stats file
+(readable with pstats or snakeviz) with a text summary next to it, the memory profile is a report of the lines holding
+the most memory allocated during the run, from tracemalloc. Both are written to the output directory of the run.
+"""
+import cProfile
+import io
+import platform
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime
+
+PROFILE_MODES = ('cpu', 'memory')
+# rows of the text reports
+PROFILE_TOP = 30
+# frames stored per allocation, more frames make tracemalloc slower and hungrier
+_TRACE_FRAMES = 1
+
+
+class RunProfiler:
+    """
+    cpu or memory profile of the code run between `start` and `stop`. The cpu profile covers the calling thread and the
+    threads started while profiling (page fetching, timeline workers), the processes of a ParsePool are not covered.
+    """
+
+    def __init__(self, mode: str = 'cpu', top: int = PROFILE_TOP):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode}. Available: {PROFILE_MODES}")
+        self.mode = mode
+        self.top = top
+
+        self._profile = None
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._peak = 0
+
+    def start(self) -> None:
+        if self.mode == 'cpu':
+            self._profile = cProfile.Profile()
+            threading.setprofile(self._profile_thread)
+            self._profile.enable()
+        else:
+            tracemalloc.start(_TRACE_FRAMES)
+
+    def stop(self) -> None:
+        if self.mode == 'cpu':
+            self._profile.disable()
+            threading.setprofile(None)
+        elif tracemalloc.is_tracing():
+            self._snapshot = tracemalloc.take_snapshot().filter_traces([
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            ])
+            _, self._peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+    def _profile_thread(self, *args) -> None:
+        # profile hook of new threads, replaced on its first call by a profiler of the thread
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # python 3.12+ profiles every thread with the first profiler already
+            threading.setprofile(None)
+            return
+        with self._lock:
+            self._thread_profiles.append(profile)
+
+    def stats(self) -> pstats.Stats:
+        stats = pstats.Stats(self._profile)
+        with self._lock:
+            for profile in self._thread_profiles:
+                stats.add(profile)
+        return stats
+
+    def report(self, subcommand: str, params: dict) -> str:
+        """
+        Text report of the profile, headed by the subcommand and its parameters
+        """
+
+        lines = [
+            f"# subcommand: {subcommand}",
+            f"# params: {params}",
+            f"# profile: {self.mode}",
+            f"# python: {platform.python_version()}",
+            f"# created: {datetime.now().isoformat()}",
+            '',
+        ]
+        if self.mode == 'cpu':
+            stream = io.StringIO()
+            stats = self.stats()
+            stats.stream = stream
+            stats.sort_stats('cumulative').print_stats(self.top)
+            lines.append(stream.getvalue())
+        else:
+            lines.append(f"Peak traced memory: {self._peak / 2 ** 20:.1f} MiB")
+            lines.append(f"Top {self.top} lines by memory still allocated at the end of the run:")
+            for stat in self._snapshot.statistics('lineno')[:self.top]:
+                lines.append(f"{stat.size / 2 ** 10:>12.1f} KiB {stat.count:>9} blocks  {stat.traceback}")
+        return '\n'.join(lines) + '\n'
+
+    def save(self, output_dir: str, subcommand: str, params: dict) -> str:
+        """
+        Write the profile to output_dir
+
+        Returns: path of the text report
+        """
+
+        timestamp = datetime.now().strftime('%Y-%m-%d %H.%M.%S')
+        path = f"{output_dir}/profile_{self.mode}_{subcommand}_{timestamp}"
+        if self.mode == 'cpu':
+            self.stats().dump_stats(f"{path}.prof")
+        with open(f"{path}.txt", 'w') as f:
+            f.write(self.report(subcommand, params))
+        return f"{path}.txt"
@@ -2,13 +2,20 @@
 This script handles the polling of tweet data using the tweets lookup api. API reference:
 https://developer.twitter.com/en/docs/twitter-api/tweets/lookup/api-reference/get-tweets
 """
+import math
 import os
 from tweepy.client import Client
 import yaml
 import pprint
 from .twitter_schema import LookupQueryParams
 from .tweet_lookup import TweetLookup
+from .pipeline import ParsePool
+from .seen_ids import SeenIds
+from .dead_ids import DeadIdCache, dead_id_cache_path, DEAD_ID_TTL
+from .table_writer import read_table, table_files, SQLITE_FILE
+from .rate_limit import RateLimiter
 from .pull_twitter_response import LookupResponse
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
@@ -24,7 +31,13 @@ def pull_lookup(client: Client,
                 id_col: str = 'id',
                 skip_column: str = "skip",
                 use_skip: bool = False,
-                tweets_per_query: int = 100):
+                tweets_per_query: int = 100,
+                rate_limiter: RateLimiter = None,
+                pipelined: bool = True,
+                parse_workers: int = 0,
+                only_missing: str = None,
+                dead_id_cache: str = None,
+                dead_id_ttl: float = DEAD_ID_TTL):
     lookup_query_params = query_params.copy().reformat('tweet')
 
     df_ids = pd.read_csv(id_csv)
@@ -33,8 +46,20 @@ def pull_lookup(client: Client,
 
     ids = list(df_ids[id_col])
 
+    # only request the ids missing from an earlier output
+    if only_missing:
+        ids = missing_ids(ids, only_missing, batch_size=tweets_per_query)
+        if not ids:
+            return api_response
+
+    # ids reported as deleted or protected by earlier runs are not requested again
+    dead_ids = DeadIdCache(dead_id_cache_path(output_dir, dead_id_cache), ttl=dead_id_ttl)
+
     # set up the search
-    tweet_lookup = TweetLookup(client, lookup_query_params)
+    tweet_lookup = TweetLookup(client, lookup_query_params, rate_limiter=rate_limiter)
+
+    # parsing is moved out of this process when workers are requested
+    parse_pool = ParsePool(parse_workers) if parse_workers else None
 
     try:
         response = tweet_lookup.pull(
@@ -44,9 +69,58 @@ def pull_lookup(client: Client,
             save_format=save_format,
             full_save=full_save,
             auto_save=auto_save,
-            batch_size=tweets_per_query)
+            batch_size=tweets_per_query,
+            pipelined=pipelined,
+            parse_pool=parse_pool,
+            dead_ids=dead_ids)
 
         return response
     except Exception as e:
         print(f"Failed to pull tweets for ids. Error: ", e)
         return None
+    finally:
+        dead_ids.save()
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+
+
+def missing_ids(ids: list, output: str, batch_size: int = 100) -> list:
+    """
+    Drop the ids of tweets already present in an earlier output, and report the requests saved
+
+    Args:
+        ids: tweet ids to look up
+        output: an earlier lookup output (see stored_tweets)
+        batch_size: number of ids per request
+    """
+
+    stored = stored_tweets(output, [int(tweet_id) for tweet_id in ids])
+    missing = [tweet_id for tweet_id, found in zip(ids, stored) if not found]
+
+    saved = math.ceil(len(ids) / batch_size) - math.ceil(len(missing) / batch_size)
+    print(f"{len(ids) - len(missing)} of {len(ids)} ids found in {output}. Looking up the {len(missing)} missing ids "
+          f"saves {saved} requests.")
+    return missing
+
+
+def stored_tweets(output: str, ids: list) -> np.ndarray:
+    """
+    Whether each of the tweet ids is stored in an earlier output: a data_tweets file (csv, json or parquet, with its
+    part files), a sqlite database, a seen_ids index directory, or a run directory holding any of them
+
+    Returns: boolean array, in the order of ids
+    """
+
+    if os.path.isdir(output):
+        if os.path.isfile(f"{output}/tweets.npy"):
+            return SeenIds(output).contains('tweets', ids)
+
+        candidates = [f"{output}/data_tweets.{save_format}" for save_format in ('csv', 'json', 'parquet')]
+        candidates.append(f"{output}/{SQLITE_FILE}")
+        paths = [path for path in candidates if table_files(path)]
+        if not paths:
+            raise ValueError(f"No tweets output found in {output}.")
+        output = paths[0]
+
+    stored = read_table(output, columns=['id'], table='tweets')['id'].dropna().astype(np.int64)
+    return np.isin(np.asarray(ids, dtype=np.int64), stored.to_numpy())
@@ -2,15 +2,19 @@
 This script handles the polling of user data using the tweets api. API reference:
 https://developer.twitter.com/en/docs/twitter-api/users/lookup/api-reference/get-users-by
 """
+import math
 import os
+from concurrent.futures import ThreadPoolExecutor
 from tweepy.client import Client
 import yaml
 import pprint
 from .twitter_schema import LookupQueryParams
 from .tweet_search import TweetSearch
+from .pipeline import ParsePool
+from .rate_limit import RateLimiter
 from .pull_twitter_response import SearchResponse
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 
 
 def pull_search(client: Client,
@@ -24,11 +28,15 @@ def pull_search(client: Client,
                 max_response: int = 100,
                 start_time: str = None,
                 end_time: str = None,
-                tweets_per_query: int = 100):
+                tweets_per_query: int = 100,
+                rate_limiter: RateLimiter = None,
+                num_shards: int = 1,
+                pipelined: bool = True,
+                parse_workers: int = 0):
     search_query_params = query_params.copy().reformat('tweet')
 
     # set up the search
-    tweet_search = TweetSearch(client, search_query_params)
+    tweet_search = TweetSearch(client, search_query_params, rate_limiter=rate_limiter)
 
     # parse times into datetime objects
     if start_time:
@@ -36,7 +44,23 @@ def pull_search(client: Client,
     if end_time:
         end_time = datetime.fromisoformat(end_time)
 
+    if api_response is None:
+        api_response = SearchResponse(auto_save=auto_save,
+                                      save_format=save_format,
+                                      output_dir=output_dir)
+
+    # parsing is moved out of this process when workers are requested, shards share the pool
+    parse_pool = ParsePool(parse_workers) if parse_workers else None
+
     try:
+        if num_shards > 1:
+            return pull_sharded_search(tweet_search, query, api_response, start_time, end_time, num_shards,
+                                       max_response=max_response,
+                                       full_save=full_save,
+                                       tweets_per_query=tweets_per_query,
+                                       pipelined=pipelined,
+                                       parse_pool=parse_pool)
+
         response = tweet_search.pull(
             query,
             output_dir=output_dir,
@@ -47,9 +71,110 @@ def pull_search(client: Client,
             save_format=save_format,
             full_save=full_save,
             auto_save=auto_save,
-            batch_size=tweets_per_query)
+            batch_size=tweets_per_query,
+            pipelined=pipelined,
+            parse_pool=parse_pool)
 
         return response
     except Exception as e:
         print(f"Failed to pull tweets for query. Error: ", e)
         return None
+    finally:
+        if parse_pool is not None:
+            parse_pool.shutdown(cancel_futures=True)
+
+
+def pull_sharded_search(tweet_search: TweetSearch,
+                        query: str,
+                        api_response: SearchResponse,
+                        start_time: datetime,
+                        end_time: datetime,
+                        num_shards: int,
+                        max_response: int = 100,
+                        full_save: bool = True,
+                        tweets_per_query: int = 100,
+                        pipelined: bool = True,
+                        parse_pool: ParsePool = None) -> SearchResponse:
+    """
+    Split [start_time, end_time) into num_shards windows holding a similar number of tweets (from the counts endpoint)
+    and pull the windows concurrently into one response. Windows do not overlap, so no tweet is pulled twice, and the
+    shards share the search endpoint's rate limit. max_response is split over the windows in proportion to their
+    tweet counts.
+    """
+
+    if start_time is None:
+        raise ValueError("start_time must be set to shard a search.")
+    start_time = _to_utc(start_time)
+    # the api requires end_time to be at least 10 seconds in the past
+    end_time = _to_utc(end_time) if end_time else datetime.utcnow() - timedelta(seconds=30)
+
+    # windows of a resumed run are kept, the cursors in its checkpoint only apply to them
+    windows_key = f"{query} windows"
+    windows = api_response.get_cursor(windows_key)
+    if windows:
+        # windows saved without their counts are weighted evenly
+        counts = [window[2] if len(window) > 2 else None for window in windows]
+        windows = [(datetime.fromisoformat(window[0]), datetime.fromisoformat(window[1])) for window in windows]
+    else:
+        granularity = 'hour' if end_time - start_time <= timedelta(days=30) else 'day'
+        buckets = tweet_search.count_tweets(query, start_time, end_time, granularity=granularity)
+        windows = TweetSearch.balanced_windows(buckets, start_time, end_time, num_shards)
+        counts = TweetSearch.window_counts(buckets, windows)
+
+        if api_response.checkpoint is not None:
+            api_response.checkpoint.set(windows_key, [[start.isoformat(), end.isoformat(), count]
+                                                      for (start, end), count in zip(windows, counts)])
+            api_response.checkpoint.save()
+
+    budgets = _shard_budgets(max_response, counts)
+    print(f"Pulling '{query}' in {len(windows)} windows: " +
+          ', '.join(f"{start:%Y-%m-%d %H:%M} - {end:%Y-%m-%d %H:%M} (up to {budget} tweets)"
+                    for (start, end), budget in zip(windows, budgets)))
+
+    def pull_window(window, shard_results):
+        start, end = window
+        if not shard_results:
+            return
+        try:
+            tweet_search.pull(
+                query,
+                api_response=api_response,
+                start_time=start,
+                end_time=end,
+                max_results=shard_results,
+                full_save=full_save,
+                batch_size=tweets_per_query,
+                cursor_key=f"{query} [{start.isoformat()}, {end.isoformat()})",
+                pipelined=pipelined,
+                parse_pool=parse_pool)
+        except Exception as e:
+            print(f"Failed to pull tweets for window {start} - {end}. Error: ", e)
+
+    with ThreadPoolExecutor(max_workers=len(windows)) as executor:
+        list(executor.map(pull_window, windows, budgets))
+
+    return api_response
+
+
+def _shard_budgets(max_response: int, counts: list) -> list:
+    """
+    Split max_response over the windows of a sharded search in proportion to their tweet counts, so that sparse
+    windows do not leave part of the budget unused while dense ones are cut short. Budgets add up to max_response (the
+    largest remainders are rounded up). Windows are weighted evenly if a count is unknown or all of them are 0.
+    """
+
+    weights = counts if None not in counts and sum(counts) else [1] * len(counts)
+    total = sum(weights)
+    shares = [max_response * weight / total for weight in weights]
+    budgets = [math.floor(share) for share in shares]
+    by_remainder = sorted(range(len(shares)), key=lambda ix: budgets[ix] - shares[ix])
+    for ix in by_remainder[:max_response - sum(budgets)]:
+        budgets[ix] += 1
+    return budgets
+
+
+def _to_utc(time: datetime) -> datetime:
+    # naive times are taken as utc, as by tweepy
+    if time.tzinfo is not None:
+        time = time.astimezone(timezone.utc).replace(tzinfo=None)
+    return time
@@ -3,12 +3,18 @@ This script handles the polling of reaction count data using the tweets api. API
 https://developer.twitter.com/en/docs/twitter-api/tweets/lookup/api-reference/get-tweets
 """
 import os
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from tweepy.client import Client
 import yaml
 import pprint
+from . import exceptions
 from .twitter_schema import LookupQueryParams
 from .timeline import Timeline
 from .pull_twitter_response import TimelineResponse
+from .page_stream import StreamClosed
+from .rate_limit import RateLimiter
+from .state_file import StateFile
+from .user_ids import UserIdCache, resolve_handles, USER_ID_TTL
 import pandas as pd
 
 
@@ -25,7 +31,14 @@ def pull_timelines(client: Client,
                    skip_column: str = "skip",
                    output_user: bool = False,
                    use_skip: bool = False,
-                   tweets_per_query: int = 100):
+                   tweets_per_query: int = 100,
+                   max_workers: int = 1,
+                   rate_limiter: RateLimiter = None,
+                   incremental: bool = False,
+                   state_file: str = None,
+                   user_id_cache: str = None,
+                   user_id_ttl: float = USER_ID_TTL,
+                   pipelined: bool = True):
     tl_query_params = query_params.copy().reformat('tweet')
 
     # get search identifiers
@@ -43,15 +56,38 @@ def pull_timelines(client: Client,
     else:
         raise ValueError("`handle_column` and `author_id_column` are mutually exclusive arguments.")
 
-    # set up the timeline
-    timeline = Timeline(client, tl_query_params, search_type)
-    response = TimelineResponse()
+    # set up the timeline; concurrent workers share the limiter so they draw from one rate limit budget
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    timeline = Timeline(client, tl_query_params, search_type, rate_limiter=rate_limiter)
+
+    # all users are collected into one response, each saved to its own subdirectory
+    if api_response is None:
+        api_response = TimelineResponse(auto_save=auto_save,
+                                        save_format=save_format,
+                                        output_dir=output_dir)
+
+    # incremental pulls only request tweets newer than the newest one stored for each user by earlier runs
+    since_ids = None
+    if incremental:
+        since_ids = StateFile(timeline_state_path(output_dir, state_file))
+
+    # resolve handles to user ids up front, 100 per request, reusing the resolutions of earlier runs
+    user_ids = {}
+    if search_type == 'handle':
+        cache = UserIdCache(user_id_cache_path(output_dir, user_id_cache), ttl=user_id_ttl)
+        user_ids = resolve_handles(client, search_ident, rate_limiter=rate_limiter, cache=cache)
+
+    def pull_ident(ix, ident):
+        # iter_timelines: once the caller stopped iterating, the users left are not pulled
+        closed = getattr(api_response, 'closed', None)
+        if closed is not None and closed.is_set():
+            raise StreamClosed()
 
-    # Pull the tweets
-    for ix, ident in enumerate(search_ident):
         print(f"Processing handle {ix + 1}/{len(search_ident)}")
+        since_id = since_ids.get(ident) if since_ids is not None else None
         try:
-            response = timeline.pull(
+            timeline.pull(
                 ident=ident,
                 output_dir=output_dir,
                 api_response=api_response,
@@ -60,7 +96,79 @@ def pull_timelines(client: Client,
                 auto_save=auto_save,
                 output_user=output_user,
                 ident_col=search_type,
-                tweets_per_query=tweets_per_query)
+                tweets_per_query=tweets_per_query,
+                since_id=since_id,
+                user_id=user_ids.get(ident),
+                pipelined=pipelined)
+        except exceptions.CircuitOpen:
+            # the endpoint keeps failing, the users left would fail too
+            raise
         except Exception as e:
             print(f"Failed to pull timeline for {search_type} {ident}. Error: ", e)
-    return response
+            return
+
+        # only advance the checkpoint once the whole timeline is pulled, pages arrive newest first
+        if since_ids is not None and ident in api_response.newest_ids:
+            since_ids.set(ident, str(api_response.newest_ids[ident]))
+            since_ids.save()
+
+    # Pull the tweets
+    try:
+        if max_workers > 1:
+            _pull_concurrently(pull_ident, search_ident, max_workers)
+        else:
+            for ix, ident in enumerate(search_ident):
+                pull_ident(ix, ident)
+    except exceptions.CircuitOpen as e:
+        print(f"The tweets api keeps failing. Stopping, the users left can be pulled by a later run. "
+              f"Exception message: {e}")
+
+    return api_response
+
+
+def _pull_concurrently(pull_ident, search_ident: list, max_workers: int) -> None:
+    """
+    Run pull_ident on every user with max_workers threads. Users are only submitted once a worker is free, so that
+    the users left can be cancelled when a pull raises StreamClosed or CircuitOpen.
+    """
+
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    pending = set()
+    try:
+        for ix, ident in enumerate(search_ident):
+            if len(pending) >= max_workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(executor.submit(pull_ident, ix, ident))
+
+        for future in wait(pending).done:
+            future.result()
+    except BaseException:
+        executor.shutdown(cancel_futures=True)
+        raise
+    executor.shutdown()
+
+
+def timeline_state_path(output_dir: str = None, state_file: str = None) -> str:
+    """
+    Path of the file holding the newest tweet id pulled for each user, shared by all runs writing to output_dir
+    """
+
+    if state_file:
+        return state_file
+    if output_dir is None:
+        raise ValueError("One of output_dir or state_file must be set for incremental timeline pulls.")
+    return f"{output_dir}/{TimelineResponse.IDENT}/since_ids.json"
+
+
+def user_id_cache_path(output_dir: str = None, user_id_cache: str = None) -> str:
+    """
+    Path of the handle to user id cache shared by all runs writing to output_dir, None to only cache in memory
+    """
+
+    if user_id_cache:
+        return user_id_cache
+    if output_dir is None:
+        return None
+    return f"{output_dir}/user_ids.json"
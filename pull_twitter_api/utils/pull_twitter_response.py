@@ -1,11 +1,17 @@
 import abc
 import json
 import yaml
-import csv
 import os
+import tempfile
+import threading
 import pandas as pd
+from contextlib import ExitStack
 from datetime import datetime
 
+from .metrics import RunMetrics
+from .state_file import StateFile
+from .table_writer import open_table_writer, table_path, FLUSH_ROWS, FLUSH_BYTES
+
 """
 TODO:
 	- output_handle in all tweet dfs
@@ -15,8 +21,172 @@ TODO:
 """
 
 
+# pagination cursors of a run, in its output directory
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# natural key of the rows of each table, used to drop rows already pulled
+TABLE_KEYS = {
+    'links': ('parent_id', 'id', 'type'),
+    'refs': ('id',),
+    'users': ('id',),
+    'tweets': ('id',),
+    'media': ('media_key',),
+}
+
+
+class MemoryBudget(object):
+    """
+    Approximate size of the rows held by the tables of a response (shared with the per-user responses of a timeline
+    pull). Once it passes `limit` bytes, the table being added to spills its rows to a temporary file.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+        self._dir = None
+        self._num_spills = 0
+
+    def charge(self, size: int) -> bool:
+        """
+        Count `size` bytes of new rows against the budget
+
+        Returns: whether the budget is exceeded
+        """
+
+        with self._lock:
+            self.used += size
+            return self.used > self.limit
+
+    def release(self, size: int) -> None:
+        with self._lock:
+            self.used -= size
+
+    def spill_path(self, table) -> str:
+        with self._lock:
+            # removed once the responses holding the budget are garbage collected
+            if self._dir is None:
+                self._dir = tempfile.TemporaryDirectory(prefix='pull_twitter_')
+            self._num_spills += 1
+            return f"{self._dir.name}/{table}_{self._num_spills}.pkl"
+
+
+class KeyedRows(object):
+    """
+    Rows of a table accumulated across pages, deduplicated on the table's natural key. Membership of a new row is a
+    single set lookup, and the DataFrame is only built (and then cached) when it is requested.
+
+    With a MemoryBudget, rows are spilled to temporary files once the budget is exceeded, as pickled DataFrames so
+    that dtypes and nested values read back unchanged. The DataFrame of a spilled table is then concatenated from
+    the files on every request rather than cached; only the natural keys stay in memory.
+    """
+
+    def __init__(self, key: tuple, budget: MemoryBudget = None, table: str = None):
+        self.key = key
+        self.budget = budget
+        self.table = table
+        self.rows = []
+        self._seen = set()
+        self._df = None
+        # spilled chunks and the estimated size of the rows still in memory
+        self._spills = []
+        self._num_spilled = 0
+        self._held_bytes = 0
+
+    def __len__(self):
+        return self._num_spilled + len(self.rows)
+
+    def _row_key(self, row: dict):
+        if all(col in row for col in self.key):
+            return tuple(row[col] for col in self.key)
+        # rows without the key columns (e.g. not requested fields) fall back to the whole row
+        return tuple(sorted((col, repr(val)) for col, val in row.items()))
+
+    def add(self, rows: list) -> int:
+        """
+        Append the rows whose key has not been seen yet
+
+        Returns: the number of rows added
+        """
+
+        added = 0
+        for row in rows or ():
+            row_key = self._row_key(row)
+            if row_key not in self._seen:
+                self._seen.add(row_key)
+                self.rows.append(row)
+                added += 1
+
+        if added:
+            self._df = None
+            if self.budget is not None:
+                # rows of a table share a layout, so the first one is a cheap estimate of the batch size
+                size = len(str(self.rows[-1])) * added
+                self._held_bytes += size
+                if self.budget.charge(size):
+                    self.spill()
+        return added
+
+    def spill(self) -> None:
+        """
+        Move the rows held in memory to a temporary file
+        """
+
+        if not self.rows:
+            return
+
+        path = self.budget.spill_path(self.table)
+        pd.DataFrame(self.rows).to_pickle(path)
+        self._spills.append(path)
+        self._num_spilled += len(self.rows)
+        self.rows = []
+        self._df = None
+
+        self.budget.release(self._held_bytes)
+        self._held_bytes = 0
+
+    def iter_dfs(self):
+        """
+        DataFrames of the spilled chunks followed by the rows held in memory, without concatenating them
+        """
+
+        for path in self._spills:
+            yield pd.read_pickle(path)
+        if self.rows:
+            yield pd.DataFrame(self.rows)
+
+    def to_df(self) -> pd.DataFrame:
+        if self._spills:
+            return pd.concat(list(self.iter_dfs()), ignore_index=True, sort=False)
+
+        if self._df is None and self.rows:
+            self._df = pd.DataFrame(self.rows)
+        return self._df
+
+
+def _table_property(table):
+    """
+    DataFrame view of one of the tables held by a response. The DataFrame is only built when the attribute is read.
+    """
+
+    def getter(self):
+        return self._table_df(table)
+
+    def setter(self, value):
+        self._tables[table] = value
+
+    return property(getter, setter)
+
+
 class PullTwitterResponse(object):
     IDENT = 'base'
+    TABLES = ()
+
+    df_links = _table_property('links')
+    df_refs = _table_property('refs')
+    df_users = _table_property('users')
+    df_tweets = _table_property('tweets')
+    df_media = _table_property('media')
 
     def __init__(self,
                  auto_save=False,
@@ -25,7 +195,14 @@ class PullTwitterResponse(object):
                  output_dir=None,
                  retrieved_dt=None,
                  config=None,
-                 command_dict=None):
+                 command_dict=None,
+                 flush_rows=FLUSH_ROWS,
+                 flush_bytes=FLUSH_BYTES,
+                 row_group_size=None,
+                 resume_dir=None,
+                 memory_budget=None,
+                 sqlite_path=None,
+                 seen_ids=None):
 
         self.auto_save = auto_save
         self.create_dirs = create_dirs
@@ -34,12 +211,42 @@ class PullTwitterResponse(object):
         self.retrieved_dt = datetime.now() if retrieved_dt is None else retrieved_dt
         self.config = config
         self.command_dict = command_dict
+        self.flush_rows = flush_rows
+        self.flush_bytes = flush_bytes
+        self.row_group_size = row_group_size
+        self.resume_dir = resume_dir
+        # bytes of rows held before spilling to disk (auto_save=False), None to keep everything in memory
+        if memory_budget is not None and not isinstance(memory_budget, MemoryBudget):
+            memory_budget = MemoryBudget(memory_budget)
+        self.memory_budget = memory_budget
+        # database written to with save_format 'sqlite', by default one in the output directory
+        self.sqlite_path = sqlite_path
+        # SeenIds index of the tweets and users written by earlier runs, None to write everything pulled
+        self.seen_ids = seen_ids
+
+        # rows held per table: the latest page when auto saving, otherwise everything pulled so far
+        self._tables = {}
+        # open table writers of an auto saving response, keyed by output path and table
+        self._writers = {}
+        # pagination cursors of the run, only advanced once the pages before them are on disk
+        self.checkpoint = None
+        self._cursors = {}
 
         self.has_saved = False
+        # guards directory creation and per-user state when timelines are pulled concurrently
+        self._lock = threading.RLock()
+        # request, row and stage metrics of the run, written to metrics.json
+        self.metrics = RunMetrics(self.IDENT)
 
         if auto_save:
             PullTwitterResponse.save(self, command_dict)
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
     @abc.abstractmethod
     def update_data(self, **kwargs):
         """
@@ -55,13 +262,25 @@ class PullTwitterResponse(object):
         if self.output_dir is None:
             self.output_dir = output_dir
 
-        if not self.has_saved and self.create_dirs:
-            # create output directories if needed
-            self.create_output_dir()
-            self.save_meta()
-            self.has_saved = True
-
-            print("Saving results to ", self.output_dir)
+        with self._lock:
+            if not self.has_saved and self.create_dirs:
+                if self.resume_dir:
+                    # continue writing into the directory of an earlier run
+                    if not os.path.isdir(self.resume_dir):
+                        raise ValueError(f"Can not resume from {self.resume_dir}, it is not a directory.")
+                    self.output_dir = self.resume_dir
+                else:
+                    # create output directories if needed
+                    self.create_output_dir()
+                    self.save_meta()
+                self.checkpoint = StateFile(f"{self.output_dir}/{CHECKPOINT_FILE}")
+                self.has_saved = True
+
+                print("Saving results to ", self.output_dir)
+
+        # responses that are not auto saved are saved once the pull is over
+        if not self.auto_save and self.metrics.finished is not None:
+            self.save_metrics()
 
     def save_meta(self, **kwargs):
 
@@ -102,34 +321,231 @@ class PullTwitterResponse(object):
 
         self.output_dir = output_time_dir
 
-    # Static utility methods
+    def flush(self) -> None:
+        """
+		Write everything buffered by the table writers to disk
+		"""
 
-    @staticmethod
-    def _update_df(df: pd.DataFrame, new_data: list, append: bool = False) -> pd.DataFrame:
-        if new_data:
-            new_data_df = pd.DataFrame(new_data)
+        with self._lock, ExitStack() as transactions:
+            # the page is written and committed as one transaction
+            for writer in self._writers.values():
+                transactions.enter_context(writer.transaction())
+            for writer in self._writers.values():
+                writer.flush()
+            for writer in self._writers.values():
+                writer.commit()
+            if all(writer.DURABLE_FLUSH for writer in self._writers.values()):
+                self._commit_cursors()
+
+    def close(self) -> None:
+        """
+		Flush and close the table writers. Called once a pull is finished (or interrupted)
+		"""
+
+        with self._lock:
+            self.flush()
+            for writer in self._writers.values():
+                writer.close()
+            self._writers = {}
+            self._commit_cursors()
+
+    def save_metrics(self) -> None:
+        """
+		Stop recording the metrics of the run and write them to metrics.json, next to its config.yaml and params.txt.
+		Responses that are not auto saved write them once they are saved.
+		"""
+
+        self.metrics.finish()
+        if self.has_saved and self.create_dirs:
+            self.metrics.save(self.output_dir)
+
+    # Checkpoints
+
+    def get_cursor(self, key) -> dict:
+        """
+		Pagination cursor stored for a user or query by the run being resumed, None if there is none
+		"""
+
+        if self.checkpoint is None:
+            return None
+        return self.checkpoint.get(key)
+
+    def set_cursor(self, key, next_token, pages: int = None, done: bool = False) -> None:
+        """
+		Record the cursor of the page following the latest one passed to update_data. It is written to the
+		checkpoint once that page is on disk.
+
+		Parameters:
+			-key:
+				-The user or query being paginated
+			-next_token: str
+				-Token of the next page to request
+			-pages: int
+				-Number of pages pulled so far
+			-done: bool
+				-Whether the last page has been pulled
+		"""
+
+        with self._lock:
+            self._cursors[key] = {'next_token': next_token, 'pages': pages, 'done': done}
+
+    def _commit_cursors(self) -> None:
+        with self._lock:
+            if self.checkpoint is None or not self._cursors:
+                return
+
+            cursors, self._cursors = self._cursors, {}
+            self.checkpoint.update(cursors)
+            self.checkpoint.save()
+
+    # Seen ids
+
+    def drop_seen(self, response, table='tweets'):
+        """
+		Drop the tweets and users written by earlier runs from a page before it is parsed, when the seen id index is
+		in skip mode
+
+		Parameters:
+			-response:
+				-A page of the tweets or users endpoints
+			-table: str
+				-Table the data records of the page go to, tweets or users
+		"""
+
+        if self.seen_ids is None or self.seen_ids.mode != 'skip':
+            return response
+        return self.seen_ids.filter_response(response, table=table)
+
+    def _record_seen(self, table, rows) -> None:
+        # called with the rows handed to the writers, so that later pages and runs skip or mark them
+        if self.seen_ids is None or table not in self.seen_ids.TABLES or rows is None:
+            return
+        if isinstance(rows, pd.DataFrame):
+            ids = rows['id'].dropna() if 'id' in rows else ()
+        else:
+            ids = [row['id'] for row in rows if row.get('id') is not None]
+        self.seen_ids.add(table, ids)
+
+    # Table handling
+
+    def _table_df(self, table):
+        data = self._tables.get(table)
+        if isinstance(data, KeyedRows):
+            return data.to_df()
+        if isinstance(data, list):
+            data = pd.DataFrame(data)
+            self._tables[table] = data
+        return data
+
+    def _update_tables(self, **new_rows) -> None:
+        """
+		Update the held tables with a page of rows keyed by table name
+		"""
 
-            if append:
-                return new_data_df
+        for table, rows in new_rows.items():
+            if rows is not None:
+                self.metrics.add_rows(table, len(rows))
+            if self.seen_ids is not None and self.seen_ids.mode == 'mark' and table in self.seen_ids.TABLES:
+                self.seen_ids.mark(table, rows)
+
+            if self.auto_save:
+                # only the latest page is kept, its DataFrame is built only if requested
+                self._tables[table] = rows if rows else None
             else:
-                new_df = pd.concat([df, new_data_df], axis=0) if df is not None else new_data_df
-                new_df = new_df.drop_duplicates()
+                self._table_rows(table).add(rows)
+
+    def _table_rows(self, table) -> KeyedRows:
+        data = self._tables.get(table)
+        if not isinstance(data, KeyedRows):
+            keyed = KeyedRows(TABLE_KEYS.get(table, ()), budget=self.memory_budget, table=table)
+            if isinstance(data, pd.DataFrame):
+                # a DataFrame assigned to one of the df_* attributes seeds the table
+                keyed.add(data.to_dict('records'))
+            self._tables[table] = data = keyed
+        return data
+
+    def _save_tables(self, output_dir) -> None:
+        """
+		Save the held tables. When auto saving the latest page is handed to the open table writers, which are flushed
+		together once any of them has buffered enough, otherwise each table is written out in full.
+		"""
+
+        if not self.auto_save:
+            for table in self.TABLES:
+                data = self._tables.get(table)
+                # spilled tables are written chunk by chunk rather than loaded whole
+                dfs = data.iter_dfs() if isinstance(data, KeyedRows) else [self._table_df(table)]
+                if self.seen_ids is not None:
+                    dfs = self._recorded(table, dfs)
+                PullTwitterResponse._save_dfs(dfs, self._table_path(output_dir, table), self.save_format,
+                                              row_group_size=self.row_group_size, table=table)
+            self._commit_cursors()
+            if self.seen_ids is not None:
+                self.seen_ids.save()
+            return
+
+        for table in self.TABLES:
+            rows = self._tables.get(table)
+            if isinstance(rows, pd.DataFrame):
+                rows = rows.to_dict('records')
+            if rows:
+                self._writer(output_dir, table).write(rows)
+                self._record_seen(table, rows)
+
+        if any(writer.should_flush() for writer in self._writers.values()):
+            self.flush()
+
+    def _recorded(self, table, dfs):
+        for df in dfs:
+            self._record_seen(table, df)
+            yield df
+
+    def _writer(self, output_dir, table):
+        save_path = self._table_path(output_dir, table)
+
+        # the tables of a sqlite output share its path
+        if (save_path, table) not in self._writers:
+            self._writers[save_path, table] = open_table_writer(save_path, self.save_format,
+                                                                append=True,
+                                                                flush_rows=self.flush_rows,
+                                                                flush_bytes=self.flush_bytes,
+                                                                row_group_size=self.row_group_size,
+                                                                table=table,
+                                                                key=TABLE_KEYS.get(table, ()))
+        return self._writers[save_path, table]
+
+    def _table_path(self, output_dir, table):
+        if self.save_format == 'sqlite' and self.sqlite_path:
+            return self.sqlite_path
+        return table_path(output_dir, table, self.save_format)
 
-                return new_df
-        return None
+    # Static utility methods
 
     @staticmethod
-    def _save_df(df: pd.DataFrame, output_dir, fn_suffix, save_format, append: bool = False) -> None:
-        save_path = f"{output_dir}/data_{fn_suffix}.{save_format}"
-
-        if df is not None:
-            if save_format == 'csv':
-                mode = 'a' if append else 'w'
-                with open(save_path, mode, encoding='utf-8') as f:
-                    df.to_csv(f, index=False, quoting=csv.QUOTE_ALL,
-                              header=not f.tell(), mode=mode)
-            elif save_format == 'json':
-                df.to_json(save_path, orient='table', mode='a' if append else 'w')
+    def _save_df(df: pd.DataFrame, output_dir, fn_suffix, save_format, append: bool = False,
+                 row_group_size: int = None) -> None:
+        PullTwitterResponse._save_dfs([df], table_path(output_dir, fn_suffix, save_format), save_format,
+                                      append=append, row_group_size=row_group_size, table=fn_suffix)
+
+    @staticmethod
+    def _save_dfs(dfs, save_path, save_format, append: bool = False, row_group_size: int = None,
+                  table: str = None) -> None:
+        """
+		Save the chunks of a table to one file, the writer aligns the chunks to the table's columns
+		"""
+
+        writer = None
+        try:
+            for df in dfs:
+                if df is None:
+                    continue
+                if writer is None:
+                    writer = open_table_writer(save_path, save_format, append=append, row_group_size=row_group_size,
+                                               table=table, key=TABLE_KEYS.get(table, ()))
+                writer.write_df(df)
+        finally:
+            if writer is not None:
+                writer.close()
 
     @staticmethod
     def _create_result_subdir(subdir_name, output_dir=None):
@@ -140,6 +556,7 @@ class PullTwitterResponse(object):
 
 
 class SingleTimelineResponse(PullTwitterResponse):
+    TABLES = ('links', 'refs', 'users', 'tweets', 'media')
 
     def __init__(self, *args, **kwargs):
         super(SingleTimelineResponse, self).__init__(create_dirs=False, **kwargs)
@@ -159,23 +576,12 @@ class SingleTimelineResponse(PullTwitterResponse):
                     new_users=None,
                     new_tweets=None,
                     new_media=None):
-        self.df_links = PullTwitterResponse._update_df(self.df_links, new_links, append=self.auto_save)
-        self.df_refs = PullTwitterResponse._update_df(self.df_refs, new_refs, append=self.auto_save)
-        self.df_users = PullTwitterResponse._update_df(self.df_users, new_users, append=self.auto_save)
-        self.df_tweets = PullTwitterResponse._update_df(self.df_tweets, new_tweets, append=self.auto_save)
-        self.df_media = PullTwitterResponse._update_df(self.df_media, new_media, append=self.auto_save)
-
-        # if self.auto_save:
-        #     self.save(user_out_dir=self.output_dir)
+        self._update_tables(links=new_links, refs=new_refs, users=new_users, tweets=new_tweets, media=new_media)
 
     def save(self, user_out_dir=None, save_format='csv'):
         super(SingleTimelineResponse, self).save(output_dir=user_out_dir, save_format=save_format)
-        print('\n', self.output_dir, self.df_tweets.shape)
-        PullTwitterResponse._save_df(self.df_links, user_out_dir, 'links', save_format, append=self.auto_save)
-        PullTwitterResponse._save_df(self.df_refs, user_out_dir, 'refs', save_format, append=self.auto_save)
-        PullTwitterResponse._save_df(self.df_users, user_out_dir, 'users', save_format, append=self.auto_save)
-        PullTwitterResponse._save_df(self.df_tweets, user_out_dir, 'tweets', save_format, append=self.auto_save)
-        PullTwitterResponse._save_df(self.df_media, user_out_dir, 'media', save_format, append=self.auto_save)
+        self.save_format = save_format
+        self._save_tables(user_out_dir)
 
         self.has_saved = True
 
@@ -190,6 +596,8 @@ class TimelineResponse(PullTwitterResponse):
         super(TimelineResponse, self).__init__(**kwargs)
 
         self.timelines = {}
+        # id of the newest tweet pulled for each user, used as since_id by incremental pulls
+        self.newest_ids = {}
 
     def update_data(self,
                     user=None,
@@ -199,8 +607,11 @@ class TimelineResponse(PullTwitterResponse):
                     new_tweets=None,
                     new_media=None):
 
-        if user not in self.timelines.keys():
-            self.timelines[user] = SingleTimelineResponse(auto_save=self.auto_save)
+        with self._lock:
+            self._user_response(user)
+            if new_tweets:
+                newest_id = max(int(tweet['id']) for tweet in new_tweets)
+                self.newest_ids[user] = max(newest_id, self.newest_ids.get(user, newest_id))
 
         self.timelines[user].update_data(
             new_links=new_links,
@@ -213,6 +624,25 @@ class TimelineResponse(PullTwitterResponse):
         if self.auto_save:
             self.save_user(user)
 
+    def _user_response(self, user):
+        with self._lock:
+            if user not in self.timelines.keys():
+                self.timelines[user] = SingleTimelineResponse(auto_save=self.auto_save,
+                                                              save_format=self.save_format,
+                                                              flush_rows=self.flush_rows,
+                                                              flush_bytes=self.flush_bytes,
+                                                              row_group_size=self.row_group_size,
+                                                              memory_budget=self.memory_budget,
+                                                              sqlite_path=self.sqlite_path,
+                                                              seen_ids=self.seen_ids)
+                # cursors and metrics of every user go to those of the run
+                self.timelines[user].checkpoint = self.checkpoint
+                self.timelines[user].metrics = self.metrics
+            return self.timelines[user]
+
+    def set_cursor(self, user, next_token, pages: int = None, done: bool = False) -> None:
+        self._user_response(user).set_cursor(user, next_token, pages=pages, done=done)
+
     def save_user(self, user, output_dir=None):
         super(TimelineResponse, self).save(output_dir=output_dir)
 
@@ -222,12 +652,29 @@ class TimelineResponse(PullTwitterResponse):
         user_out_dir = f"{self.output_dir}/{user}"
         response.save(user_out_dir=user_out_dir, save_format=self.save_format)
 
+    def finish_user(self, user) -> None:
+        """
+		Close the table writers of a user once their timeline has been pulled
+		"""
+
+        if user in self.timelines:
+            self.timelines[user].close()
+
+    def flush(self) -> None:
+        for response in list(self.timelines.values()):
+            response.flush()
+
+    def close(self) -> None:
+        for response in list(self.timelines.values()):
+            response.close()
+
 
 class SearchResponse(PullTwitterResponse):
     """
 	API Response from calling a search-based subcommand
 	"""
 
+    TABLES = ('links', 'refs', 'users', 'tweets', 'media')
     IDENT = 'search'
 
     def __init__(self, *args, **kwargs):
@@ -245,28 +692,16 @@ class SearchResponse(PullTwitterResponse):
                     new_users=None,
                     new_tweets=None,
                     new_media=None):
-        self.df_links = super(SearchResponse, self)._update_df(self.df_links, new_links, append=self.auto_save)
-        self.df_refs = super(SearchResponse, self)._update_df(self.df_refs, new_refs, append=self.auto_save)
-        self.df_users = super(SearchResponse, self)._update_df(self.df_users, new_users, append=self.auto_save)
-        self.df_tweets = super(SearchResponse, self)._update_df(self.df_tweets, new_tweets, append=self.auto_save)
-        self.df_media = super(SearchResponse, self)._update_df(self.df_media, new_media, append=self.auto_save)
+        # sharded searches update the response from several threads
+        with self._lock:
+            self._update_tables(links=new_links, refs=new_refs, users=new_users, tweets=new_tweets, media=new_media)
 
-        if self.auto_save:
-            self.save()
+            if self.auto_save:
+                self.save()
 
     def save(self, output_dir=None):
         super(SearchResponse, self).save(output_dir=output_dir)
-
-        super(SearchResponse, self)._save_df(self.df_links, self.output_dir, 'links', self.save_format,
-                                             append=self.auto_save)
-        super(SearchResponse, self)._save_df(self.df_refs, self.output_dir, 'refs', self.save_format,
-                                             append=self.auto_save)
-        super(SearchResponse, self)._save_df(self.df_users, self.output_dir, 'users', self.save_format,
-                                             append=self.auto_save)
-        super(SearchResponse, self)._save_df(self.df_tweets, self.output_dir, 'tweets', self.save_format,
-                                             append=self.auto_save)
-        super(SearchResponse, self)._save_df(self.df_media, self.output_dir, 'media', self.save_format,
-                                             append=self.auto_save)
+        self._save_tables(self.output_dir)
 
 
 class LookupResponse(PullTwitterResponse):
@@ -274,6 +709,7 @@ class LookupResponse(PullTwitterResponse):
 	API Response from calling a search-based subcommand
 	"""
 
+    TABLES = ('links', 'refs', 'users', 'tweets', 'media')
     IDENT = 'lookup'
 
     def __init__(self, *args, **kwargs):
@@ -291,34 +727,21 @@ class LookupResponse(PullTwitterResponse):
                     new_users=None,
                     new_tweets=None,
                     new_media=None):
-        self.df_links = super(LookupResponse, self)._update_df(self.df_links, new_links, append=self.auto_save)
-        self.df_refs = super(LookupResponse, self)._update_df(self.df_refs, new_refs, append=self.auto_save)
-        self.df_users = super(LookupResponse, self)._update_df(self.df_users, new_users, append=self.auto_save)
-        self.df_tweets = super(LookupResponse, self)._update_df(self.df_tweets, new_tweets, append=self.auto_save)
-        self.df_media = super(LookupResponse, self)._update_df(self.df_media, new_media, append=self.auto_save)
+        self._update_tables(links=new_links, refs=new_refs, users=new_users, tweets=new_tweets, media=new_media)
 
         if self.auto_save:
             self.save()
 
     def save(self, output_dir=None):
         super(LookupResponse, self).save(output_dir=output_dir)
-
-        super(LookupResponse, self)._save_df(self.df_links, self.output_dir, 'links', self.save_format,
-                                             append=self.auto_save)
-        super(LookupResponse, self)._save_df(self.df_refs, self.output_dir, 'refs', self.save_format,
-                                             append=self.auto_save)
-        super(LookupResponse, self)._save_df(self.df_users, self.output_dir, 'users', self.save_format,
-                                             append=self.auto_save)
-        super(LookupResponse, self)._save_df(self.df_tweets, self.output_dir, 'tweets', self.save_format,
-                                             append=self.auto_save)
-        super(LookupResponse, self)._save_df(self.df_media, self.output_dir, 'media', self.save_format,
-                                             append=self.auto_save)
+        self._save_tables(self.output_dir)
 
 
 class UserResponse(PullTwitterResponse):
     """
 	API Response from calling a user-based subcommand
 	"""
+    TABLES = ('users', 'tweets')
     IDENT = 'user'
 
     def __init__(self, *args, **kwargs):
@@ -330,16 +753,11 @@ class UserResponse(PullTwitterResponse):
     def update_data(self,
                     new_users=None,
                     new_tweets=None):
-        self.df_users = super(UserResponse, self)._update_df(self.df_users, new_users, append=self.auto_save)
-        self.df_tweets = super(UserResponse, self)._update_df(self.df_tweets, new_tweets, append=self.auto_save)
+        self._update_tables(users=new_users, tweets=new_tweets)
 
         if self.auto_save:
             self.save()
 
     def save(self, output_dir=None):
         super(UserResponse, self).save(output_dir=output_dir)
-
-        super(UserResponse, self)._save_df(self.df_users, self.output_dir, 'users', self.save_format,
-                                           append=self.auto_save)
-        super(UserResponse, self)._save_df(self.df_tweets, self.output_dir, 'tweets', self.save_format,
-                                           append=self.auto_save)
+        self._save_tables(self.output_dir)
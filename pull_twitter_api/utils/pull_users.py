@@ -9,6 +9,8 @@ import pprint
 from .config_schema import PullTwitterConfig
 from .twitter_schema import LookupQueryParams
 from .user import User
+from .dead_ids import DeadIdCache, dead_id_cache_path, DEAD_ID_TTL
+from .rate_limit import RateLimiter
 from .pull_twitter_response import UserResponse
 import pandas as pd
 
@@ -25,7 +27,10 @@ def pull_users(client: Client,
                author_id_column: str = None,
                skip_column: str = "skip",
                use_skip: bool = False,
-               tweets_per_query: int = 100):
+               tweets_per_query: int = 100,
+               rate_limiter: RateLimiter = None,
+               dead_id_cache: str = None,
+               dead_id_ttl: float = DEAD_ID_TTL):
     user_query_params = query_params.copy().reformat('user')
 
     # get search identifiers
@@ -43,7 +48,10 @@ def pull_users(client: Client,
         raise ValueError("`handle_column` and `author_id_column` are mutually exclusive arguments.")
 
     # set up the user object
-    user = User(client, user_query_params, ident_type)
+    user = User(client, user_query_params, ident_type, rate_limiter=rate_limiter)
+
+    # users reported as suspended or not found by earlier runs are not requested again
+    dead_ids = DeadIdCache(dead_id_cache_path(output_dir, dead_id_cache), ttl=dead_id_ttl)
 
     try:
         response = user.pull(
@@ -53,8 +61,11 @@ def pull_users(client: Client,
             save_format=save_format,
             full_save=full_save,
             auto_save=auto_save,
-            batch_size=tweets_per_query)
+            batch_size=tweets_per_query,
+            dead_ids=dead_ids)
         return response
     except Exception as e:
         print(f"Failed to pull user data. Error: ", e)
         return None
+    finally:
+        dead_ids.save()
@@ -0,0 +1,236 @@
+"""
+Request pacing for the twitter api endpoints, driven by the x-rate-limit-* response headers. Rate limits documented at:
+https://developer.twitter.com/en/docs/twitter-api/rate-limits
+"""
+import asyncio
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from .retry import RetryPolicy, CircuitBreaker
+
+# Requests allowed per 15 minute window (app auth) for each endpoint family used by the package. These are only the
+# starting budget; once a response is received the bucket follows the headers returned by twitter.
+ENDPOINT_LIMITS = {
+    'timeline': 1500,
+    'user': 900,
+    'users': 300,
+    'search': 300,
+    'lookup': 300,
+    'counts': 300,
+}
+WINDOW_SECONDS = 15 * 60
+
+# Minimum seconds between two requests to the same endpoint family, regardless of remaining budget
+# (full archive search additionally allows only 1 request per second)
+MIN_INTERVALS = {
+    'search': 1.0,
+    'lookup': 1.1,
+    'counts': 1.0,
+}
+
+# Map api routes to endpoint families, most specific first
+_ROUTE_FAMILIES = [
+    (re.compile(r'^/2/users/by/username/[^/]+$'), 'user'),
+    (re.compile(r'^/2/users/[^/]+/tweets$'), 'timeline'),
+    (re.compile(r'^/2/users(/by)?$'), 'users'),
+    (re.compile(r'^/2/tweets/search/all$'), 'search'),
+    (re.compile(r'^/2/tweets/counts/all$'), 'counts'),
+    (re.compile(r'^/2/tweets$'), 'lookup'),
+]
+
+
+def endpoint_family(url: str):
+    """
+    Return the endpoint family of a request url, or None if the route is not one used by the package
+    """
+
+    path = urlparse(url).path.rstrip('/')
+    for pattern, family in _ROUTE_FAMILIES:
+        if pattern.match(path):
+            return family
+    return None
+
+
+class TokenBucket:
+    """
+    Token bucket for a single endpoint family. Tokens are spent at full speed (down to the `min_interval` floor) until
+    the budget reported by twitter is exhausted, then requests wait for the window to reset.
+    """
+
+    def __init__(self, capacity: int, window: float = WINDOW_SECONDS, min_interval: float = 0.):
+        self.capacity = capacity
+        self.window = window
+        self.min_interval = min_interval
+
+        self.tokens = float(capacity)
+        self.reset_at = None
+        # seconds requests have spent waiting for a token
+        self.waited = 0.
+
+        self._last_refill = time.time()
+        self._last_request = 0.
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Block until a token is available and spend it.
+
+        Returns: the number of seconds spent waiting
+        """
+
+        waited = 0.
+        wait = self._reserve()
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            wait = self._reserve()
+        self._add_waited(waited)
+        return waited
+
+    async def acquire_async(self) -> float:
+        """
+        Coroutine version of `acquire` for the asyncio interface, waiting without blocking the event loop.
+        """
+
+        waited = 0.
+        wait = self._reserve()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = self._reserve()
+        self._add_waited(waited)
+        return waited
+
+    def _add_waited(self, waited: float) -> None:
+        if waited:
+            with self._lock:
+                self.waited += waited
+
+    def _reserve(self) -> float:
+        """
+        Spend a token if one is available now, otherwise return the seconds to wait before trying again
+        """
+
+        with self._lock:
+            now = time.time()
+            self._refill(now)
+
+            wait = self._last_request + self.min_interval - now
+            if self.tokens < 1:
+                if self.reset_at is not None:
+                    wait = max(wait, self.reset_at - now)
+                else:
+                    wait = max(wait, (1 - self.tokens) * self.window / self.capacity)
+
+            if wait <= 0:
+                self.tokens -= 1
+                self._last_request = now
+                return 0.
+            return wait
+
+    def update(self, remaining: int, reset: float, limit: int = None) -> None:
+        """
+        Synchronize the bucket with the x-rate-limit-* headers of a response
+
+        Args:
+            remaining: requests remaining in the current window
+            reset: epoch time in seconds at which the window resets
+            limit: requests allowed per window
+        """
+
+        with self._lock:
+            if limit:
+                self.capacity = limit
+            self.tokens = float(remaining)
+            self.reset_at = float(reset)
+            self._last_refill = time.time()
+
+    def _refill(self, now: float) -> None:
+        if self.reset_at is not None:
+            # budget is known from the headers, it only comes back once the window resets
+            if now >= self.reset_at:
+                self.tokens = float(self.capacity)
+                self.reset_at = None
+        else:
+            elapsed = now - self._last_refill
+            self.tokens = min(float(self.capacity), self.tokens + elapsed * self.capacity / self.window)
+        self._last_refill = now
+
+
+class RateLimiter:
+    """
+    Thread-safe collection of token buckets, one per endpoint family. A single instance is shared by every worker
+    making requests with the same client so that concurrent pulls draw from one budget per endpoint. It also holds the
+    retry policy and the circuit breakers of the endpoints (see retry.py), shared the same way.
+    """
+
+    def __init__(self, limits: dict = None, min_intervals: dict = None, window: float = WINDOW_SECONDS,
+                 retry_policy: RetryPolicy = None):
+        limits = dict(ENDPOINT_LIMITS, **(limits or {}))
+        min_intervals = dict(MIN_INTERVALS, **(min_intervals or {}))
+
+        self.buckets = {endpoint: TokenBucket(limit, window=window, min_interval=min_intervals.get(endpoint, 0.))
+                        for endpoint, limit in limits.items()}
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.breakers = {endpoint: CircuitBreaker(endpoint) for endpoint in limits}
+
+    def attach(self, client) -> None:
+        """
+        Register a response hook on the tweepy client's session so that every response updates its endpoint's bucket
+        """
+
+        client.session.hooks['response'].append(self.on_response)
+
+    def acquire(self, endpoint: str) -> float:
+        """
+        Block until a request to the endpoint is allowed.
+
+        Args:
+            endpoint: the endpoint family, one of the keys of `buckets`
+
+        Returns: the number of seconds spent waiting
+        """
+
+        return self.buckets[endpoint].acquire()
+
+    async def acquire_async(self, endpoint: str) -> float:
+        """
+        Coroutine version of `acquire` for the asyncio interface
+        """
+
+        return await self.buckets[endpoint].acquire_async()
+
+    def waited(self) -> dict:
+        """
+        Seconds requests to each endpoint family have spent waiting so far
+        """
+
+        return {endpoint: bucket.waited for endpoint, bucket in self.buckets.items()}
+
+    def update(self, url: str, headers) -> None:
+        """
+        Update the bucket of the endpoint a response came from using its x-rate-limit-* headers
+
+        Args:
+            url: the request url
+            headers: the response headers
+        """
+
+        if 'x-rate-limit-remaining' not in headers or 'x-rate-limit-reset' not in headers:
+            return
+
+        endpoint = endpoint_family(url)
+        if endpoint in self.buckets:
+            limit = headers.get('x-rate-limit-limit')
+            self.buckets[endpoint].update(remaining=int(headers['x-rate-limit-remaining']),
+                                          reset=float(headers['x-rate-limit-reset']),
+                                          limit=int(limit) if limit else None)
+
+    def on_response(self, response, *args, **kwargs):
+        """
+        requests response hook reading the x-rate-limit-* headers
+        """
+
+        self.update(response.url, response.headers)
@@ -0,0 +1,239 @@
+"""
+Fast parse path working on the raw json of the twitter api responses. Pages are decoded with orjson (when installed)
+and each record is flattened straight into a row dict laid out like twitteralchemy's `to_full_dict`, without building
+the tweepy and twitteralchemy objects of the default path.
+
+The column layout is read once from the fields of the twitteralchemy models: nested models (e.g. public_metrics) are
+flattened into `<field>_<subfield>` columns, ids are converted to int and timestamps to timezone aware datetimes,
+strings, numbers, booleans and enums are coerced by the pydantic field, other values are kept as decoded. The first
+record holding each set of fields is also parsed through twitteralchemy, and if the two rows differ the fast path is
+switched off for that model so outputs never silently change.
+"""
+import json
+import threading
+from collections import namedtuple
+from datetime import datetime
+from enum import Enum
+
+import requests
+from pydantic import BaseModel, ValidationError
+
+import twitteralchemy as twalc
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# same fields as tweepy.client.Response, but data and includes hold the decoded json dicts
+RawResponse = namedtuple("RawResponse", ("data", "includes", "errors", "meta"))
+
+
+def decode_json(content: bytes):
+    return _loads(content)
+
+
+def decode_response(response):
+    """
+    Decode the requests.Response returned by a client created with `return_type=requests.Response`. Other responses
+    (tweepy Response tuples) are returned unchanged.
+    """
+
+    if not isinstance(response, requests.Response):
+        return response
+
+    body = decode_json(response.content)
+    return RawResponse(body.get("data"), body.get("includes", {}), body.get("errors", []), body.get("meta", {}))
+
+
+def raw_page(response) -> RawResponse:
+    """
+    The json payload of a page as plain dicts. Unlike tweepy objects these can be pickled, e.g. to be parsed in
+    another process. RawResponses are returned unchanged.
+    """
+
+    if isinstance(response, RawResponse):
+        return response
+
+    data = [_raw(record) for record in response.data] if response.data else response.data
+    includes = {key: [_raw(record) for record in records] for key, records in (response.includes or {}).items()}
+    return RawResponse(data, includes, response.errors, response.meta)
+
+
+def _raw(record):
+    # tweepy objects keep the json they were built from in data
+    return getattr(record, 'data', record)
+
+
+def _parse_int(value):
+    return int(value) if value is not None else None
+
+
+def _parse_datetime(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    # api timestamps look like 2021-08-19T00:00:00.000Z
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+class ModelFlattener:
+    """
+    Flattens raw records of one twitteralchemy model into `to_full_dict` rows
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self.columns = _model_columns(model)
+        # False once a row differed from the twitteralchemy output
+        self.enabled = True
+        # sets of columns present in a record (not None) whose rows matched the twitteralchemy output
+        self._verified = set()
+        self._lock = threading.Lock()
+
+    def flatten(self, records: list) -> list:
+        if not records:
+            return []
+
+        if self.enabled:
+            rows = [self._flatten(record) for record in records]
+            # optional fields missing from the records verified so far may be flattened differently
+            for record, row in zip(records, rows):
+                present = frozenset(column for column, value in row.items() if value is not None)
+                if present not in self._verified and not self._verify(record, row, present):
+                    break
+            else:
+                return rows
+
+        return [self.model(**record).to_full_dict() for record in records]
+
+    def _flatten(self, record: dict) -> dict:
+        row = {}
+        for column, path, parse in self.columns:
+            value = record
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            row[column] = parse(value) if parse is not None and value is not None else value
+        return row
+
+    def _verify(self, record: dict, row: dict, present: frozenset) -> bool:
+        """
+        Compare the row of a record holding a new set of columns with the twitteralchemy output
+
+        Returns: whether the fast path is still enabled
+        """
+
+        expected = self.model(**record).to_full_dict()
+        with self._lock:
+            if self.columns and row == expected:
+                self._verified.add(present)
+            elif self.enabled:
+                self.enabled = False
+                print(f"Warning: fast parsing does not match twitteralchemy for {self.model.__name__}, "
+                      f"using twitteralchemy.")
+            return self.enabled
+
+
+def _model_columns(model, prefix: str = '', path: tuple = ()) -> list:
+    """
+    (column, json path, parser) of every leaf field of a twitteralchemy model, empty if it is not a pydantic model
+    """
+
+    fields = getattr(model, '__fields__', None)
+    if not fields:
+        return []
+
+    columns = []
+    for name, field in fields.items():
+        column = f"{prefix}{name}"
+        # json keys are the field aliases
+        key_path = path + (field.alias,)
+        if _is_model(field.type_) and field.outer_type_ is field.type_:
+            columns.extend(_model_columns(field.type_, prefix=f"{column}_", path=key_path))
+        else:
+            columns.append((column, key_path, _field_parser(field, model)))
+    return columns
+
+
+def _is_model(field_type) -> bool:
+    return isinstance(field_type, type) and issubclass(field_type, BaseModel)
+
+
+def _field_parser(field, model):
+    """
+    Converter of a raw json value to the value held by the model field, None if it is kept as decoded
+    """
+
+    field_type = field.type_
+    if _is_model(field_type):
+        parser = _dict_parser(field_type)
+    elif field_type is int:
+        parser = _parse_int
+    elif field_type is datetime:
+        parser = _parse_datetime
+    elif isinstance(field_type, type) and issubclass(field_type, (str, float, bool, Enum)):
+        # e.g. enums are held as members, not as the decoded strings
+        return _validator(field, model)
+    else:
+        return None
+
+    if field.outer_type_ is field_type:
+        return parser
+    # lists of values, e.g. referenced_tweets
+    return lambda values: [parser(value) for value in values]
+
+
+def _validator(field, model):
+    """
+    Converter of a raw json value through the validation of the pydantic field, raising like the model would
+    """
+
+    def parse(value):
+        value, errors = field.validate(value, {}, loc=field.alias, cls=model)
+        if errors:
+            raise ValidationError([errors], model)
+        return value
+
+    return parse
+
+
+def _dict_parser(model):
+    """
+    Converter of a raw json object to the dict of a nested model (as returned by its `.dict()`)
+    """
+
+    fields = [(name, field.alias, _field_parser(field, model)) for name, field in model.__fields__.items()]
+
+    def parse(record: dict) -> dict:
+        parsed = {}
+        for name, key, parser in fields:
+            value = record.get(key)
+            parsed[name] = parser(value) if parser is not None and value is not None else value
+        return parsed
+
+    return parse
+
+
+_flatteners = {}
+
+
+def flattener(model) -> ModelFlattener:
+    if model not in _flatteners:
+        _flatteners[model] = ModelFlattener(model)
+    return _flatteners[model]
+
+
+def flatten_tweets(records: list) -> list:
+    return flattener(twalc.Tweet).flatten(records)
+
+
+def flatten_users(records: list) -> list:
+    return flattener(twalc.User).flatten(records)
+
+
+def flatten_media(records: list) -> list:
+    # the media model is only referenced through the includes model
+    fields = getattr(twalc.Includes, '__fields__', None)
+    if fields and 'media' in fields:
+        return flattener(fields['media'].type_).flatten(records)
+    return [media.to_full_dict() for media in twalc.Includes(media=records).media]
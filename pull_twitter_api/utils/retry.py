@@ -0,0 +1,272 @@
+"""
+Retries of failed api requests, shared by every pull: server errors, rate limit errors and connection errors are
+retried with exponential backoff and jitter, waiting at least as long as the Retry-After or x-rate-limit-reset headers
+ask. A circuit breaker per endpoint family stops requests to an endpoint that keeps failing, so that a degraded
+endpoint does not spend the rate limit budget of the whole run on retries.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import Counter
+from email.utils import parsedate_to_datetime
+from typing import Callable
+
+import requests
+import tweepy.errors
+
+from . import exceptions
+
+# failed attempts (rate limit errors aside) made for one request before MaxRetries is raised
+MAX_RETRIES = 5
+# backoff before the first retry in seconds, doubled on every retry up to BACKOFF_MAX
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 60.
+# seconds waited on a rate limit error that comes without Retry-After or x-rate-limit-reset headers
+RATE_LIMIT_WAIT = 60.
+# rate limit errors waited out for one request before MaxRetries is raised, a day of 15 minute windows. They do not
+# use up MAX_RETRIES: another job spending the same bearer token's budget is no reason to give up on a pull
+MAX_RATE_LIMIT_RETRIES = 96
+
+# consecutive failed requests to an endpoint family that open its circuit, and seconds it then stays open
+CIRCUIT_THRESHOLD = 10
+CIRCUIT_COOLDOWN = 60.
+
+# errors of the tweepy client worth retrying
+RETRYABLE_ERRORS = (tweepy.errors.TwitterServerError, tweepy.errors.TooManyRequests,
+                    requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+
+class RetryableResponse(Exception):
+    """Raised by clients other than tweepy's (see AsyncClient) for a response with a status worth retrying."""
+
+    def __init__(self, message: str, status: int, headers=None):
+        super(RetryableResponse, self).__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class RetryPolicy:
+    """
+    How many times and after how long failed requests are retried
+    """
+
+    def __init__(self, max_retries: int = MAX_RETRIES, backoff_base: float = BACKOFF_BASE,
+                 backoff_max: float = BACKOFF_MAX, rate_limit_wait: float = RATE_LIMIT_WAIT,
+                 max_rate_limit_retries: int = MAX_RATE_LIMIT_RETRIES):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limit_wait = rate_limit_wait
+        self.max_rate_limit_retries = max_rate_limit_retries
+
+    def backoff(self, attempt: int) -> float:
+        """
+        Seconds to wait after the attempt-th failed attempt: exponential, half of it random so that workers failing
+        together do not retry together
+        """
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def wait(self, attempt: int, status: int = None, headers=None) -> float:
+        """
+        Seconds to wait before retrying a request that failed with status (None for connection errors)
+        """
+
+        headers = headers or {}
+        retry_after = _retry_after(headers)
+        if status == 429:
+            if retry_after is None and 'x-rate-limit-reset' in headers:
+                retry_after = float(headers['x-rate-limit-reset']) - time.time() + 1
+            return max(0., retry_after if retry_after is not None else self.rate_limit_wait)
+        return max(self.backoff(attempt), retry_after or 0.)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of one endpoint family. After `threshold` consecutive failed requests the circuit opens and
+    requests fail with CircuitOpen without being made. Once `cooldown` seconds have passed a single trial request is
+    let through: the circuit closes if it succeeds and opens again if it fails.
+    """
+
+    def __init__(self, endpoint: str, threshold: int = CIRCUIT_THRESHOLD, cooldown: float = CIRCUIT_COOLDOWN):
+        self.endpoint = endpoint
+        self.threshold = threshold
+        self.cooldown = cooldown
+
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def before_request(self) -> bool:
+        """
+        Raise CircuitOpen if requests to the endpoint are not allowed now
+
+        Returns: whether the request is the trial of a half open circuit, to be passed to `end_trial` once it is over
+        """
+
+        with self._lock:
+            if self.opened_at is None:
+                return False
+            remaining = self.opened_at + self.cooldown - time.time()
+            if remaining > 0 or self._trial:
+                raise exceptions.CircuitOpen(f"Requests to the {self.endpoint} endpoint failed {self.failures} times "
+                                             f"in a row. Not retrying for another {max(remaining, 0.):.0f} seconds.")
+            # half open: this request is the trial
+            self._trial = True
+            return True
+
+    def end_trial(self) -> None:
+        """
+        Let another trial through after one that neither succeeded nor failed (rate limited or interrupted)
+        """
+
+        with self._lock:
+            self._trial = False
+
+    def success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial = False
+
+    def failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._trial or (self.opened_at is None and self.failures >= self.threshold):
+                print(f"Warning: {self.failures} requests to the {self.endpoint} endpoint failed in a row. Pausing "
+                      f"requests to it for {self.cooldown:.0f} seconds.")
+                self.opened_at = time.time()
+                self._trial = False
+
+
+def retry_request(request: Callable, endpoint: str, rate_limiter, max_retries: int = None):
+    """
+    Make a request, waiting on the rate limiter before every attempt and retrying failed attempts
+
+    Args:
+        request: function making the request, raising one of RETRYABLE_ERRORS on failures worth retrying
+        endpoint: the rate limit endpoint family of the request
+        rate_limiter: the RateLimiter shared by the pull, holding the retry policy and the circuit breakers
+        max_retries: failed attempts made before giving up, defaults to the rate limiter's retry policy. Rate limit
+            errors are counted separately, against the policy's max_rate_limit_retries
+
+    Returns: the result of request
+
+    Raises: exceptions.MaxRetries once every attempt failed, exceptions.CircuitOpen if the endpoint's circuit is open
+    """
+
+    breaker = rate_limiter.breakers[endpoint]
+    attempts = Counter()
+    while True:
+        trial = breaker.before_request()
+        try:
+            rate_limiter.acquire(endpoint)
+            try:
+                result = request()
+            except RETRYABLE_ERRORS as e:
+                wait = _failed(e, endpoint, attempts, rate_limiter, max_retries)
+            except Exception:
+                # the endpoint answered, the request itself is at fault
+                breaker.success()
+                raise
+            else:
+                breaker.success()
+                return result
+        finally:
+            # success and failure end the trial, anything else (a 429, an interruption) must not leave it pending
+            if trial:
+                breaker.end_trial()
+        time.sleep(wait)
+
+
+async def retry_request_async(request: Callable, endpoint: str, rate_limiter, max_retries: int = None,
+                              retryable: tuple = ()):
+    """
+    Coroutine version of `retry_request`, request being a coroutine function. Errors of the types in retryable are
+    retried too
+    """
+
+    breaker = rate_limiter.breakers[endpoint]
+    attempts = Counter()
+    while True:
+        trial = breaker.before_request()
+        try:
+            await rate_limiter.acquire_async(endpoint)
+            try:
+                result = await request()
+            except RETRYABLE_ERRORS + (RetryableResponse,) + retryable as e:
+                wait = _failed(e, endpoint, attempts, rate_limiter, max_retries)
+            except Exception:
+                breaker.success()
+                raise
+            else:
+                breaker.success()
+                return result
+        finally:
+            if trial:
+                breaker.end_trial()
+        await asyncio.sleep(wait)
+
+
+def _failed(error: Exception, endpoint: str, attempts: Counter, rate_limiter, max_retries: int = None) -> float:
+    """
+    Record a failed attempt in attempts, counting rate limit errors apart from the other failures
+
+    Returns: the seconds to wait before the next attempt
+    """
+
+    policy = rate_limiter.retry_policy
+    status, headers = _error_status(error)
+    if status == 429:
+        # rate limit errors mean the budget is spent, not that the endpoint is degraded
+        attempts['rate_limited'] += 1
+        attempt, limit = attempts['rate_limited'], policy.max_rate_limit_retries
+    else:
+        rate_limiter.breakers[endpoint].failure()
+        attempts['failed'] += 1
+        attempt, limit = attempts['failed'], max_retries or policy.max_retries
+
+    if attempt >= limit:
+        kind = 'rate limited' if status == 429 else 'failed'
+        raise exceptions.MaxRetries(f"{attempt} attempts to call the {endpoint} endpoint {kind}. "
+                                    f"Last error: {error}") from error
+
+    wait = policy.wait(attempt, status, headers)
+    print("Warning:", error)
+    print(f"Sleeping for {wait:.1f} seconds and retrying")
+    return wait
+
+
+def _error_status(error: Exception) -> (int, dict):
+    """
+    Status and headers of the response an error was raised for, None and no headers for connection errors
+    """
+
+    if isinstance(error, RetryableResponse):
+        return error.status, error.headers
+    response = getattr(error, 'response', None)
+    if isinstance(error, tweepy.errors.HTTPException) and response is not None:
+        return response.status_code, response.headers
+    return None, {}
+
+
+def _retry_after(headers) -> float:
+    """
+    Seconds asked for by a Retry-After header, given in seconds or as a date. None without the header. Headers of
+    requests and aiohttp responses are case insensitive
+    """
+
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0., float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0., parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
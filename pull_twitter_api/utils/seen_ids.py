@@ -0,0 +1,160 @@
+"""
+Index of the tweet and user ids already written under an output directory, shared by every run writing there. Each
+table's ids are kept as a sorted int64 array in a .npy file that is memory-mapped rather than loaded, so checking a page
+of ids is a binary search per id touching only a few pages of the file, however many ids the index holds.
+"""
+import fcntl
+import os
+import threading
+
+import numpy as np
+
+SEEN_IDS_DIR = 'seen_ids'
+# what to do with tweets and users that were written by earlier runs
+SEEN_ID_MODES = ('skip', 'mark')
+# lock file held by the run saving the index, so that runs finishing together do not drop each other's ids
+LOCK_FILE = '.lock'
+# ids of the stored index merged with the new ones at a time
+MERGE_CHUNK = 1 << 20
+
+
+class SeenIds:
+    """
+    Ids written by earlier runs, plus those written by the current one (added with `add`, stored by `save`)
+
+    Modes:
+        skip: known tweets and users are dropped from pages before they are parsed
+        mark: they are kept, with a `seen_before` column telling them apart from new ones
+    """
+    TABLES = ('tweets', 'users')
+
+    def __init__(self, directory: str, mode: str = 'skip'):
+        if mode not in SEEN_ID_MODES:
+            raise ValueError(f"mode must be one of {SEEN_ID_MODES}. Received {mode}")
+
+        self.directory = directory
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._stored = {table: self._load(table) for table in self.TABLES}
+        self._pending = {table: set() for table in self.TABLES}
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._stored.values()) + sum(len(ids) for ids in self._pending.values())
+
+    def contains(self, table: str, ids) -> np.ndarray:
+        """
+        Whether each of the ids is known
+
+        Returns: boolean array, in the order of ids
+        """
+
+        ids = np.asarray(ids, dtype=np.int64)
+        stored = self._stored[table]
+        if len(stored):
+            positions = np.minimum(np.searchsorted(stored, ids), len(stored) - 1)
+            known = stored[positions] == ids
+        else:
+            known = np.zeros(len(ids), dtype=bool)
+
+        with self._lock:
+            pending = self._pending[table]
+            if pending:
+                known |= np.fromiter((int(i) in pending for i in ids), dtype=bool, count=len(ids))
+        return known
+
+    def add(self, table: str, ids) -> None:
+        with self._lock:
+            self._pending[table].update(int(i) for i in ids)
+
+    def save(self) -> None:
+        """
+        Merge the ids added by this run into the index files. The files are re-read under an exclusive lock, so ids
+        saved by other runs since this one started are kept (and become known to this one)
+        """
+
+        with self._lock:
+            if not any(self._pending.values()):
+                return
+
+            os.makedirs(self.directory, exist_ok=True)
+            with open(f"{self.directory}/{LOCK_FILE}", 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    for table in self.TABLES:
+                        if self._pending[table]:
+                            self._merge(table)
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # Pages
+
+    def filter_response(self, response, table: str = 'tweets'):
+        """
+        Drop the known records from a page (a tweepy Response or RawResponse) before it is parsed: the data records,
+        kept in `table`, and the included users (and, for user pages, their included pinned tweets)
+        """
+
+        data = self._drop_known(table, response.data)
+        includes = dict(response.includes or {})
+        if includes.get('users'):
+            includes['users'] = self._drop_known('users', includes['users'])
+        if table == 'users' and includes.get('tweets'):
+            includes['tweets'] = self._drop_known('tweets', includes['tweets'])
+
+        return response._replace(data=data, includes=includes)
+
+    def mark(self, table: str, rows: list) -> None:
+        """
+        Set the `seen_before` column of parsed rows
+        """
+
+        if not rows:
+            return
+        known = self.contains(table, [row['id'] for row in rows])
+        for row, seen in zip(rows, known):
+            row['seen_before'] = bool(seen)
+
+    def _drop_known(self, table: str, records):
+        if not records:
+            return records
+        known = self.contains(table, [int(record['id']) for record in records])
+        return [record for record, seen in zip(records, known) if not seen]
+
+    # Files
+
+    def _path(self, table: str) -> str:
+        return f"{self.directory}/{table}.npy"
+
+    def _merge(self, table: str) -> None:
+        """
+        Write the stored ids of table merged with the pending ones to a new file, a chunk of the stored ids at a time,
+        and replace the index file with it. Must be called holding the lock file
+        """
+
+        pending = self._pending[table]
+        new = np.sort(np.fromiter(pending, dtype=np.int64, count=len(pending)))
+        stored = self._load(table)
+        if len(stored):
+            positions = np.minimum(np.searchsorted(stored, new), len(stored) - 1)
+            new = new[stored[positions] != new]
+
+        path = self._path(table)
+        tmp_path = f"{path}.tmp.npy"
+        merged = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int64, shape=(len(stored) + len(new),))
+        # each id lands after the ids of the other array smaller than it
+        for start in range(0, len(stored), MERGE_CHUNK):
+            chunk = stored[start:start + MERGE_CHUNK]
+            merged[start + np.arange(len(chunk)) + np.searchsorted(new, chunk)] = chunk
+        merged[np.arange(len(new)) + np.searchsorted(stored, new)] = new
+        merged.flush()
+        del merged, stored
+
+        os.replace(tmp_path, path)
+        self._stored[table] = self._load(table)
+        self._pending[table] = set()
+
+    def _load(self, table: str) -> np.ndarray:
+        path = self._path(table)
+        if os.path.isfile(path):
+            return np.load(path, mmap_mode='r')
+        return np.empty(0, dtype=np.int64)
@@ -0,0 +1,67 @@
+"""
+Small json files holding state that is carried over between runs (e.g. the newest tweet id pulled for each user).
+"""
+import json
+import os
+import threading
+
+
+class StateFile:
+    """
+    Thread-safe dict backed by a json file. Changes are kept in memory until `save` is called, which replaces the file
+    atomically so that an interrupted run never leaves a truncated state behind. Without a path the state is only kept
+    in memory.
+    """
+
+    def __init__(self, path: str = None):
+        self.path = path
+        self._lock = threading.RLock()
+
+        self._data = {}
+        if path and os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self._data = json.load(f)
+
+    def __contains__(self, key):
+        return str(key) in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self._data.get(str(key), default)
+
+    def set(self, key, value) -> None:
+        with self._lock:
+            self._data[str(key)] = value
+
+    def update(self, values: dict) -> None:
+        with self._lock:
+            self._data.update({str(key): value for key, value in values.items()})
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(str(key), default)
+
+    def items(self):
+        with self._lock:
+            return list(self._data.items())
+
+    def save(self) -> None:
+        """
+        Write the state to disk
+        """
+
+        if not self.path:
+            return
+
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f, indent=1)
+            os.replace(tmp_path, self.path)
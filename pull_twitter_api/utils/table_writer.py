@@ -0,0 +1,558 @@
+"""
+Buffered writers for the output tables (data_tweets, data_users, ...). Each writer keeps its file open for the
+duration of a run and only builds a DataFrame and writes it out once enough rows or bytes have been buffered.
+"""
+import abc
+import csv
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+from contextlib import closing, nullcontext
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+FLUSH_ROWS = 10000
+FLUSH_BYTES = 8 * 1024 * 1024
+ROW_GROUP_SIZE = 50000
+# database shared by the runs writing to an output_dir with save_format 'sqlite'
+SQLITE_FILE = 'data.sqlite'
+
+
+class TableWriter(abc.ABC):
+    """
+    Base writer for a single output table. Rows are buffered with `write` and written to disk by `flush`; the
+    response object owning the writer decides when to flush so that all of its tables stay page-consistent.
+    """
+    # whether flushed rows can be read back if the run is interrupted before the writer is closed
+    DURABLE_FLUSH = True
+
+    def __init__(self,
+                 path: str,
+                 append: bool = True,
+                 flush_rows: int = FLUSH_ROWS,
+                 flush_bytes: int = FLUSH_BYTES):
+        self.path = path
+        self.append = append
+        self.flush_rows = flush_rows
+        self.flush_bytes = flush_bytes
+
+        self._rows = []
+        self._buffered_bytes = 0
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, rows: list) -> None:
+        """
+        Buffer a batch of row dicts
+        """
+
+        if rows:
+            self._rows.extend(rows)
+            # rows of a table share a layout, so the first one is a cheap estimate of the batch size
+            self._buffered_bytes += len(str(rows[0])) * len(rows)
+
+    def write_df(self, df: pd.DataFrame) -> None:
+        """
+        Write a DataFrame straight to disk, together with anything still buffered
+        """
+
+        self.flush()
+        if df is not None and len(df):
+            self._write_df(df)
+
+    def should_flush(self) -> bool:
+        return len(self._rows) >= self.flush_rows or self._buffered_bytes >= self.flush_bytes
+
+    def flush(self) -> None:
+        """
+        Write all buffered rows to disk
+        """
+
+        if self._rows:
+            self._write_df(pd.DataFrame(self._rows))
+            self._rows = []
+            self._buffered_bytes = 0
+        if self._file is not None:
+            self._file.flush()
+
+    def commit(self) -> None:
+        """
+        Called once every writer of a response has been flushed. Writers sharing a transaction commit it here
+        """
+
+        pass
+
+    def transaction(self):
+        """
+        Context held by the response while it flushes and commits a page, so that the writers sharing a transaction
+        with this one (from other responses and threads) do not write into it meanwhile
+        """
+
+        return nullcontext()
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @abc.abstractmethod
+    def _write_df(self, df: pd.DataFrame) -> None:
+        pass
+
+
+class CsvTableWriter(TableWriter):
+    """
+    Writes a quoted csv with a single header row. Later batches are aligned to the header's columns; columns first
+    seen in a later batch (e.g. a field only some tweets have) are added to the header, the rows already written being
+    rewritten with empty values for them.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(CsvTableWriter, self).__init__(*args, **kwargs)
+        self._columns = None
+
+    def _open(self):
+        if self.append and os.path.isfile(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                header = next(csv.reader(f), None)
+            self._columns = header or None
+
+        self._file = open(self.path, 'a' if self.append else 'w', encoding='utf-8')
+
+    def _write_df(self, df: pd.DataFrame) -> None:
+        if self._file is None:
+            self._open()
+
+        if self._columns is None:
+            self._columns = list(df.columns)
+        else:
+            new_columns = [column for column in df.columns if column not in self._columns]
+            if new_columns and self._file.tell():
+                self._add_columns(new_columns)
+            else:
+                self._columns += new_columns
+            df = df.reindex(columns=self._columns)
+
+        df.to_csv(self._file, index=False, quoting=csv.QUOTE_ALL, header=not self._file.tell())
+
+    def _add_columns(self, columns: list) -> None:
+        """
+        Rewrite the file with the columns added to its header, the written rows leaving them empty
+        """
+
+        self._file.close()
+        padding = [''] * len(columns)
+        rewritten = f"{self.path}.tmp"
+        with open(self.path, 'r', newline='', encoding='utf-8') as src, \
+                open(rewritten, 'w', newline='', encoding='utf-8') as dst:
+            reader = csv.reader(src)
+            writer = csv.writer(dst, quoting=csv.QUOTE_ALL, lineterminator='\n')
+            next(reader, None)
+            writer.writerow(self._columns + columns)
+            for row in reader:
+                writer.writerow(row + padding)
+        # the file is only replaced once fully rewritten
+        os.replace(rewritten, self.path)
+
+        self._columns += columns
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+
+class JsonTableWriter(TableWriter):
+    """
+    Writes json lines, one record per row, so that batches can be appended to the same file.
+    """
+
+    def _write_df(self, df: pd.DataFrame) -> None:
+        if self._file is None:
+            self._file = open(self.path, 'a' if self.append else 'w', encoding='utf-8')
+
+        self._file.write(df.to_json(orient='records', lines=True, date_format='iso').rstrip('\n') + '\n')
+
+
+class ParquetTableWriter(TableWriter):
+    """
+    Writes a parquet file, one row group per `row_group_size` rows. The schema is fixed by the first batch so that
+    every row group matches: nested (dict or list) values are stored as json strings, columns that are empty in the
+    first batch are stored as strings, and later batches are aligned and cast to the schema.
+
+    Parquet files can not be appended to, so appending to an existing table writes a new part file next to it
+    (data_tweets.part-1.parquet, ...) with the table's schema, see `table_files`. A file left without its footer by a
+    crashed run can not be read; it is renamed to <file>.corrupt and its rows are pulled again from the checkpoint.
+    """
+    # the file footer is only written on close
+    DURABLE_FLUSH = False
+
+    def __init__(self, *args, row_group_size: int = ROW_GROUP_SIZE, **kwargs):
+        if pa is None:
+            raise ImportError("save_format 'parquet' requires pyarrow. Install it with `pip install pyarrow`.")
+
+        super(ParquetTableWriter, self).__init__(*args, **kwargs)
+        self.row_group_size = row_group_size
+        self.flush_rows = row_group_size
+        self.flush_bytes = math.inf
+
+        self._schema = None
+        self._writer = None
+
+    def flush(self) -> None:
+        """
+        Write out the buffered rows in full row groups. The remainder is written when the writer is closed
+        """
+
+        while len(self._rows) >= self.row_group_size:
+            self._write_df(pd.DataFrame(self._rows[:self.row_group_size]))
+            self._rows = self._rows[self.row_group_size:]
+        self._buffered_bytes = 0
+
+    def close(self) -> None:
+        if self._rows:
+            self._write_df(pd.DataFrame(self._rows))
+            self._rows = []
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+
+    def _open(self, schema):
+        path = self.path
+        if self.append:
+            parts = [part for part in table_files(self.path) if _readable_parquet(part)]
+            if parts:
+                schema = pq.read_schema(parts[-1]).remove_metadata()
+            # the part after the last one written, as a moved file leaves a gap
+            numbers = [number for number, part in _table_parts(self.path)]
+            path = _part_path(self.path, numbers[-1] + 1 if numbers else 0)
+
+        self._schema = schema
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write_df(self, df: pd.DataFrame) -> None:
+        df = df.apply(lambda col: col.map(_nested_to_json) if col.dtype == object else col)
+
+        if self._writer is None:
+            inferred = pa.Schema.from_pandas(df, preserve_index=False).remove_metadata()
+            self._open(pa.schema([pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f
+                                  for f in inferred]))
+
+        df = df.reindex(columns=self._schema.names)
+        table = pa.Table.from_arrays([_to_arrow(df[field.name], field.type) for field in self._schema],
+                                     schema=self._schema)
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+
+
+class _SqliteDatabase:
+    """
+    Connection to a sqlite database shared by the writers of its tables, which may be used from several threads
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.RLock()
+        self.refs = 0
+
+        self.connection = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        # readers do not block the writer, and commits only sync the write-ahead log
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def commit(self) -> None:
+        with self.lock:
+            self.connection.commit()
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def _open_database(path: str) -> _SqliteDatabase:
+    path = os.path.abspath(path)
+    with _databases_lock:
+        if path not in _databases:
+            _databases[path] = _SqliteDatabase(path)
+        _databases[path].refs += 1
+        return _databases[path]
+
+
+def _release_database(database: _SqliteDatabase) -> None:
+    with _databases_lock:
+        database.refs -= 1
+        if database.refs == 0:
+            database.commit()
+            database.connection.close()
+            del _databases[database.path]
+
+
+class SqliteTableWriter(TableWriter):
+    """
+    Upserts rows into one table of a sqlite database. The table's primary key is its natural key (see TABLE_KEYS of
+    the responses), so pulling the same tweets or users again updates their rows instead of adding duplicates, and
+    every run writing to the same database extends the same tables.
+
+    Each flush runs one `executemany` upsert; writers of a database share its connection and their flushed rows are
+    committed together by `commit`, so that auto saving commits one transaction per page. Responses hold the
+    database's lock (see `transaction`) from the first upsert of a page to its commit, so that a commit never
+    includes part of a page written by another thread. Tables are created with the key columns even if the first rows
+    lack them, rows without a key being inserted with a null key. Columns missing from the
+    table are added as they appear, nested (dict or list) values are stored as json strings and timestamps as
+    isoformat strings.
+    """
+
+    def __init__(self, path: str, table: str = None, key: tuple = (), **kwargs):
+        super(SqliteTableWriter, self).__init__(path, **kwargs)
+        # rows are written out on every flush of the response, i.e. once per page when auto saving
+        self.flush_rows = 1
+        self.table = table or os.path.splitext(os.path.basename(path))[0]
+        self.key = tuple(key)
+
+        self._database = _open_database(path)
+        self._columns = None
+        self._primary_key = None
+
+    def flush(self) -> None:
+        if self._rows:
+            self._upsert(self._rows)
+            self._rows = []
+            self._buffered_bytes = 0
+
+    def commit(self) -> None:
+        if self._database is not None:
+            self._database.commit()
+
+    def close(self) -> None:
+        if self._database is None:
+            return
+
+        self.flush()
+        self.commit()
+        _release_database(self._database)
+        self._database = None
+
+    def transaction(self):
+        return self._database.lock if self._database is not None else nullcontext()
+
+    def _write_df(self, df: pd.DataFrame) -> None:
+        with self.transaction():
+            self._upsert(df.to_dict('records'))
+            self.commit()
+
+    def _upsert(self, rows: list) -> None:
+        columns = list(dict.fromkeys(column for row in rows for column in row))
+
+        with self._database.lock:
+            self._create_columns(columns, rows)
+
+            names = ', '.join(_quote(column) for column in columns)
+            values = ', '.join('?' for _ in columns)
+            sql = f"INSERT INTO {_quote(self.table)} ({names}) VALUES ({values})"
+            if self._primary_key:
+                updates = ', '.join(f"{_quote(column)} = excluded.{_quote(column)}"
+                                    for column in columns if column not in self._primary_key)
+                conflict = ', '.join(_quote(column) for column in self._primary_key)
+                sql += f" ON CONFLICT ({conflict}) DO " + (f"UPDATE SET {updates}" if updates else "NOTHING")
+
+            self._database.connection.executemany(
+                sql, [tuple(_to_sqlite(row.get(column)) for column in columns) for row in rows])
+
+    def _create_columns(self, columns: list, rows: list) -> None:
+        connection = self._database.connection
+
+        if self._columns is None:
+            info = connection.execute(f"PRAGMA table_info({_quote(self.table)})").fetchall()
+            if not info:
+                types = {column: _sqlite_type(next((row[column] for row in rows if row.get(column) is not None), None))
+                         for column in columns}
+                definitions = [f"{_quote(column)} {types[column]}" for column in columns]
+                # key columns missing from the first rows get no type, so they store later values as given
+                definitions += [_quote(column) for column in self.key if column not in types]
+                if self.key:
+                    definitions.append(f"PRIMARY KEY ({', '.join(_quote(column) for column in self.key)})")
+                connection.execute(f"CREATE TABLE IF NOT EXISTS {_quote(self.table)} ({', '.join(definitions)})")
+                info = connection.execute(f"PRAGMA table_info({_quote(self.table)})").fetchall()
+
+            # (cid, name, type, notnull, default, pk) rows, pk is the column's position in the primary key
+            self._columns = [column[1] for column in info]
+            self._primary_key = [column[1] for column in sorted(info, key=lambda column: column[5]) if column[5]]
+
+        for column in columns:
+            if column not in self._columns:
+                value = next((row[column] for row in rows if row.get(column) is not None), None)
+                connection.execute(f"ALTER TABLE {_quote(self.table)} ADD COLUMN {_quote(column)} "
+                                   f"{_sqlite_type(value)}")
+                self._columns.append(column)
+
+
+def _quote(name: str) -> str:
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _sqlite_type(value) -> str:
+    if isinstance(value, (bool, int, np.integer)):
+        return 'INTEGER'
+    if isinstance(value, (float, np.floating)):
+        return 'REAL'
+    return 'TEXT'
+
+
+def _to_sqlite(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    if value is None or value is pd.NaT:
+        return None
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, (int, float, str, bytes)):
+        return value
+    return str(value)
+
+
+def _nested_to_json(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, default=str)
+    return value
+
+
+def _to_arrow(series: pd.Series, arrow_type):
+    if pa.types.is_string(arrow_type):
+        series = series.map(lambda v: v if v is None or isinstance(v, str) or (isinstance(v, float) and math.isnan(v))
+                            else str(v))
+    return pa.array(series, type=arrow_type, from_pandas=True)
+
+
+WRITERS = {
+    'csv': CsvTableWriter,
+    'json': JsonTableWriter,
+    'parquet': ParquetTableWriter,
+    'sqlite': SqliteTableWriter,
+}
+
+
+def table_path(output_dir: str, table: str, save_format: str) -> str:
+    """
+    Path a table is saved to: a data_<table>.<save_format> file, or the database holding every table for sqlite
+    """
+
+    if save_format == 'sqlite':
+        return f"{output_dir}/{SQLITE_FILE}"
+    return f"{output_dir}/data_{table}.{save_format}"
+
+
+def table_files(path: str) -> list:
+    """
+    Existing files of the table saved to path: the file itself and, for parquet, the part files written by runs
+    appending to it, in the order they were written
+    """
+
+    return [part for _, part in _table_parts(path)]
+
+
+def _table_parts(path: str) -> list:
+    # (number, path) of the existing files of a table, the file itself being part 0
+    numbers = [0]
+    directory = os.path.dirname(path) or '.'
+    root, ext = os.path.splitext(os.path.basename(path))
+    if ext == '.parquet' and os.path.isdir(directory):
+        for name in os.listdir(directory):
+            match = re.fullmatch(re.escape(root) + r'\.part-(\d+)\.parquet', name)
+            if match:
+                numbers.append(int(match.group(1)))
+    parts = [(number, _part_path(path, number)) for number in sorted(numbers)]
+    return [(number, part) for number, part in parts if os.path.isfile(part)]
+
+
+def _part_path(path: str, number: int) -> str:
+    if not number:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.part-{number}{ext}"
+
+
+def _readable_parquet(path: str) -> bool:
+    """
+    Whether a parquet file has its footer. Files left without one by a crashed run are renamed to <path>.corrupt
+    """
+
+    try:
+        pq.read_metadata(path)
+        return True
+    except (OSError, pa.ArrowInvalid):
+        print(f"Warning: {path} is incomplete, most likely from an interrupted run. Moving it to {path}.corrupt")
+        os.replace(path, f"{path}.corrupt")
+        return False
+
+
+def open_table_writer(path: str, save_format: str, row_group_size: int = None, table: str = None, key: tuple = (),
+                      **kwargs) -> TableWriter:
+    """
+    Create the writer for a table saved in the given format
+
+    Args:
+        path: path of the output file
+        save_format: one of the keys of WRITERS
+        row_group_size: rows per row group of parquet outputs
+        table: name of the table in a sqlite database
+        key: primary key columns of a sqlite table
+        **kwargs: passed on to the writer (append, flush_rows, flush_bytes)
+    """
+
+    if save_format not in WRITERS:
+        raise ValueError(f"save_format must be one of {list(WRITERS)}. Received {save_format}")
+    if save_format == 'parquet' and row_group_size:
+        kwargs['row_group_size'] = row_group_size
+    if save_format == 'sqlite':
+        kwargs.update(table=table, key=key)
+    return WRITERS[save_format](path, **kwargs)
+
+
+def read_table(path: str, columns: list = None, table: str = None) -> pd.DataFrame:
+    """
+    Read an output table back into a DataFrame, loading only the requested columns
+
+    Args:
+        path: path of a data_<table>.<save_format> file, or of a sqlite database. The part files of a parquet table
+            are read too
+        columns: columns to load, all columns if None
+        table: table to read from a sqlite database (tweets, users, media, refs or links)
+    """
+
+    save_format = os.path.splitext(path)[1].lstrip('.')
+    if save_format == 'sqlite':
+        if table is None:
+            raise ValueError("table must be set to read from a sqlite database.")
+        selected = ', '.join(_quote(column) for column in columns) if columns else '*'
+        with closing(sqlite3.connect(path)) as connection:
+            return pd.read_sql_query(f"SELECT {selected} FROM {_quote(table)}", connection)
+    elif save_format == 'parquet':
+        parts = table_files(path)
+        if not parts:
+            raise FileNotFoundError(f"No parquet table found at {path}")
+        return pd.concat([pd.read_parquet(part, columns=columns) for part in parts], ignore_index=True)
+    elif save_format == 'csv':
+        return pd.read_csv(path, usecols=columns)
+    elif save_format == 'json':
+        df = pd.read_json(path, orient='records', lines=True)
+        return df[columns] if columns else df
+    raise ValueError(f"Unknown output format of {path}")
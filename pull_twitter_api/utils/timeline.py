@@ -1,14 +1,15 @@
-import time
 from typing import Union, List, Dict
-import tweepy.errors
 from tweepy.client import Client
 from tweepy.tweet import Tweet
 
-import twitteralchemy as twalc
-
 from . import exceptions
 from .twitter_schema import LookupQueryParams
+from .page_parser import parse_tweet_page
+from .pipeline import PagePipeline
+from .raw_parser import decode_response
 from .pull_twitter_response import TimelineResponse
+from .rate_limit import RateLimiter
+from .retry import retry_request
 
 
 class Timeline:
@@ -19,12 +20,14 @@ class Timeline:
     def __init__(self,
                  tweepy_client: Client,
                  query_params: LookupQueryParams,
-                 ident_type: str):
+                 ident_type: str,
+                 rate_limiter: RateLimiter = None):
 
         # store members
         self.client: Client = tweepy_client
         self.query_params = query_params
         self.ident_type = ident_type
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
 
     def pull(self,
              ident: str,
@@ -35,7 +38,10 @@ class Timeline:
              save_format: str = 'csv',
              full_save=True,
              output_user: bool = False,
-             tweets_per_query: int = 100):
+             tweets_per_query: int = 100,
+             since_id: str = None,
+             user_id: int = None,
+             pipelined: bool = True):
         """
         Lookup the tweets to get updated reaction counts.
 
@@ -46,14 +52,30 @@ class Timeline:
             full_save: whether to save extra tweet information (entities, geo, etc.) or not
             output_user: weather or not to output the user identifier with each tweet
             tweets_per_query: num_tweets the number of database entries processed. Mainly for debugging purposes.
+            since_id: only pull tweets newer than this tweet id
+            user_id: the already resolved user id of a handle, skips the user lookup
+            pipelined: whether to fetch, parse and write pages in separate stages (see PagePipeline) or in one loop
         """
 
+        # Initialize API Response
+        if api_response is None:
+            api_response = TimelineResponse(auto_save=auto_save,
+                                            save_format=save_format,
+                                            output_dir=output_dir)
+
+        # continue from the cursor stored by an interrupted run
+        cursor = api_response.get_cursor(ident) or {}
+        if cursor.get('done'):
+            print(f"Timeline for {self.ident_type} {ident} was already pulled. Skipping.")
+            return api_response
+
         print(f"Pulling timeline for {self.ident_type} {ident}.")
 
         # attempt to get user_id
-        if self.ident_type == 'handle':
+        if self.ident_type == 'handle' and user_id is None:
             try:
-                user_id = self.client.get_user(username=ident).data.id
+                user_id = int(retry_request(lambda: decode_response(self.client.get_user(username=ident)), 'user',
+                                            self.rate_limiter).data['id'])
             except Exception as e:
                 print(f"Failed to get user id for {ident}")
                 raise e
@@ -61,70 +83,68 @@ class Timeline:
             print(f"Successfully retrieved user_id {user_id} for @{ident}.")
         elif self.ident_type == 'author_id':
             user_id = ident
-        else:
+        elif self.ident_type != 'handle':
             raise ValueError(f'type must be one of "handle" or "author_id". Received {self.ident_type}')
 
-        # Initialize API Response
-        if api_response is None:
-            api_response = TimelineResponse(auto_save=auto_save,
-                                            save_format=save_format,
-                                            output_dir=output_dir)
+        # reference table
+        has_refs: bool = 'referenced_tweets' in self.query_params.tweet_fields
 
-        finished = False
-        next_token = None
+        num_pages = cursor.get('pages') or 0
         num_collected = 0
-        while not finished:
-            # Get tweet data from twitter api
-            try:
-                response = self.get_tweets(user_id, next_token=next_token, tweets_per_query=tweets_per_query)
-            except exceptions.EmptyTwitterResponseException as e:
-                print(f"No tweets in the response. Continuing. Exception message: {e}")
-                continue
-            except exceptions.MaxRetries as e:
-                print(f"Max retries exceeded when calling the tweets api. Continuing but may lead to loss of "
-                      f"count data. Exception message: {e}")
-                continue
-
-            # insert tweets into file
-            tweets: List[dict] = response.data
-
-            # includes and expansions extraction
-            includes: List[dict] = twalc.Includes(**(response.includes))
-            ref_tweets, rel_users, inc_media = includes.tweets, includes.users, includes.media
-
-            # reference table
-            has_refs: bool = 'referenced_tweets' in self.query_params.tweet_fields
-
-            if tweets:
-                dict_func = lambda twitter_api_obj: twitter_api_obj.to_full_dict()
-                if not full_save:
-                    dict_func = lambda twitter_api_obj: twitter_api_obj.to_dict()
-
-                # Expansions parsing
-                ref_tweets = [dict_func(tw) for tw in ref_tweets] if ref_tweets else None
-                rel_users = [dict_func(us) for us in rel_users] if rel_users else None
-                media = [dict_func(md) for md in inc_media] if inc_media else None
-                links = Timeline.__parse_tweet_links(tweets) if has_refs else None
-
-                # Original Tweets Parsing
-                tweets = [dict_func(twalc.Tweet(**tw)) for tw in tweets]
-
-                # Update response object
-                api_response.update_data(ident,
-                                         new_links=links,
-                                         new_refs=ref_tweets,
-                                         new_users=rel_users,
-                                         new_tweets=tweets,
-                                         new_media=media)
-
-                num_collected += len(tweets)
-                print(f"\rCollected {num_collected} tweets for {self.ident_type} {ident}", end='')
 
-            # pagination
+        # MaxRetries of a page, raised once the pages before it are written
+        failure = None
+
+        def fetch_pages():
+            nonlocal failure
+            next_token = cursor.get('next_token')
+            while True:
+                # Get tweet data from twitter api
+                try:
+                    response = self.get_tweets(user_id, since_id=since_id, next_token=next_token,
+                                               tweets_per_query=tweets_per_query)
+                except exceptions.EmptyTwitterResponseException as e:
+                    print(f"No tweets in the response. Continuing. Exception message: {e}")
+                    continue
+                except exceptions.MaxRetries as e:
+                    # the cursor is left on the failed page, so that --resume continues from it
+                    failure = e
+                    return
+
+                yield response
+
+                # pagination
+                next_token = response.meta.get('next_token', None)
+                if next_token is None:
+                    return
+
+        def parse_page(response):
+            # tweets and users written by earlier runs are dropped before parsing
+            return parse_tweet_page(api_response.drop_seen(response), has_refs, full_save=full_save)
+
+        def write_page(response, page):
+            nonlocal num_pages, num_collected
+
             next_token = response.meta.get('next_token', None)
-            if next_token is None:
-                finished = True
-                print('\n' + '-' * 30)
+            num_pages += 1
+            api_response.set_cursor(ident, next_token, pages=num_pages, done=next_token is None)
+
+            # update response object
+            if page:
+                api_response.update_data(ident, **page)
+
+                num_collected += len(page['new_tweets'])
+                print(f"\rCollected {num_collected} tweets for {self.ident_type} {ident}", end='')
+
+        pipeline = PagePipeline(fetch_pages(), parse_page, write_page, threaded=pipelined,
+                                metrics=api_response.metrics)
+        pipeline.run()
+        print(f"\nStages: {pipeline.summary()}")
+        print('-' * 30)
+
+        api_response.finish_user(ident)
+        if failure is not None:
+            raise failure
         return api_response
 
     def get_tweets(self, ids: Union[List[Union[int, str]], Union[int, str]],
@@ -144,30 +164,8 @@ class Timeline:
         params['pagination_token'] = next_token
         params['max_results'] = tweets_per_query
 
-        max_retries = 5
-        retries = 0
-        while retries < max_retries:
-            try:
-                return self.client.get_users_tweets(ids, **params)
-            except tweepy.errors.TwitterServerError as e:
-                print("Warning:", e)
-                print("Sleeping for 0.1 seconds and retrying")
-                retries += 1
-                time.sleep(0.1)
-
-    @staticmethod
-    def __parse_tweet_links(tweets: List[Tweet]) -> List[dict]:
-        tweet_links = []
-        for tweet in tweets:
-            if tweet['referenced_tweets'] is not None:
-                for ref in tweet['referenced_tweets']:
-                    new_link = {
-                        'parent_id': tweet['id'],
-                        'id': ref['id'],
-                        'type': ref['type']
-                    }
-                    tweet_links.append(new_link)
-        return tweet_links
+        return retry_request(lambda: decode_response(self.client.get_users_tweets(ids, **params)), 'timeline',
+                             self.rate_limiter)
 
     @staticmethod
     def _get_reaction_counts(tweet: Tweet) -> Dict:
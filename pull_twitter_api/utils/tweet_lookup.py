@@ -1,18 +1,19 @@
 import os.path
 from typing import Union, List, Dict
 import csv
-import time
 
 import pandas as pd
-import tweepy.errors
 from tweepy.client import Client
-from tweepy.tweet import Tweet
-
-import twitteralchemy as twalc
 
 from . import exceptions
 from .twitter_schema import LookupQueryParams
+from .page_parser import parse_tweet_page, submit_tweet_page
+from .pipeline import PagePipeline, ParsePool, QUEUE_SIZE
+from .dead_ids import DeadIdCache
+from .raw_parser import decode_response
 from .pull_twitter_response import PullTwitterResponse, LookupResponse
+from .rate_limit import RateLimiter
+from .retry import retry_request
 
 class TweetLookup:
 	"""
@@ -21,11 +22,13 @@ class TweetLookup:
 
 	def __init__(self,
 				tweepy_client: Client,
-				query_params: LookupQueryParams):
+				query_params: LookupQueryParams,
+				rate_limiter: RateLimiter = None):
 
 		# store members
 		self.client: Client = tweepy_client
 		self.query_params = query_params
+		self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
 
 	def pull(self, 
 		ids: List[str], 
@@ -34,7 +37,10 @@ class TweetLookup:
 		output_dir: str = None, 
 		save_format: str = 'csv', 
 		full_save = True,
-		batch_size: int = 100):
+		batch_size: int = 100,
+		pipelined: bool = True,
+		parse_pool: ParsePool = None,
+		dead_ids: DeadIdCache = None):
 		"""
 		Query tweets based on query string
 
@@ -44,13 +50,22 @@ class TweetLookup:
 			save_format: the file type of the output results (csv or json)
 			full_save: whether to save extra tweet information (entities, geo, etc.) or not
 			auto_save: whether to continually save to disk after each batch
+			pipelined: whether to fetch, parse and write pages in separate stages (see PagePipeline) or in one loop
+			parse_pool: process pool to parse the pages in, instead of the pipeline's parse thread
+			dead_ids: cache of the ids reported as deleted or protected, they are left out of the batches
 		"""
 
 		print(f"Pulling tweet results for {len(ids)} ids.")
 
+		if dead_ids is not None:
+			ids = dead_ids.live('tweets', ids)
+
 
 		id_batches = [ids[i:i + batch_size] for i in range(0, len(ids), batch_size)]
 
+		# reference table
+		has_refs: bool = 'referenced_tweets' in self.query_params.tweet_fields
+
 		num_collected = 0
 
 		# Initialize API Response
@@ -59,61 +74,51 @@ class TweetLookup:
 				save_format = save_format, 
 				output_dir = output_dir)
 
-		for batch in id_batches:
-			
-			# Get tweet data from twitter api
-			try:
-				response = self.lookup_tweets(batch)
-			except exceptions.EmptyTwitterResponseException as e:
-				print(f"No tweets in the response. Continuing. Exception message: {e}")
-				continue
-			except exceptions.MaxRetries as e:
-				print(f"Max retries exceeded when calling the tweets api. Continuing but may lead to loss of "
-							f"count data. Exception message: {e}")
-				continue
-
-			# Start time of request (avoiding api rate limits)
-			start_time_req = time.time()
-
-			# tweets extraction
-			tweets: List[dict] = response.data
-
-			# includes and expansions extraction
-			includes: List[dict] = twalc.Includes(**(response.includes))
-			ref_tweets, rel_users, inc_media = includes.tweets, includes.users, includes.media
-
-			# reference table
-			has_refs: bool = 'referenced_tweets' in self.query_params.tweet_fields
-
-			if tweets:
-				dict_func = lambda twitter_api_obj: twitter_api_obj.to_full_dict()
-				if not full_save:
-					dict_func = lambda twitter_api_obj: twitter_api_obj.to_dict()
-
-				# Expansions parsing
-				ref_tweets = [dict_func(tw) for tw in ref_tweets] if ref_tweets else None
-				rel_users = [dict_func(us) for us in rel_users] if rel_users else None
-				media = [dict_func(md) for md in inc_media] if inc_media else None
-				links = TweetLookup.__parse_tweet_links(tweets) if has_refs else None
-
-				# Original Tweets Parsing
-				tweets = [dict_func(twalc.Tweet(**tw)) for tw in tweets]
-
-				# Update response object
-				api_response.update_data(new_links = links,
-					new_refs = ref_tweets,
-					new_users = rel_users,
-					new_tweets = tweets,
-					new_media = media)
+		def fetch_pages():
+			for batch in id_batches:
+
+				# Get tweet data from twitter api
+				try:
+					response = self.lookup_tweets(batch)
+				except exceptions.EmptyTwitterResponseException as e:
+					print(f"No tweets in the response. Continuing. Exception message: {e}")
+					continue
+				except exceptions.CircuitOpen as e:
+					print(f"The tweets api keeps failing. Stopping, the ids left can be looked up later with "
+						f"--only-missing. Exception message: {e}")
+					return
+				except exceptions.MaxRetries as e:
+					print(f"Max retries exceeded when calling the tweets api. Skipping a batch of {len(batch)} ids. "
+						f"Exception message: {e}")
+					continue
+
+				if dead_ids is not None:
+					dead_ids.record('tweets', response)
+				yield response
+
+		def parse_page(response):
+			# tweets and users written by earlier runs are dropped before parsing
+			response = api_response.drop_seen(response)
+			if parse_pool is not None:
+				return submit_tweet_page(parse_pool, response, has_refs, full_save = full_save)
+			return parse_tweet_page(response, has_refs, full_save = full_save)
+
+		def write_page(response, page):
+			nonlocal num_collected
+
+			# update response object
+			if page:
+				api_response.update_data(**page)
 
 				# update num collection for progress log
-				num_collected += len(tweets)
+				num_collected += len(page['new_tweets'])
 				print(f"\rCollected {num_collected} tweets", end='')
 
-
-			# Request end time to avoiding 1 request/sec rate limit
-			end_time_req = time.time()
-			time.sleep(max(0, 1.1 - (end_time_req-start_time_req)))
+		queue_size = parse_pool.queue_size() if parse_pool is not None else QUEUE_SIZE
+		pipeline = PagePipeline(fetch_pages(), parse_page, write_page, queue_size = queue_size, threaded = pipelined,
+			metrics = api_response.metrics)
+		pipeline.run()
+		print(f"\nStages: {pipeline.summary()}")
 
 		return api_response
 
@@ -125,27 +130,4 @@ class TweetLookup:
 				val = [val]
 			params[key] = val
 
-		max_retries = 5
-		retries = 0
-		while retries < max_retries:
-			try:
-				return self.client.get_tweets(ids, **params)
-			except tweepy.errors.TwitterServerError as e:
-				print("Warning:", e)
-				print("Sleeping for 0.1 seconds and retrying")
-				retries += 1
-				time.sleep(0.1)
-
-	@staticmethod
-	def __parse_tweet_links(tweets: List[Tweet]) -> List[dict]:
-		tweet_links = []
-		for tweet in tweets:
-			if tweet['referenced_tweets'] is not None:
-				for ref in tweet['referenced_tweets']:
-					new_link = {
-						'parent_id': tweet['id'], 
-						'id': ref['id'],
-						'type': ref['type']
-					}
-					tweet_links.append(new_link)
-		return tweet_links
\ No newline at end of file
+		return retry_request(lambda: decode_response(self.client.get_tweets(ids, **params)), 'lookup', self.rate_limiter)
@@ -1,20 +1,20 @@
 import os.path
-import time
+from bisect import bisect_right
 from datetime import datetime
 from typing import Union, List, Dict
 import csv
-import time
 
 import pandas as pd
-import tweepy.errors
 from tweepy.client import Client
-from tweepy.tweet import Tweet
-
-import twitteralchemy as twalc
 
 from . import exceptions
 from .twitter_schema import LookupQueryParams
+from .page_parser import parse_tweet_page, submit_tweet_page
+from .pipeline import PagePipeline, ParsePool, QUEUE_SIZE
+from .raw_parser import decode_response
 from .pull_twitter_response import PullTwitterResponse, SearchResponse
+from .rate_limit import RateLimiter
+from .retry import retry_request
 
 class TweetSearch:
 	"""
@@ -23,11 +23,13 @@ class TweetSearch:
 
 	def __init__(self,
 				tweepy_client: Client,
-				query_params: LookupQueryParams):
+				query_params: LookupQueryParams,
+				rate_limiter: RateLimiter = None):
 
 		# store members
 		self.client: Client = tweepy_client
 		self.query_params = query_params
+		self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
 
 	def pull(self, query:str,
 		api_response: SearchResponse = None,
@@ -38,7 +40,10 @@ class TweetSearch:
 		start_time: Union[datetime, str] = None,
 		end_time: Union[datetime, str] = None,
 		max_results: int = 100,
-		batch_size: int = 100):
+		batch_size: int = 100,
+		cursor_key: str = None,
+		pipelined: bool = True,
+		parse_pool: ParsePool = None):
 
 		"""
 		Query tweets based on query string
@@ -52,6 +57,9 @@ class TweetSearch:
 			start_time: tweets will be searched beginning at this time
 			end_time: tweets will be searched at or before this time
 			max_results: total number of tweets to return for query
+			cursor_key: key of the pagination cursor in the run's checkpoint, the query by default
+			pipelined: whether to fetch, parse and write pages in separate stages (see PagePipeline) or in one loop
+			parse_pool: process pool to parse the pages in, instead of the pipeline's parse thread
 		"""
 
 		print(f"Pulling tweet results using '{query}' search query.")
@@ -60,6 +68,89 @@ class TweetSearch:
 		save_path = f"{output_dir}/data_%s.{save_format}"
 		print(f"Saving tweets to {save_path}")
 
+		batches = TweetSearch.batch_sizes(max_results, batch_size)
+
+		# reference table
+		has_refs: bool = 'referenced_tweets' in self.query_params.tweet_fields
+
+		# Initialize API Response
+		if api_response is None:
+			api_response = SearchResponse(auto_save = auto_save,
+				save_format = save_format,
+				output_dir = output_dir)
+
+		# continue from the cursor stored by an interrupted run
+		if cursor_key is None:
+			cursor_key = query
+		cursor = api_response.get_cursor(cursor_key) or {}
+		if cursor.get('done'):
+			print(f"Results for query '{query}' were already pulled. Skipping.")
+			return api_response
+
+		num_pages = cursor.get('pages') or 0
+		num_collected = 0
+
+		def fetch_pages():
+			next_token = cursor.get('next_token')
+			for batch in batches[num_pages:]:
+
+				# Get tweet data from twitter api
+				try:
+					response = self.search_tweets(query, start_time = start_time, end_time = end_time, max_results = batch, next_token=next_token)
+				except exceptions.EmptyTwitterResponseException as e:
+					print(f"No tweets in the response. Continuing. Exception message: {e}")
+					continue
+				except exceptions.MaxRetries as e:
+					# the cursor is left on the failed page, so that --resume continues from it
+					print(f"Max retries exceeded when calling the search api. Stopping the query. Exception "
+						f"message: {e}")
+					return
+
+				yield response
+
+				# pagination
+				next_token = response.meta.get('next_token', None)
+				if next_token is None:
+					return
+
+		def parse_page(response):
+			# tweets and users written by earlier runs are dropped before parsing
+			response = api_response.drop_seen(response)
+			if parse_pool is not None:
+				return submit_tweet_page(parse_pool, response, has_refs, full_save = full_save)
+			return parse_tweet_page(response, has_refs, full_save = full_save)
+
+		def write_page(response, page):
+			nonlocal num_pages, num_collected
+
+			next_token = response.meta.get('next_token', None)
+			num_pages += 1
+			api_response.set_cursor(cursor_key, next_token, pages = num_pages,
+				done = next_token is None or num_pages == len(batches))
+
+			# update response object
+			if page:
+				api_response.update_data(**page)
+
+				# update num collection for progress log
+				num_collected += len(page['new_tweets'])
+				print(f"\rCollected {num_collected} tweets for query: {query}", end='')
+
+		queue_size = parse_pool.queue_size() if parse_pool is not None else QUEUE_SIZE
+		pipeline = PagePipeline(fetch_pages(), parse_page, write_page, queue_size = queue_size, threaded = pipelined,
+			metrics = api_response.metrics)
+		pipeline.run()
+		print(f"\nStages: {pipeline.summary()}")
+		print('-'*30)
+
+		return api_response
+
+	@staticmethod
+	def batch_sizes(max_results: int, batch_size: int) -> List[int]:
+		"""
+		Split max_results into the max_results of each request, keeping every request at or above the api minimum of 10
+		"""
+
 		num_batches = (max_results//batch_size) + 1
 		batches = [batch_size] * num_batches
 		last_batch_size = max_results % batch_size
@@ -69,79 +160,79 @@ class TweetSearch:
 				batches[-2] = batch_size - (10 - last_batch_size)
 		else:
 			batches[-1] = last_batch_size
-		
 
-		next_token = None
-		num_collected = 0
+		return batches
 
-		# Initialize API Response
-		if api_response is None:
-			api_response = SearchResponse(auto_save = auto_save,
-				save_format = save_format,
-				output_dir = output_dir)
+	def count_tweets(self, query: str,
+					start_time: datetime,
+					end_time: datetime,
+					granularity: str = 'day') -> List[dict]:
+		"""
+		Number of tweets matching the query in each hour or day between start_time and end_time
 
-		for batch in batches:
-			
-			# Get tweet data from twitter api
-			try:
-				response = self.search_tweets(query, start_time = start_time, end_time = end_time, max_results = batch, next_token=next_token)
-			except exceptions.EmptyTwitterResponseException as e:
-				print(f"No tweets in the response. Continuing. Exception message: {e}")
-				continue
-			except exceptions.MaxRetries as e:
-				print(f"Max retries exceeded when calling the tweets api. Continuing but may lead to loss of "
-							f"count data. Exception message: {e}")
-				continue
-
-			# Start time of request (avoiding api rate limits)
-			start_time_req = time.time()
-
-			# tweets extraction
-			tweets: List[dict] = response.data
-
-			# includes and expansions extraction
-			includes: List[dict] = twalc.Includes(**(response.includes))
-			ref_tweets, rel_users, inc_media = includes.tweets, includes.users, includes.media
-
-			# reference table
-			has_refs: bool = 'referenced_tweets' in self.query_params.tweet_fields
-
-			if tweets:
-				dict_func = lambda twitter_api_obj: twitter_api_obj.to_full_dict()
-				if not full_save:
-					dict_func = lambda twitter_api_obj: twitter_api_obj.to_dict()
-
-				# Expansions parsing
-				ref_tweets = [dict_func(tw) for tw in ref_tweets] if ref_tweets else None
-				rel_users = [dict_func(us) for us in rel_users] if rel_users else None
-				media = [dict_func(md) for md in inc_media] if inc_media else None
-				links = TweetSearch.__parse_tweet_links(tweets) if has_refs else None
-
-				# Original Tweets Parsing
-				tweets = [dict_func(twalc.Tweet(**tw)) for tw in tweets]
-
-				# Update response object
-				api_response.update_data(new_links = links,
-					new_refs = ref_tweets,
-					new_users = rel_users,
-					new_tweets = tweets,
-					new_media = media)
+		Returns: list of {'start', 'end', 'tweet_count'} dicts
+		"""
 
-				# update num collection for progress log
-				num_collected += len(tweets)
-				print(f"\rCollected {num_collected} tweets for query: {query}", end='')
+		buckets = []
+		next_token = None
+		while True:
+			response = retry_request(lambda: decode_response(self.client.get_all_tweets_count(query,
+				start_time = start_time, end_time = end_time, granularity = granularity, next_token = next_token)),
+				'counts', self.rate_limiter)
+			buckets.extend(response.data or [])
 
-			# pagination
 			next_token = response.meta.get('next_token', None)
 			if next_token is None:
-				print('\n' + '-'*30)
-				break
+				return buckets
 
-			# Request end time to avoiding 1 request/sec rate limit
-			end_time_req = time.time()
-			time.sleep(max(0, 1.0 - (end_time_req-start_time_req)))
+	@staticmethod
+	def balanced_windows(buckets: List[dict], start_time: datetime, end_time: datetime, num_shards: int) -> List[tuple]:
+		"""
+		Split [start_time, end_time) into at most num_shards consecutive windows holding a similar number of tweets
 
-		return api_response
+		Args:
+			buckets: tweet counts of the period, as returned by count_tweets
+			start_time: start of the period (naive utc)
+			end_time: end of the period (naive utc)
+			num_shards: number of windows to split the period into
+
+		Returns: list of (start, end) tuples
+		"""
+
+		buckets = sorted(buckets, key = lambda bucket: bucket['start'])
+		total = sum(bucket['tweet_count'] for bucket in buckets)
+		if not total:
+			# nothing to balance, split the span evenly
+			step = (end_time - start_time) / num_shards
+			cuts = [start_time + step * i for i in range(1, num_shards)]
+		else:
+			# cut at the end of the bucket where the running count crosses each multiple of total / num_shards
+			cuts = []
+			running = 0
+			for bucket in buckets:
+				running += bucket['tweet_count']
+				while len(cuts) < num_shards - 1 and running >= total * (len(cuts) + 1) / num_shards:
+					cuts.append(_parse_api_time(bucket['end']))
+
+		bounds = [start_time] + sorted(set(cut for cut in cuts if start_time < cut < end_time)) + [end_time]
+		return list(zip(bounds[:-1], bounds[1:]))
+
+	@staticmethod
+	def window_counts(buckets: List[dict], windows: List[tuple]) -> List[int]:
+		"""
+		Number of tweets in each of the windows returned by balanced_windows, from the counts of the buckets starting
+		in it
+
+		Returns: list of counts, in the order of windows
+		"""
+
+		starts = [start for start, _ in windows]
+		counts = [0] * len(windows)
+		for bucket in buckets:
+			# windows are cut at bucket ends, so every bucket falls in one window
+			ix = max(bisect_right(starts, _parse_api_time(bucket['start'])) - 1, 0)
+			counts[ix] += bucket['tweet_count']
+		return counts
 
 	def search_tweets(self, query: str, 
 					start_time: Union[datetime, str] = None, 
@@ -164,27 +255,10 @@ class TweetSearch:
 		params['next_token'] = next_token
 		params['max_results'] = max_results
 
-		max_retries = 5
-		retries = 0
-		while retries < max_retries:
-			try:
-				return self.client.search_all_tweets(query, **params)
-			except tweepy.errors.TwitterServerError as e:
-				print("Warning:", e)
-				print("Sleeping for 0.1 seconds and retrying")
-				retries += 1
-				time.sleep(0.1)
+		return retry_request(lambda: decode_response(self.client.search_all_tweets(query, **params)), 'search',
+			self.rate_limiter)
 
-	@staticmethod
-	def __parse_tweet_links(tweets: List[Tweet]) -> List[dict]:
-		tweet_links = []
-		for tweet in tweets:
-			if tweet['referenced_tweets'] is not None:
-				for ref in tweet['referenced_tweets']:
-					new_link = {
-						'parent_id': tweet['id'], 
-						'id': ref['id'],
-						'type': ref['type']
-					}
-					tweet_links.append(new_link)
-		return tweet_links
\ No newline at end of file
+
+def _parse_api_time(timestamp: str) -> datetime:
+	# api timestamps are utc, e.g. 2021-08-19T00:00:00.000Z
+	return datetime.strptime(timestamp, "%Y-%m-%dT%H:%M:%S.%fZ")
@@ -1,21 +1,22 @@
 import os.path
-import time
 from datetime import datetime
 from typing import Union, List, Dict
 import csv
 
 import pandas as pd
-import tweepy.errors
 from tweepy.client import Client
 from tweepy.tweet import Tweet
 
-import twitteralchemy as twalc
-
 # from utils import exceptions
 # from utils.twitter_schema import LookupQueryParams
 from . import exceptions
 from .twitter_schema import LookupQueryParams
+from .page_parser import parse_user_page
+from .raw_parser import decode_response
+from .dead_ids import DeadIdCache
 from .pull_twitter_response import PullTwitterResponse, UserResponse
+from .rate_limit import RateLimiter
+from .retry import retry_request
 
 
 class User:
@@ -25,12 +26,14 @@ class User:
     def __init__(self,
                  tweepy_client: Client,
                  query_params: LookupQueryParams,
-                 ident_type: str):
+                 ident_type: str,
+                 rate_limiter: RateLimiter = None):
 
         # store members
         self.client: Client = tweepy_client
         self.query_params = query_params
         self.ident_type = ident_type
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
 
     def pull(self, 
         ident: Union[List[str], str],
@@ -39,7 +42,8 @@ class User:
         output_dir: str = None, 
         save_format: str = 'csv', 
         full_save = True,
-        batch_size: int = 100):
+        batch_size: int = 100,
+        dead_ids: DeadIdCache = None):
         """
         Lookup the users to get updated follower counts.
         Args:
@@ -48,10 +52,15 @@ class User:
             save_format: file type to save results as (currently "csv" and "json" are supported)
             full_save: whether to save extra tweet information (entities, geo, etc.) or not
             batch_size: number of handles to include in each request.  Maximum for twitter api is 100
+            dead_ids: cache of the users reported as suspended or not found, they are left out of the batches
         """
 
         print(f"Pulling user information from given handles")
 
+        dead_kind = 'usernames' if self.ident_type == 'handle' else 'user_ids'
+        if dead_ids is not None:
+            ident = dead_ids.live(dead_kind, ident)
+
         ident_batches = [ident[i:i + batch_size] for i in range(0, len(ident), batch_size)]
         num_collected = 0
 
@@ -61,35 +70,33 @@ class User:
                 save_format = save_format,
                 output_dir = output_dir)
 
+        metrics = api_response.metrics
         for ident_batch in ident_batches:
             try:
-                response = self.get_users_data(ident_batch)
+                with metrics.timed('fetch'):
+                    response = self.get_users_data(ident_batch)
             except exceptions.EmptyTwitterResponseException as e:
                 print(f"No tweets in the response. Continuing. Exception message: {e}")
                 continue
+            except exceptions.CircuitOpen as e:
+                print(f"The users api keeps failing. Stopping. Exception message: {e}")
+                break
             except exceptions.MaxRetries as e:
-                print(f"Max retries exceeded when calling the tweets api. Continuing but may lead to loss of "
-                      f"count data. Exception message: {e}")
+                print(f"Max retries exceeded when calling the users api. Skipping a batch of {len(ident_batch)} "
+                      f"users. Exception message: {e}")
                 continue
 
-            # users extraction
-            users: List[dict] = response.data
-
-            # includes and expansions extraction
-            includes: List[dict] = twalc.Includes(**(response.includes))
-            ref_tweets = includes.tweets
-
-            if users:
-                dict_func = lambda twitter_api_obj: twitter_api_obj.to_full_dict()
-                if not full_save:
-                    dict_func = lambda twitter_api_obj: twitter_api_obj.to_dict()
+            if dead_ids is not None:
+                dead_ids.record(dead_kind, response)
 
-                users = [dict_func(twalc.User(**user_dict)) for user_dict in users]
-                tweets = [dict_func(tw) for tw in ref_tweets] if ref_tweets else None
+            # parse the page and update response object, skipping users written by earlier runs
+            with metrics.timed('parse'):
+                page = parse_user_page(api_response.drop_seen(response, table='users'), full_save=full_save)
+            if page:
+                with metrics.timed('write'):
+                    api_response.update_data(**page)
 
-                api_response.update_data(new_users = users, new_tweets = tweets)
-
-                num_collected += len(users)
+                num_collected += len(page['new_users'])
                 print(f"\rCollected {num_collected} users", end='')
         return api_response
 
@@ -102,18 +109,12 @@ class User:
                 val = [val]
             params[key] = val
 
-        max_retries = 5
-        retries = 0
-        while retries < max_retries:
-            try:
-                if self.ident_type == 'handle':
-                    return self.client.get_users(usernames=ident, **params)
-                elif self.ident_type == 'author_id':
-                    return self.client.get_users(ids=ident, **params)
-                else:
-                    raise ValueError(f'type must be one of "handle" or "author_id". Received {self.ident_type}.')
-            except tweepy.errors.TwitterServerError as e:
-                print("Warning:", e)
-                print("Sleeping for 0.1 seconds and retrying")
-                retries += 1
-                time.sleep(0.1)
+        if self.ident_type == 'handle':
+            ident_kwargs = {'usernames': ident}
+        elif self.ident_type == 'author_id':
+            ident_kwargs = {'ids': ident}
+        else:
+            raise ValueError(f'type must be one of "handle" or "author_id". Received {self.ident_type}.')
+
+        return retry_request(lambda: decode_response(self.client.get_users(**ident_kwargs, **params)), 'users',
+                             self.rate_limiter)
@@ -0,0 +1,137 @@
+"""
+Resolution of user handles to user ids. Handles are looked up 100 at a time with the users endpoint instead of one
+user lookup per handle, and the results are cached on disk so that later runs over the same handles skip the lookup.
+"""
+import time
+from typing import Dict, List
+
+from tweepy.client import Client
+
+from .rate_limit import RateLimiter
+from .raw_parser import decode_response
+from .retry import retry_request
+from .state_file import StateFile
+
+# seconds a resolved handle is trusted for, handles can be renamed or taken over by another account
+USER_ID_TTL = 7 * 24 * 60 * 60
+# maximum usernames per request allowed by the users endpoint
+BATCH_SIZE = 100
+
+
+class UserIdCache:
+    """
+    Handle to user id mapping stored in a json file, entries expire after `ttl` seconds
+    """
+
+    def __init__(self, path: str = None, ttl: float = USER_ID_TTL):
+        self.ttl = ttl
+        self.state = StateFile(path)
+
+    def get(self, handle: str):
+        """
+        Return the cached user id of a handle, None if it is unknown or expired
+        """
+
+        entry = self.state.get(_cache_key(handle))
+        if entry is None or time.time() - entry['resolved_at'] > self.ttl:
+            return None
+        return entry['id']
+
+    def set(self, handle: str, user_id) -> None:
+        self.state.set(_cache_key(handle), {'id': user_id, 'resolved_at': time.time()})
+
+    def save(self) -> None:
+        self.state.save()
+
+
+def _cache_key(handle: str) -> str:
+    # handles are case insensitive
+    return str(handle).lstrip('@').lower()
+
+
+def _split_cached(handles: List[str], cache: UserIdCache):
+    user_ids = {}
+    missing = {}
+    for handle in handles:
+        user_id = cache.get(handle)
+        if user_id is not None:
+            user_ids[handle] = user_id
+        else:
+            missing[handle] = None
+    missing = list(missing)
+
+    if missing:
+        print(f"Resolving user ids of {len(missing)} handles ({len(user_ids)} cached).")
+    return user_ids, missing
+
+
+def _add_resolved(batch: List[str], response, user_ids: dict, cache: UserIdCache) -> None:
+    resolved = {_cache_key(user['username']): int(user['id']) for user in response.data or []}
+    for handle in batch:
+        if _cache_key(handle) in resolved:
+            user_ids[handle] = resolved[_cache_key(handle)]
+            cache.set(handle, user_ids[handle])
+
+
+def resolve_handles(client: Client,
+                    handles: List[str],
+                    rate_limiter: RateLimiter = None,
+                    cache: UserIdCache = None,
+                    batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Resolve handles to user ids, requesting only those missing from the cache.
+
+    Args:
+        client: the tweepy client
+        handles: the handles to resolve
+        rate_limiter: limiter the users endpoint requests are paced with
+        cache: cache of earlier resolutions, updated with the new ones
+        batch_size: number of handles per request
+
+    Returns: dict of user id by handle. Handles that could not be resolved are left out
+    """
+
+    if cache is None:
+        cache = UserIdCache()
+    if rate_limiter is None:
+        rate_limiter = RateLimiter()
+    user_ids, missing = _split_cached(handles, cache)
+
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        usernames = [_cache_key(handle) for handle in batch]
+        try:
+            response = retry_request(lambda: decode_response(client.get_users(usernames=usernames)), 'users',
+                                     rate_limiter)
+        except Exception as e:
+            print("Failed to resolve a batch of handles. Error: ", e)
+            continue
+        _add_resolved(batch, response, user_ids, cache)
+
+    cache.save()
+    return user_ids
+
+
+async def resolve_handles_async(client,
+                                handles: List[str],
+                                cache: UserIdCache = None,
+                                batch_size: int = BATCH_SIZE) -> Dict[str, int]:
+    """
+    Coroutine version of `resolve_handles` for the AsyncClient, which paces requests itself
+    """
+
+    if cache is None:
+        cache = UserIdCache()
+    user_ids, missing = _split_cached(handles, cache)
+
+    for i in range(0, len(missing), batch_size):
+        batch = missing[i:i + batch_size]
+        try:
+            response = await client.get_users(usernames=[_cache_key(handle) for handle in batch])
+        except Exception as e:
+            print("Failed to resolve a batch of handles. Error: ", e)
+            continue
+        _add_resolved(batch, response, user_ids, cache)
+
+    cache.save()
+    return user_ids
@@ -0,0 +1,32 @@
+import pytest
+
+from pull_twitter_api.utils import rate_limit, retry
+
+
+class FakeClock:
+    """
+    Stands in for the time module of rate_limit.py and retry.py: sleeping advances the clock instead of waiting
+    """
+
+    def __init__(self, now: float = 1600000000.):
+        self.now = now
+        self.sleeps = []
+
+    def time(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    async def async_sleep(self, seconds: float) -> None:
+        self.sleep(seconds)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(rate_limit, 'time', clock)
+    monkeypatch.setattr(retry, 'time', clock)
+    monkeypatch.setattr(rate_limit.asyncio, 'sleep', clock.async_sleep)
+    return clock
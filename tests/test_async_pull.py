@@ -0,0 +1,114 @@
+import asyncio
+import warnings
+
+from pull_twitter_api.utils.async_pull import _gather_in_order
+
+
+class Requests:
+    """
+    Coroutines finishing when released, recording how many are in flight
+    """
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.started = []
+        self.cancelled = []
+        self.released = {}
+
+    async def request(self, i, error: Exception = None):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.started.append(i)
+        self.released[i] = asyncio.Event()
+        try:
+            await self.released[i].wait()
+        except asyncio.CancelledError:
+            self.cancelled.append(i)
+            raise
+        finally:
+            self.in_flight -= 1
+        if error is not None:
+            raise error
+        return i
+
+    async def release(self, i):
+        while i not in self.released:
+            await asyncio.sleep(0)
+        self.released[i].set()
+
+
+async def collect(results, count):
+    collected = []
+    async for result in results:
+        collected.append(result)
+        if len(collected) == count:
+            break
+    return collected
+
+
+def test_results_come_in_submission_order():
+    async def main():
+        requests = Requests()
+        results = _gather_in_order([requests.request(i) for i in range(5)], 5)
+        collecting = asyncio.ensure_future(collect(results, 5))
+        for i in reversed(range(5)):
+            await requests.release(i)
+        return await collecting
+
+    assert asyncio.run(main()) == [0, 1, 2, 3, 4]
+
+
+def test_a_slow_coroutine_only_holds_up_its_own_slot():
+    async def main():
+        requests = Requests()
+        results = _gather_in_order([requests.request(i) for i in range(6)], 2)
+        collecting = asyncio.ensure_future(collect(results, 6))
+
+        # while the first request hangs, the others go through the second slot one after another
+        for i in range(1, 6):
+            await requests.release(i)
+        await asyncio.sleep(0)
+        started = list(requests.started)
+        await requests.release(0)
+        return started, await collecting, requests.max_in_flight
+
+    started, collected, max_in_flight = asyncio.run(main())
+    assert started == [0, 1, 2, 3, 4, 5]
+    assert collected == [0, 1, 2, 3, 4, 5]
+    assert max_in_flight == 2
+
+
+def test_exceptions_are_yielded_in_place():
+    async def main():
+        requests = Requests()
+        error = ValueError('failed')
+        results = _gather_in_order([requests.request(0), requests.request(1, error), requests.request(2)], 3)
+        collecting = asyncio.ensure_future(collect(results, 3))
+        for i in range(3):
+            await requests.release(i)
+        return error, await collecting
+
+    error, collected = asyncio.run(main())
+    assert collected == [0, error, 2]
+
+
+def test_closing_cancels_the_coroutines_left():
+    async def main():
+        requests = Requests()
+        results = _gather_in_order([requests.request(i) for i in range(10)], 3)
+        collecting = asyncio.ensure_future(collect(results, 1))
+        await requests.release(0)
+        collected = await collecting
+        await results.aclose()
+        return requests, collected
+
+    with warnings.catch_warnings():
+        # coroutines that never started are closed, not left unawaited
+        warnings.simplefilter('error', RuntimeWarning)
+        requests, collected = asyncio.run(main())
+
+    assert collected == [0]
+    assert sorted(requests.cancelled) == [1, 2, 3]
+    assert requests.started == [0, 1, 2, 3]
+    assert requests.in_flight == 0
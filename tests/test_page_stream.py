@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+
+from pull_twitter_api.utils.page_stream import iter_pages, StreamClosed
+
+
+class Pull:
+    """
+    Pull passing count pages to the response, then raising error if set
+    """
+
+    def __init__(self, count: int, error: Exception = None):
+        self.count = count
+        self.error = error
+        self.put = 0
+        self.stopped_by = None
+        self.done = threading.Event()
+
+    def __call__(self, response):
+        try:
+            for page in range(self.count):
+                response.update_data(new_tweets=[{'id': str(page)}])
+                self.put += 1
+            if self.error is not None:
+                raise self.error
+        except BaseException as e:
+            self.stopped_by = e
+            raise
+        finally:
+            self.done.set()
+
+
+def test_pages_are_yielded_in_order():
+    pages = list(iter_pages(Pull(10), max_pages=2))
+
+    assert [page.tweets[0]['id'] for page in pages] == [str(page) for page in range(10)]
+    assert pages[0].to_df('tweets') is not None
+    assert pages[0].to_df('users') is None
+
+
+def test_pull_errors_are_raised_after_the_pages_before_them():
+    ids = []
+    with pytest.raises(ValueError, match='page 3'):
+        for page in iter_pages(Pull(3, ValueError('page 3'))):
+            ids.append(page.tweets[0]['id'])
+    assert ids == ['0', '1', '2']
+
+
+def test_stopping_early_stops_the_pull():
+    pull = Pull(1000)
+    pages = iter_pages(pull, max_pages=2)
+    for i, page in enumerate(pages):
+        if i == 4:
+            break
+    pages.close()
+
+    assert pull.done.wait(5)
+    assert isinstance(pull.stopped_by, StreamClosed)
+    # the pull gets at most the queue and the page it was putting ahead of the caller
+    assert pull.put <= 5 + 2 + 1
@@ -0,0 +1,204 @@
+import json
+import threading
+
+import pytest
+import tweepy.errors
+
+from pull_twitter_api.utils.page_parser import parse_tweet_page, submit_tweet_page
+from pull_twitter_api.utils.pipeline import PagePipeline, ParsePool, QUEUE_SIZE
+from pull_twitter_api.utils.pull_twitter_response import CHECKPOINT_FILE, SearchResponse
+from pull_twitter_api.utils.raw_parser import RawResponse
+from pull_twitter_api.utils.rate_limit import RateLimiter
+from pull_twitter_api.utils.retry import RetryPolicy
+from pull_twitter_api.utils.table_writer import read_table
+from pull_twitter_api.utils.twitter_schema import LookupQueryParams
+from pull_twitter_api.utils.tweet_search import TweetSearch
+
+from .test_retry import server_error
+
+
+def fetch(count: int, error: BaseException = None, fetched: list = None):
+    """
+    Pages 0 to count - 1, then error if set
+    """
+
+    for page in range(count):
+        if fetched is not None:
+            fetched.append(page)
+        yield page
+    if error is not None:
+        raise error
+
+
+def stage_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread is not threading.main_thread()]
+
+
+@pytest.mark.parametrize('threaded', [True, False])
+def test_pages_are_written_in_order(threaded):
+    written = []
+
+    stats = PagePipeline(fetch(20), lambda page: page * 2, lambda page, rows: written.append((page, rows)),
+                         threaded=threaded).run()
+    assert written == [(page, page * 2) for page in range(20)]
+    assert [stats[stage].items for stage in PagePipeline.STAGES] == [20, 20, 20]
+
+
+def test_fetch_error_stops_the_pipeline():
+    threads = stage_threads()
+    written = []
+
+    with pytest.raises(ValueError, match='page 5'):
+        PagePipeline(fetch(5, ValueError('page 5')), lambda page: page,
+                     lambda page, rows: written.append(page)).run()
+    # pages still in the queues may be dropped, but never written out of order
+    assert written == list(range(len(written)))
+    assert stage_threads() == threads
+
+
+def test_write_error_stops_fetching():
+    threads = stage_threads()
+    fetched = []
+
+    def write(page, rows):
+        if page == 3:
+            raise OSError('disk full')
+
+    with pytest.raises(OSError):
+        PagePipeline(fetch(1000, fetched=fetched), lambda page: page, write).run()
+    # at most the pages held by the queues and the stages are fetched past the failed one
+    assert len(fetched) <= 4 + 2 * QUEUE_SIZE + 2
+    assert stage_threads() == threads
+
+
+def test_parse_error_stops_the_pipeline():
+    threads = stage_threads()
+    fetched, written = [], []
+
+    def parse(page):
+        if page == 2:
+            raise KeyError(page)
+        return page
+
+    with pytest.raises(KeyError):
+        PagePipeline(fetch(1000, fetched=fetched), parse, lambda page, rows: written.append(page)).run()
+    assert written in ([], [0], [0, 1])
+    assert len(fetched) <= 3 + QUEUE_SIZE + 1
+    assert stage_threads() == threads
+
+
+# Pages of a search
+
+
+def tweet(tweet_id: int) -> dict:
+    return {'id': str(tweet_id), 'text': f"tweet {tweet_id}", 'author_id': '10'}
+
+
+def search_page(page: int, last: int) -> RawResponse:
+    meta = {'result_count': 10}
+    if page < last:
+        meta['next_token'] = f"token {page + 1}"
+    return RawResponse([tweet(page * 10 + i) for i in range(10)], {'users': [{'id': '10', 'name': 'a',
+                                                                               'username': 'a'}]}, [], meta)
+
+
+class SearchClient:
+    """
+    Client serving pages 0 to last, raising error instead of the page numbered fail
+    """
+
+    def __init__(self, last: int, fail: int = None, error: Exception = None):
+        self.last = last
+        self.fail = fail
+        self.error = error
+        self.requested = []
+
+    def search_all_tweets(self, query, next_token=None, **params):
+        page = int(next_token.split()[-1]) if next_token else 0
+        self.requested.append(page)
+        if page == self.fail:
+            raise self.error
+        return search_page(page, self.last)
+
+
+def search(tmp_path, client: SearchClient, parse_pool: ParsePool = None) -> SearchResponse:
+    response = SearchResponse(auto_save=True, resume_dir=str(tmp_path), flush_rows=10)
+    limiter = RateLimiter(retry_policy=RetryPolicy(max_retries=1), min_intervals={'search': 0.})
+    try:
+        TweetSearch(client, LookupQueryParams(), rate_limiter=limiter).pull(
+            'query', api_response=response, max_results=100, batch_size=10, parse_pool=parse_pool)
+    finally:
+        response.close()
+    return response
+
+
+def stored_ids(tmp_path) -> list:
+    return [int(tweet_id) for tweet_id in read_table(str(tmp_path / 'data_tweets.csv'), columns=['id'])['id']]
+
+
+def cursor(tmp_path) -> dict:
+    return json.loads((tmp_path / CHECKPOINT_FILE).read_text())['query']
+
+
+def assert_cursor_matches_the_rows(tmp_path) -> int:
+    """
+    The pages written are a prefix of the search, and the cursor points at the first page not written
+
+    Returns: the pages written
+    """
+
+    pages = cursor(tmp_path)['pages']
+    assert stored_ids(tmp_path) == list(range(pages * 10))
+    assert cursor(tmp_path)['next_token'] == f"token {pages}"
+    return pages
+
+
+def test_cursor_stays_on_the_failed_page_and_resumes_from_it(tmp_path):
+    search(tmp_path, SearchClient(last=9, fail=4, error=server_error()))
+
+    assert stored_ids(tmp_path) == list(range(40))
+    assert cursor(tmp_path) == {'next_token': 'token 4', 'pages': 4, 'done': False}
+
+    client = SearchClient(last=9)
+    search(tmp_path, client)
+    assert client.requested == [4, 5, 6, 7, 8, 9]
+    assert stored_ids(tmp_path) == list(range(100))
+    assert cursor(tmp_path)['done']
+
+
+def test_cursor_is_not_committed_past_the_rows_written_before_an_error(tmp_path):
+    error = tweepy.errors.Unauthorized(server_error().response)
+    with pytest.raises(tweepy.errors.Unauthorized):
+        search(tmp_path, SearchClient(last=9, fail=6, error=error))
+    # pages fetched before the error may be dropped with their cursors
+    pages = assert_cursor_matches_the_rows(tmp_path)
+    assert pages <= 6
+
+    client = SearchClient(last=9)
+    search(tmp_path, client)
+    assert client.requested == list(range(pages, 10))
+    assert stored_ids(tmp_path) == list(range(100))
+
+
+def test_parse_pool_parses_pages_like_the_parse_stage(tmp_path):
+    pages = [search_page(page, 3) for page in range(4)]
+    expected = [parse_tweet_page(page, has_refs=False) for page in pages]
+
+    with ParsePool(2) as pool:
+        parsed = []
+        PagePipeline(iter(pages), lambda page: submit_tweet_page(pool, page, has_refs=False),
+                     lambda page, rows: parsed.append(rows), queue_size=pool.queue_size()).run()
+        assert parsed == expected
+
+        # errors raised in the workers come back through the write stage
+        broken = pages[:1] + [RawResponse([{'text': 'no id'}], {}, [], {})] + pages[2:]
+        parsed = []
+        with pytest.raises(Exception):
+            PagePipeline(iter(broken), lambda page: submit_tweet_page(pool, page, has_refs=False),
+                         lambda page, rows: parsed.append(rows), queue_size=pool.queue_size()).run()
+        assert parsed == expected[:1]
+
+    # a pool shared by the queries of a search
+    with ParsePool(2) as pool:
+        search(tmp_path, SearchClient(last=9), parse_pool=pool)
+    assert stored_ids(tmp_path) == list(range(100))
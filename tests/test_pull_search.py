@@ -0,0 +1,45 @@
+from datetime import datetime
+
+import pytest
+
+from pull_twitter_api.utils.pull_search import _shard_budgets
+from pull_twitter_api.utils.tweet_search import TweetSearch
+
+
+def bucket(day: int, tweet_count: int) -> dict:
+    return {'start': f"2021-03-{day:02d}T00:00:00.000Z", 'end': f"2021-03-{day + 1:02d}T00:00:00.000Z",
+            'tweet_count': tweet_count}
+
+
+@pytest.mark.parametrize('max_response, counts, budgets', [
+    (100, [100, 100], [50, 50]),
+    (100, [900, 100], [90, 10]),
+    (1000, [30, 10], [750, 250]),
+    (100, [1, 1, 1], [34, 33, 33]),
+    (10, [5, 0, 5], [5, 0, 5]),
+    (100, [0, 0], [50, 50]),
+    (100, [None, None, None, None], [25, 25, 25, 25]),
+    (100, [60, None], [50, 50]),
+])
+def test_shard_budgets_follow_the_tweet_counts(max_response, counts, budgets):
+    assert _shard_budgets(max_response, counts) == budgets
+
+
+@pytest.mark.parametrize('max_response', [1, 7, 99, 100, 12345])
+def test_shard_budgets_add_up_to_max_response(max_response):
+    assert sum(_shard_budgets(max_response, [13, 0, 7, 29, 1])) == max_response
+
+
+def test_window_counts_sum_the_buckets_of_each_window():
+    buckets = [bucket(day, count) for day, count in zip(range(1, 7), [10, 50, 5, 5, 20, 10])]
+    start, end = datetime(2021, 3, 1), datetime(2021, 3, 7)
+
+    windows = TweetSearch.balanced_windows(buckets, start, end, num_shards=2)
+    assert windows == [(start, datetime(2021, 3, 3)), (datetime(2021, 3, 3), end)]
+    assert TweetSearch.window_counts(buckets, windows) == [60, 40]
+
+
+def test_window_counts_of_buckets_starting_before_the_first_window():
+    windows = [(datetime(2021, 3, 1, 12), datetime(2021, 3, 2)), (datetime(2021, 3, 2), datetime(2021, 3, 3))]
+
+    assert TweetSearch.window_counts([bucket(1, 7), bucket(2, 3)], windows) == [7, 3]
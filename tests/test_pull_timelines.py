@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from pull_twitter_api.utils import exceptions
+from pull_twitter_api.utils.page_stream import StreamClosed
+from pull_twitter_api.utils.pull_timelines import _pull_concurrently
+
+
+class Pulls:
+    """
+    pull_ident recording the users pulled, raising error on the user numbered fail
+    """
+
+    def __init__(self, fail: int = None, error: BaseException = None):
+        self.fail = fail
+        self.error = error
+        self.started = []
+        self.finished = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, ix, ident):
+        with self._lock:
+            self.started.append(ident)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(0.01)
+            if ix == self.fail:
+                raise self.error
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        self.finished.append(ident)
+
+
+def worker_threads() -> list:
+    return [thread for thread in threading.enumerate() if thread.name.startswith('ThreadPoolExecutor')]
+
+
+def test_every_user_is_pulled_once_with_max_workers_in_flight():
+    pulls = Pulls()
+
+    _pull_concurrently(pulls, list(range(20)), max_workers=4)
+    assert sorted(pulls.finished) == list(range(20))
+    assert pulls.max_in_flight == 4
+    assert worker_threads() == []
+
+
+@pytest.mark.parametrize('error', [exceptions.CircuitOpen('timeline'), StreamClosed()])
+def test_users_left_are_not_pulled_once_a_pull_stops_the_run(error):
+    pulls = Pulls(fail=5, error=error)
+
+    with pytest.raises(type(error)):
+        _pull_concurrently(pulls, list(range(100)), max_workers=3)
+    # users are only submitted once a worker is free, so at most a few are started after the failed one
+    assert 5 in pulls.started
+    assert len(pulls.started) <= 5 + 1 + 3
+    assert worker_threads() == []
@@ -0,0 +1,167 @@
+import json
+
+import pandas as pd
+
+from pull_twitter_api.utils.pull_twitter_response import CHECKPOINT_FILE, KeyedRows, MemoryBudget, SearchResponse
+from pull_twitter_api.utils.table_writer import read_table
+
+
+def tweets(*ids, text='tweet'):
+    return [{'id': str(tweet_id), 'text': f"{text} {tweet_id}"} for tweet_id in ids]
+
+
+def test_keyed_rows_drop_rows_seen_on_earlier_pages():
+    rows = KeyedRows(('id',))
+
+    assert rows.add(tweets(1, 2, 3)) == 3
+    assert rows.add(tweets(3, 4, text='again')) == 1
+    assert rows.add(tweets(1, 2, 3, 4)) == 0
+    assert rows.add(None) == 0
+
+    assert len(rows) == 4
+    # the first row pulled for a key is kept
+    assert list(rows.to_df()['text']) == ['tweet 1', 'tweet 2', 'tweet 3', 'again 4']
+
+
+def test_keyed_rows_dedup_within_a_page():
+    rows = KeyedRows(('id',))
+
+    assert rows.add(tweets(1, 1, 2)) == 2
+    assert list(rows.to_df()['id']) == ['1', '2']
+
+
+def test_keyed_rows_compound_keys():
+    rows = KeyedRows(('parent_id', 'id', 'type'))
+    links = [{'parent_id': 1, 'id': 2, 'type': 'quoted'}, {'parent_id': 1, 'id': 2, 'type': 'replied_to'},
+             {'parent_id': 3, 'id': 2, 'type': 'quoted'}]
+
+    assert rows.add(links) == 3
+    assert rows.add(links[:1] + [{'parent_id': 1, 'id': 3, 'type': 'quoted'}]) == 1
+    assert len(rows) == 4
+
+
+def test_keyed_rows_without_key_columns_dedup_on_the_whole_row():
+    rows = KeyedRows(('id',))
+
+    assert rows.add([{'text': 'a'}, {'text': 'b'}]) == 2
+    assert rows.add([{'text': 'a'}, {'text': 'a', 'lang': 'en'}]) == 1
+    assert len(rows) == 3
+
+
+def test_keyed_rows_cache_the_dataframe_until_new_rows_arrive():
+    rows = KeyedRows(('id',))
+    assert rows.to_df() is None
+
+    rows.add(tweets(1, 2))
+    df = rows.to_df()
+    assert rows.to_df() is df
+
+    rows.add(tweets(2))
+    assert rows.to_df() is df
+
+    rows.add(tweets(3))
+    assert rows.to_df() is not df
+    assert len(rows.to_df()) == 3
+
+
+def test_keyed_rows_keep_deduplicating_once_spilled():
+    budget = MemoryBudget(limit=1)
+    rows = KeyedRows(('id',), budget=budget, table='tweets')
+
+    rows.add(tweets(1, 2))
+    rows.add(tweets(2, 3))
+    assert rows.rows == []
+    assert budget.used == 0
+
+    assert rows.add(tweets(1, 3, 4)) == 1
+    assert len(rows) == 4
+    assert [len(df) for df in rows.iter_dfs()] == [2, 1, 1]
+    pd.testing.assert_frame_equal(rows.to_df(), pd.DataFrame(tweets(1, 2, 3, 4)))
+
+
+def test_response_holds_each_tweet_once_across_pages():
+    response = SearchResponse(auto_save=False)
+
+    response.update_data(new_tweets=tweets(1, 2), new_users=[{'id': '10'}])
+    response.update_data(new_tweets=tweets(2, 3), new_users=[{'id': '10'}, {'id': '11'}])
+
+    assert list(response.df_tweets['id']) == ['1', '2', '3']
+    assert list(response.df_users['id']) == ['10', '11']
+    assert response.df_media is None
+
+
+def auto_saved(tmp_path, save_format='csv', flush_rows=1000):
+    # resuming into tmp_path writes there directly, without the config files of a new run
+    return SearchResponse(auto_save=True, save_format=save_format, resume_dir=str(tmp_path), flush_rows=flush_rows)
+
+
+def checkpoint(tmp_path) -> dict:
+    path = tmp_path / CHECKPOINT_FILE
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def stored_ids(tmp_path, save_format='csv') -> list:
+    path = tmp_path / f"data_tweets.{save_format}"
+    return [str(tweet_id) for tweet_id in read_table(str(path), columns=['id'])['id']] if path.exists() else []
+
+
+def test_cursor_is_committed_once_its_rows_are_flushed(tmp_path):
+    response = auto_saved(tmp_path)
+
+    response.set_cursor('query', 'token 1', pages=1)
+    response.update_data(new_tweets=tweets(1, 2))
+    # the rows are only buffered, so the cursor past them must not be on disk either
+    assert checkpoint(tmp_path) == {}
+
+    response.flush()
+    assert stored_ids(tmp_path) == ['1', '2']
+    assert checkpoint(tmp_path)['query'] == {'next_token': 'token 1', 'pages': 1, 'done': False}
+
+    response.set_cursor('query', None, pages=2, done=True)
+    response.update_data(new_tweets=tweets(3))
+    assert checkpoint(tmp_path)['query']['next_token'] == 'token 1'
+
+    response.close()
+    assert stored_ids(tmp_path) == ['1', '2', '3']
+    assert checkpoint(tmp_path)['query'] == {'next_token': None, 'pages': 2, 'done': True}
+
+
+def test_cursor_is_committed_with_the_flush_its_page_triggers(tmp_path):
+    response = auto_saved(tmp_path, flush_rows=3)
+
+    response.set_cursor('query', 'token 1', pages=1)
+    response.update_data(new_tweets=tweets(1, 2))
+    assert checkpoint(tmp_path) == {}
+
+    # the writers flush once 3 rows are buffered, writing the rows of both pages
+    response.set_cursor('query', 'token 2', pages=2)
+    response.update_data(new_tweets=tweets(3, 4))
+    assert stored_ids(tmp_path) == ['1', '2', '3', '4']
+    assert checkpoint(tmp_path)['query']['next_token'] == 'token 2'
+    response.close()
+
+
+def test_parquet_cursors_wait_for_the_file_to_be_closed(tmp_path):
+    response = auto_saved(tmp_path, save_format='parquet')
+
+    response.set_cursor('query', 'token 1', pages=1)
+    response.update_data(new_tweets=tweets(1, 2))
+    # flushed row groups can not be read back before the footer is written
+    response.flush()
+    assert checkpoint(tmp_path) == {}
+
+    response.close()
+    assert stored_ids(tmp_path, 'parquet') == ['1', '2']
+    assert checkpoint(tmp_path)['query']['next_token'] == 'token 1'
+
+
+def test_cursors_of_responses_saved_at_the_end_are_committed_by_save(tmp_path):
+    response = SearchResponse(auto_save=False, resume_dir=str(tmp_path))
+
+    response.update_data(new_tweets=tweets(1, 2))
+    response.set_cursor('query', None, pages=1, done=True)
+    assert checkpoint(tmp_path) == {}
+
+    response.save()
+    assert stored_ids(tmp_path) == ['1', '2']
+    assert checkpoint(tmp_path)['query']['done']
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from pull_twitter_api.utils.rate_limit import endpoint_family, RateLimiter, TokenBucket, MIN_INTERVALS
+
+
+@pytest.mark.parametrize('url, family', [
+    ('https://api.twitter.com/2/users/12/tweets', 'timeline'),
+    ('https://api.twitter.com/2/users/by/username/jack', 'user'),
+    ('https://api.twitter.com/2/users/by?usernames=jack', 'users'),
+    ('https://api.twitter.com/2/users?ids=12', 'users'),
+    ('https://api.twitter.com/2/tweets/search/all?query=x', 'search'),
+    ('https://api.twitter.com/2/tweets/counts/all?query=x', 'counts'),
+    ('https://api.twitter.com/2/tweets?ids=1,2', 'lookup'),
+    ('https://api.twitter.com/2/spaces', None),
+])
+def test_endpoint_family(url, family):
+    assert endpoint_family(url) == family
+
+
+def test_bucket_spends_capacity_then_refills_over_the_window(clock):
+    bucket = TokenBucket(capacity=2, window=10.)
+
+    assert bucket.acquire() == 0.
+    assert bucket.acquire() == 0.
+    # the bucket is empty, a token comes back every window / capacity seconds
+    assert bucket.acquire() == pytest.approx(5.)
+    assert bucket.waited == pytest.approx(5.)
+
+
+def test_bucket_waits_for_the_reset_of_the_headers(clock):
+    bucket = TokenBucket(capacity=300)
+    bucket.update(remaining=0, reset=clock.now + 42, limit=450)
+
+    assert bucket.acquire() == pytest.approx(42.)
+    # the window reset restores the limit from the headers, minus the request just made
+    assert bucket.tokens == 449
+    assert bucket.reset_at is None
+
+
+def test_bucket_spends_remaining_budget_of_the_headers_at_full_speed(clock):
+    bucket = TokenBucket(capacity=300)
+    bucket.update(remaining=2, reset=clock.now + 600)
+
+    assert bucket.acquire() == 0.
+    assert bucket.acquire() == 0.
+    assert bucket.acquire() == pytest.approx(600.)
+
+
+def test_bucket_does_not_refill_from_elapsed_time_once_headers_are_known(clock):
+    bucket = TokenBucket(capacity=10, window=10.)
+    bucket.update(remaining=0, reset=clock.now + 100)
+
+    clock.sleep(50)
+    assert bucket.acquire() == pytest.approx(50.)
+
+
+def test_limiter_updates_the_bucket_of_the_response_endpoint(clock):
+    limiter = RateLimiter()
+    limiter.update('https://api.twitter.com/2/users/12/tweets',
+                   {'x-rate-limit-limit': '900', 'x-rate-limit-remaining': '0',
+                    'x-rate-limit-reset': str(int(clock.now) + 30)})
+
+    assert limiter.buckets['timeline'].capacity == 900
+    assert limiter.acquire('timeline') == pytest.approx(30.)
+    # other endpoints are unaffected
+    assert limiter.acquire('user') == 0.
+
+
+def test_limiter_ignores_responses_without_rate_limit_headers(clock):
+    limiter = RateLimiter()
+    limiter.update('https://api.twitter.com/2/users/12/tweets', {'x-rate-limit-remaining': '0'})
+    limiter.update('https://api.twitter.com/2/spaces', {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': '0'})
+
+    assert limiter.buckets['timeline'].reset_at is None
+    assert limiter.acquire('timeline') == 0.
+
+
+@pytest.mark.parametrize('endpoint', sorted(MIN_INTERVALS))
+def test_limiter_spaces_requests_by_the_min_interval_of_the_family(clock, endpoint):
+    limiter = RateLimiter()
+
+    assert limiter.acquire(endpoint) == 0.
+    assert limiter.acquire(endpoint) == pytest.approx(MIN_INTERVALS[endpoint])
+    clock.sleep(MIN_INTERVALS[endpoint])
+    assert limiter.acquire(endpoint) == 0.
+
+
+def test_limiter_does_not_space_requests_of_families_without_min_interval(clock):
+    limiter = RateLimiter()
+
+    assert [limiter.acquire('timeline') for _ in range(5)] == [0.] * 5
+
+
+def test_limiter_min_intervals_can_be_overridden(clock):
+    limiter = RateLimiter(min_intervals={'search': 0.})
+
+    assert [limiter.acquire('search') for _ in range(3)] == [0.] * 3
+    assert limiter.buckets['lookup'].min_interval == MIN_INTERVALS['lookup']
+
+
+def test_limiter_sums_waits_per_endpoint(clock):
+    limiter = RateLimiter()
+    for _ in range(3):
+        limiter.acquire('search')
+
+    assert limiter.waited()['search'] == pytest.approx(2 * MIN_INTERVALS['search'])
+    assert limiter.waited()['timeline'] == 0.
+
+
+def test_acquire_async_waits_like_acquire(clock):
+    limiter = RateLimiter()
+    limiter.update('https://api.twitter.com/2/tweets?ids=1',
+                   {'x-rate-limit-remaining': '0', 'x-rate-limit-reset': str(int(clock.now) + 15)})
+
+    assert asyncio.run(limiter.acquire_async('lookup')) == pytest.approx(15.)
+    assert clock.sleeps == [pytest.approx(15.)]
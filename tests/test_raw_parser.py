@@ -0,0 +1,92 @@
+from enum import Enum
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+from pull_twitter_api.utils import raw_parser
+from pull_twitter_api.utils.page_parser import parse_tweet_page
+from pull_twitter_api.utils.raw_parser import ModelFlattener, RawResponse
+
+
+@pytest.fixture(autouse=True)
+def new_flatteners(monkeypatch):
+    # the verdicts of the flatteners are kept for the whole process
+    monkeypatch.setattr(raw_parser, '_flatteners', {})
+
+
+def sparse_page() -> RawResponse:
+    # the optional fields are missing from the first records
+    tweets = [
+        {'id': '1', 'text': 'sparse'},
+        {'id': '2', 'text': 'full', 'author_id': '10', 'created_at': '2021-08-19T00:00:00.000Z', 'lang': 'en',
+         'reply_settings': 'following', 'possibly_sensitive': False, 'conversation_id': '2',
+         'public_metrics': {'retweet_count': 1, 'reply_count': 0, 'like_count': 3, 'quote_count': 0},
+         'referenced_tweets': [{'type': 'quoted', 'id': '1'}], 'entities': {'hashtags': [{'tag': 'x'}]}},
+        {'id': '3', 'text': 'partial', 'lang': 'und', 'reply_settings': 'everyone'},
+    ]
+    includes = {
+        'users': [{'id': '10', 'name': 'a', 'username': 'a'},
+                  {'id': '11', 'name': 'b', 'username': 'b', 'pinned_tweet_id': '2', 'verified': True,
+                   'created_at': '2010-01-01T00:00:00.000Z',
+                   'public_metrics': {'followers_count': 5, 'following_count': 2, 'tweet_count': 9,
+                                      'listed_count': 0}}],
+        'tweets': [{'id': '4', 'text': 'referenced'}, {'id': '5', 'text': 'referenced', 'lang': 'fr'}],
+        'media': [{'media_key': '3_1', 'type': 'photo'}, {'media_key': '3_2', 'type': 'video', 'width': 640}],
+    }
+    return RawResponse(tweets, includes, [], {'result_count': 3})
+
+
+def typed(parsed: dict) -> dict:
+    # strings and str enums compare equal, the outputs must hold the same types too
+    return {table: rows and [{column: (type(value), value) for column, value in row.items()} for row in rows]
+            for table, rows in parsed.items()}
+
+
+def test_fast_parsing_matches_twitteralchemy_on_sparse_pages():
+    page = sparse_page()
+
+    fast = parse_tweet_page(page, has_refs=True, fast=True)
+    assert typed(fast) == typed(parse_tweet_page(page, has_refs=True, fast=False))
+    # a second page is flattened from the verified columns
+    assert typed(parse_tweet_page(page, has_refs=True, fast=True)) == typed(fast)
+
+
+class Setting(Enum):
+    everyone = 'everyone'
+    following = 'following'
+
+
+class Note(BaseModel):
+    id: int
+    note: Optional[str]
+    setting: Optional[Setting]
+    score: Optional[float]
+
+    def to_full_dict(self) -> dict:
+        row = self.dict()
+        if self.note is not None:
+            row['note'] = self.note.upper()
+        return row
+
+
+def test_records_with_new_columns_are_verified():
+    flattener = ModelFlattener(Note)
+
+    rows = flattener.flatten([{'id': '1'}, {'id': '2', 'setting': 'following', 'score': 1}])
+    assert rows == [{'id': 1, 'note': None, 'setting': None, 'score': None},
+                    {'id': 2, 'note': None, 'setting': Setting.following, 'score': 1.}]
+    assert type(rows[1]['score']) is float
+    assert flattener.enabled
+
+    # the first record holding a note is flattened differently, the whole page goes through the model
+    records = [{'id': '3', 'setting': 'everyone'}, {'id': '4', 'note': 'x'}]
+    assert flattener.flatten(records) == [Note(**record).to_full_dict() for record in records]
+    assert not flattener.enabled
+
+
+def test_fast_parsing_raises_like_the_model():
+    flattener = ModelFlattener(Note)
+
+    with pytest.raises(ValueError):
+        flattener.flatten([{'id': '1', 'setting': 'nobody'}])
@@ -0,0 +1,282 @@
+import asyncio
+from email.utils import format_datetime
+from datetime import datetime, timezone
+
+import pytest
+import requests
+import tweepy.errors
+
+from pull_twitter_api.utils import exceptions, retry
+from pull_twitter_api.utils.rate_limit import RateLimiter
+from pull_twitter_api.utils.retry import CircuitBreaker, RetryPolicy, RetryableResponse, retry_request, \
+    retry_request_async
+
+
+def make_response(status: int, headers: dict = None) -> requests.Response:
+    response = requests.Response()
+    response.status_code = status
+    response.reason = 'Error'
+    response.headers.update(headers or {})
+    response._content = b'{}'
+    response.url = 'https://api.twitter.com/2/users/12/tweets'
+    return response
+
+
+def server_error(headers: dict = None) -> tweepy.errors.TwitterServerError:
+    return tweepy.errors.TwitterServerError(make_response(503, headers))
+
+
+def rate_limited(headers: dict = None) -> tweepy.errors.TooManyRequests:
+    return tweepy.errors.TooManyRequests(make_response(429, headers))
+
+
+class Flaky:
+    """
+    Request raising the given errors in turn, then returning 'ok'
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+@pytest.fixture
+def no_jitter(monkeypatch):
+    # the random half of the backoff is always at its maximum
+    monkeypatch.setattr(retry.random, 'uniform', lambda low, high: high)
+
+
+@pytest.fixture
+def limiter(clock):
+    return RateLimiter(retry_policy=RetryPolicy(max_retries=4, backoff_base=1., backoff_max=5.))
+
+
+def test_backoff_doubles_up_to_the_maximum(no_jitter):
+    policy = RetryPolicy(backoff_base=1., backoff_max=5.)
+
+    assert [policy.backoff(attempt) for attempt in range(1, 6)] == [1., 2., 4., 5., 5.]
+
+
+@pytest.mark.parametrize('attempt', [1, 2, 3, 8])
+def test_backoff_jitter_stays_within_the_upper_half(attempt):
+    policy = RetryPolicy(backoff_base=1., backoff_max=60.)
+    delay = min(60., 2. ** (attempt - 1))
+
+    delays = [policy.backoff(attempt) for _ in range(200)]
+    assert all(delay / 2 <= wait <= delay for wait in delays)
+    assert len(set(delays)) > 1
+
+
+def test_wait_honours_retry_after_seconds(no_jitter):
+    policy = RetryPolicy(backoff_base=1.)
+
+    assert policy.wait(1, 503, {'retry-after': '30'}) == 30.
+    # the backoff wins once it is longer
+    assert policy.wait(1, 503, {'retry-after': '0'}) == 1.
+
+
+def test_wait_honours_retry_after_dates(clock, no_jitter):
+    policy = RetryPolicy(backoff_base=1.)
+    date = format_datetime(datetime.fromtimestamp(clock.now + 120, tz=timezone.utc), usegmt=True)
+
+    assert policy.wait(1, 503, {'retry-after': date}) == pytest.approx(120.)
+
+
+def test_wait_on_rate_limit_errors(clock):
+    policy = RetryPolicy(rate_limit_wait=60.)
+
+    assert policy.wait(1, 429, {'x-rate-limit-reset': str(int(clock.now) + 10)}) == pytest.approx(11.)
+    assert policy.wait(1, 429, {'retry-after': '7'}) == 7.
+    assert policy.wait(1, 429, {}) == 60.
+
+
+def test_retry_request_retries_until_success(limiter, clock, no_jitter):
+    request = Flaky(server_error(), requests.exceptions.ConnectionError(), server_error())
+
+    assert retry_request(request, 'timeline', limiter) == 'ok'
+    assert request.calls == 4
+    assert limiter.buckets['timeline'].waited == 0.
+    assert clock.sleeps == [1., 2., 4.]
+    assert limiter.breakers['timeline'].failures == 0
+
+
+def test_retry_request_honours_retry_after(limiter, clock, no_jitter):
+    request = Flaky(server_error({'retry-after': '30'}))
+
+    assert retry_request(request, 'timeline', limiter) == 'ok'
+    assert clock.sleeps == [30.]
+
+
+def test_retry_request_waits_for_the_rate_limit_reset(limiter, clock):
+    request = Flaky(rate_limited({'x-rate-limit-reset': str(int(clock.now) + 20)}))
+
+    assert retry_request(request, 'timeline', limiter) == 'ok'
+    assert clock.sleeps == [pytest.approx(21.)]
+
+
+def test_retry_request_raises_max_retries_after_the_limit(limiter, clock, no_jitter):
+    request = Flaky(*[server_error() for _ in range(10)])
+
+    with pytest.raises(exceptions.MaxRetries) as raised:
+        retry_request(request, 'timeline', limiter)
+    assert request.calls == 4
+    assert isinstance(raised.value.__cause__, tweepy.errors.TwitterServerError)
+    # no wait after the last attempt
+    assert clock.sleeps == [1., 2., 4.]
+
+    request = Flaky(*[server_error() for _ in range(10)])
+    with pytest.raises(exceptions.MaxRetries):
+        retry_request(request, 'timeline', limiter, max_retries=2)
+    assert request.calls == 2
+
+
+def test_retry_request_does_not_retry_other_errors(limiter):
+    request = Flaky(tweepy.errors.BadRequest(make_response(400)))
+
+    with pytest.raises(tweepy.errors.BadRequest):
+        retry_request(request, 'timeline', limiter)
+    assert request.calls == 1
+    assert limiter.breakers['timeline'].failures == 0
+
+
+def test_breaker_opens_at_the_threshold(clock):
+    breaker = CircuitBreaker('timeline', threshold=3, cooldown=60.)
+    for _ in range(2):
+        breaker.failure()
+    breaker.before_request()
+
+    breaker.failure()
+    with pytest.raises(exceptions.CircuitOpen):
+        breaker.before_request()
+
+
+def test_breaker_half_opens_after_the_cooldown(clock):
+    breaker = CircuitBreaker('timeline', threshold=1, cooldown=60.)
+    breaker.failure()
+
+    clock.sleep(59)
+    with pytest.raises(exceptions.CircuitOpen):
+        breaker.before_request()
+
+    clock.sleep(1)
+    # a single trial request is let through
+    breaker.before_request()
+    with pytest.raises(exceptions.CircuitOpen):
+        breaker.before_request()
+
+    # a failed trial opens the circuit for another cooldown
+    breaker.failure()
+    clock.sleep(30)
+    with pytest.raises(exceptions.CircuitOpen):
+        breaker.before_request()
+
+    # a successful trial closes it
+    clock.sleep(30)
+    breaker.before_request()
+    breaker.success()
+    breaker.before_request()
+    breaker.before_request()
+
+
+def test_open_circuit_stops_requests_without_making_them(limiter, no_jitter):
+    limiter.breakers['timeline'] = CircuitBreaker('timeline', threshold=6, cooldown=600.)
+
+    with pytest.raises(exceptions.MaxRetries):
+        retry_request(Flaky(*[server_error() for _ in range(4)]), 'timeline', limiter)
+
+    request = Flaky(*[server_error() for _ in range(4)])
+    with pytest.raises(exceptions.CircuitOpen):
+        retry_request(request, 'timeline', limiter)
+    assert request.calls == 2
+
+    request = Flaky()
+    with pytest.raises(exceptions.CircuitOpen):
+        retry_request(request, 'timeline', limiter)
+    assert request.calls == 0
+
+
+def test_rate_limited_trial_lets_the_next_trial_through(limiter, clock):
+    breaker = limiter.breakers['timeline'] = CircuitBreaker('timeline', threshold=1, cooldown=60.)
+    breaker.failure()
+    clock.sleep(60)
+
+    request = Flaky(rate_limited({'retry-after': '0'}))
+    assert retry_request(request, 'timeline', limiter) == 'ok'
+    assert request.calls == 2
+    assert breaker.opened_at is None
+    assert retry_request(Flaky(), 'timeline', limiter) == 'ok'
+
+
+def test_interrupted_trial_lets_the_next_trial_through(limiter, clock):
+    breaker = limiter.breakers['timeline'] = CircuitBreaker('timeline', threshold=1, cooldown=60.)
+    breaker.failure()
+    clock.sleep(60)
+
+    with pytest.raises(KeyboardInterrupt):
+        retry_request(Flaky(KeyboardInterrupt()), 'timeline', limiter)
+    # the circuit stays open until a trial succeeds
+    assert breaker.opened_at is not None
+    assert retry_request(Flaky(), 'timeline', limiter) == 'ok'
+    assert breaker.opened_at is None
+
+
+def test_cancelled_async_trial_lets_the_next_trial_through(limiter, clock):
+    breaker = limiter.breakers['timeline'] = CircuitBreaker('timeline', threshold=1, cooldown=60.)
+    breaker.failure()
+    clock.sleep(60)
+
+    async def cancelled():
+        raise asyncio.CancelledError()
+
+    async def ok():
+        return 'ok'
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(retry_request_async(cancelled, 'timeline', limiter))
+    assert asyncio.run(retry_request_async(ok, 'timeline', limiter)) == 'ok'
+
+
+def test_rate_limit_errors_do_not_count_towards_the_breaker(limiter, clock):
+    limiter.breakers['timeline'] = CircuitBreaker('timeline', threshold=2)
+    request = Flaky(*[rate_limited({'retry-after': '1'}) for _ in range(3)])
+
+    assert retry_request(request, 'timeline', limiter) == 'ok'
+    assert limiter.breakers['timeline'].failures == 0
+
+
+def test_retry_request_async_retries_retryable_responses(limiter, clock, no_jitter):
+    errors = [RetryableResponse('Service Unavailable', 503), RetryableResponse('Service Unavailable', 503,
+                                                                                   {'retry-after': '9'})]
+
+    async def request():
+        if errors:
+            raise errors.pop(0)
+        return 'ok'
+
+    assert asyncio.run(retry_request_async(request, 'timeline', limiter)) == 'ok'
+    assert clock.sleeps == [1., 9.]
+
+
+def test_rate_limit_errors_do_not_use_up_the_attempts(limiter, clock, no_jitter):
+    errors = [rate_limited({'retry-after': '10'}) for _ in range(8)]
+    request = Flaky(server_error(), *errors, server_error(), server_error())
+
+    assert retry_request(request, 'timeline', limiter) == 'ok'
+    assert request.calls == 12
+    # the backoff keeps counting the failed attempts only
+    assert clock.sleeps == [1.] + [10.] * 8 + [2., 4.]
+
+
+def test_rate_limit_errors_have_their_own_limit(clock):
+    limiter = RateLimiter(retry_policy=RetryPolicy(max_retries=2, max_rate_limit_retries=6))
+    request = Flaky(*[rate_limited({'retry-after': '1'}) for _ in range(10)])
+
+    with pytest.raises(exceptions.MaxRetries, match='6 attempts to call the timeline endpoint rate limited'):
+        retry_request(request, 'timeline', limiter)
+    assert request.calls == 6
@@ -0,0 +1,78 @@
+import threading
+
+import numpy as np
+
+from pull_twitter_api.utils import seen_ids
+from pull_twitter_api.utils.seen_ids import SeenIds
+
+
+def stored(directory, table='tweets') -> list:
+    return np.load(f"{directory}/{table}.npy").tolist()
+
+
+def test_saved_ids_are_merged_into_the_sorted_index(tmp_path, monkeypatch):
+    # several chunks of the stored ids are merged
+    monkeypatch.setattr(seen_ids, 'MERGE_CHUNK', 3)
+    index = SeenIds(str(tmp_path))
+    index.add('tweets', [50, 10, 30, 70, 90, 20, 40])
+    index.save()
+    assert stored(tmp_path) == [10, 20, 30, 40, 50, 70, 90]
+
+    index = SeenIds(str(tmp_path))
+    index.add('tweets', [5, 30, 60, 95, 60, 45])
+    index.add('users', [3, 1])
+    assert index.contains('tweets', [30, 60, 1]).tolist() == [True, True, False]
+    index.save()
+
+    assert stored(tmp_path) == [5, 10, 20, 30, 40, 45, 50, 60, 70, 90, 95]
+    assert stored(tmp_path, 'users') == [1, 3]
+    assert index.contains('tweets', [5, 95, 96]).tolist() == [True, True, False]
+    assert len(index) == 13
+
+
+def test_runs_saving_to_the_same_index_keep_each_others_ids(tmp_path):
+    first, second = SeenIds(str(tmp_path)), SeenIds(str(tmp_path))
+
+    second.add('tweets', [10, 11])
+    second.save()
+    first.add('tweets', [1, 2, 3])
+    first.save()
+
+    assert SeenIds(str(tmp_path)).contains('tweets', [1, 2, 3, 10, 11]).all()
+    # the ids of the other run are known once the index is re-read by save
+    assert first.contains('tweets', [10, 11]).all()
+
+
+def test_concurrent_saves_keep_every_id(tmp_path):
+    indexes = [SeenIds(str(tmp_path)) for _ in range(8)]
+    for i, index in enumerate(indexes):
+        index.add('tweets', range(i * 1000, (i + 1) * 1000))
+    start = threading.Barrier(len(indexes))
+
+    def save(index):
+        start.wait()
+        index.save()
+
+    threads = [threading.Thread(target=save, args=(index,)) for index in indexes]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert stored(tmp_path) == list(range(8000))
+
+
+def test_mark_mode_flags_rows_seen_by_earlier_runs(tmp_path):
+    earlier = SeenIds(str(tmp_path))
+    earlier.add('tweets', [1, 2])
+    earlier.save()
+
+    index = SeenIds(str(tmp_path), mode='mark')
+    rows = [{'id': '2'}, {'id': '3'}]
+    index.mark('tweets', rows)
+    assert [row['seen_before'] for row in rows] == [True, False]
+
+    index.add('tweets', [3])
+    rows = [{'id': '3'}]
+    index.mark('tweets', rows)
+    assert rows == [{'id': '3', 'seen_before': True}]
@@ -0,0 +1,70 @@
+import os
+
+from pull_twitter_api.utils.table_writer import open_table_writer, read_table, table_files
+
+
+def write_table(path, save_format, rows, close=True, **kwargs):
+    writer = open_table_writer(path, save_format, append=True, **kwargs)
+    writer.write(rows)
+    writer.flush()
+    if close:
+        writer.close()
+    return writer
+
+
+def test_resumed_parquet_tables_are_written_to_part_files(tmp_path):
+    path = str(tmp_path / 'data_tweets.parquet')
+
+    write_table(path, 'parquet', [{'id': 1, 'entities': {'urls': []}}])
+    write_table(path, 'parquet', [{'id': 2, 'entities': None}, {'id': 3, 'entities': {'urls': ['x']}}])
+
+    assert table_files(path) == [path, str(tmp_path / 'data_tweets.part-1.parquet')]
+    df = read_table(path)
+    assert list(df['id']) == [1, 2, 3]
+    assert list(df['entities']) == ['{"urls": []}', None, '{"urls": ["x"]}']
+
+
+def test_incomplete_parquet_files_are_moved_aside_on_resume(tmp_path):
+    path = str(tmp_path / 'data_tweets.parquet')
+    write_table(path, 'parquet', [{'id': 1}])
+
+    # a run killed before closing its part leaves it without a footer
+    crashed_writer = write_table(path, 'parquet', [{'id': 2}], row_group_size=1, close=False)
+    crashed = table_files(path)[-1]
+    with open(crashed, 'rb+') as f:
+        f.truncate(os.path.getsize(crashed) - 8)
+
+    write_table(path, 'parquet', [{'id': 3}])
+
+    assert os.path.isfile(f"{crashed}.corrupt")
+    assert list(read_table(path)['id']) == [1, 3]
+    del crashed_writer
+
+
+def test_csv_columns_first_seen_in_later_batches_are_kept(tmp_path):
+    path = str(tmp_path / 'data_tweets.csv')
+
+    writer = open_table_writer(path, 'csv', append=True)
+    writer.write([{'id': 1, 'text': 'a, "quoted"\nline'}])
+    writer.flush()
+    writer.write([{'id': 2, 'text': 'b', 'geo': 'x'}, {'id': 3, 'lang': 'en'}])
+    writer.flush()
+    writer.write([{'id': 4, 'text': 'd'}])
+    writer.close()
+
+    df = read_table(path)
+    assert list(df.columns) == ['id', 'text', 'geo', 'lang']
+    assert list(df['id']) == [1, 2, 3, 4]
+    assert df['text'][0] == 'a, "quoted"\nline'
+    assert list(df['geo'].fillna('')) == ['', 'x', '', '']
+    assert list(df['lang'].fillna('')) == ['', '', 'en', '']
+
+
+def test_csv_tables_appended_to_by_a_later_run_extend_the_header(tmp_path):
+    path = str(tmp_path / 'data_tweets.csv')
+    write_table(path, 'csv', [{'id': 1, 'text': 'a'}])
+    write_table(path, 'csv', [{'text': 'b', 'id': 2, 'lang': 'en'}])
+
+    df = read_table(path)
+    assert list(df.columns) == ['id', 'text', 'lang']
+    assert list(df['text']) == ['a', 'b']